@@ -152,13 +152,91 @@ CELERY_BROKER_URL = 'amqp://{}:{}@127.0.0.1:5672/'.format(
 )
 CELERY_CACHE_BACKEND = 'default'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'refresh-tokens': {
+        'task': 'refresh_tokens',
+        'schedule': 15 * 60,
+    },
+    'incremental-spending': {
+        'task': 'schedule_incremental_spending',
+        'schedule': 24 * 60 * 60,
+    },
+}
+# За сколько секунд до истечения токены обновляются заранее.
+TOKEN_REFRESH_MARGIN = 60 * 60
+
+# Общий HTTP транспорт клиентов рекламных API (core.transport.Transport):
+# pool_connections - число хостов с пулами, pool_maxsize - соединений к
+# одному хосту, таймауты в секундах.
+HTTP_TRANSPORT = {
+    'pool_connections': 10,
+    'pool_maxsize': 20,
+    'connect_timeout': 10,
+    'read_timeout': 300,
+}
+
+# Окно корректировок статистики источников в днях: более старые дни
+# считаются закрытыми и берутся из БД (dashboard.report_cache).
+STATISTIC_CORRECTION_WINDOW = {
+    'yandex_direct': 3,
+    'vk_ads': 3,
+    'my_target': 3,
+}
+
+# Сколько секунд ждать сбора данных кабинета: мягкий лимит времени части
+# сбора (dashboard.tasks.dispatch_run), после него сбор источника
+# останавливается, а данные остальных кабинетов сохраняются без него.
+# Также таймаут источника в dashboard.aio_ads.collect.
+ADS_SOURCE_TIMEOUTS = {
+    'yandex_direct': 60 * 60,
+    'vk_ads': 30 * 60,
+    'my_target': 30 * 60,
+}
+# За сколько дней загружается история новых клиентов при инкрементальном
+# сборе (dashboard.tasks.collect_incremental_spending).
+SPENDING_BACKFILL_DAYS = 90
+# Сколько сохраненных клиентов источника собирает одна таска
+# collect_source_spending.
+COLLECT_CLIENTS_PER_TASK = 200
+# Через сколько секунд выполняющийся запуск сбора считается зависшим и не
+# мешает новым запускам на те же дни (dashboard.runs.start_runs).
+COLLECTION_RUN_STALE_AFTER = 6 * 60 * 60
+# Через сколько секунд продолжается запуск, части которого отложены до
+# восстановления лимитов API (баллы Яндекс директ).
+COLLECTION_POSTPONED_RETRY_DELAY = 60 * 60
+# Сколько готовых записей клиентов может ждать записи в БД, пока сбор
+# не приостанавливается (dashboard.ads.RecordStream).
+ADS_RECORDS_QUEUE_SIZE = 100
+
+# Кэш для общего состояния клиентов API между воркерами (core.store):
+# учет баллов Яндекс директ и т.п.
+API_STORE_CACHE = 'default'
 
 YANDEX_DIRECT_CLIENT_ID = os.getenv('YANDEX_DIRECT_CLIENT_ID')
 YANDEX_DIRECT_CLIENT_SECRET = os.getenv('YANDEX_DIRECT_CLIENT_SECRET')
+# Сколько офлайн-отчетов одного рекламодателя (Client-Login) стоят в
+# очереди API одновременно, лимит API - 5.
+YANDEX_DIRECT_REPORTS_CONCURRENCY = int(
+    os.getenv('YANDEX_DIRECT_REPORTS_CONCURRENCY', 5)
+)
+# Сколько отчетов всех логинов воркер опрашивает одновременно.
+YANDEX_DIRECT_REPORTS_TOTAL = int(
+    os.getenv('YANDEX_DIRECT_REPORTS_TOTAL', 200)
+)
+# Через сколько часов список клиентов агентства загружается из API заново,
+# до этого используются сохраненные клиенты.
+YANDEX_DIRECT_CLIENTS_SYNC_INTERVAL = int(
+    os.getenv('YANDEX_DIRECT_CLIENTS_SYNC_INTERVAL', 24 * 7)
+)
 
 VK_CLIENT_ID = os.getenv('VK_CLIENT_ID')
 VK_CLIENT_SECRET = os.getenv('VK_CLIENT_SECRET')
 VK_REDIRECT_URL = os.getenv('VK_REDIRECT_URL')
+# Сколько рекламных кабинетов VK собирается параллельно. 1 - кабинеты
+# собираются пачками запросов execute.
+VK_ADS_ACCOUNTS_CONCURRENCY = int(
+    os.getenv('VK_ADS_ACCOUNTS_CONCURRENCY', 1)
+)
 
 MY_TARGET_CLIENT_ID = os.getenv('MY_TARGET_CLIENT_ID')
 MY_TARGET_CLIENT_SECRET = os.getenv('MY_TARGET_CLIENT_SECRET')
@@ -0,0 +1,85 @@
+"""
+Сравнение памяти записей клиентов: прежние вложенные словари и записи
+dashboard.records со __slots__ на синтетических данных.
+
+python -m benchmarks.records_memory --clients 10000 --days 365
+"""
+import argparse
+import gc
+import tracemalloc
+from datetime import date, timedelta
+from time import perf_counter
+
+from dashboard.records import BalanceSnapshot, ClientRecord, DailyCost
+
+START = date(2022, 1, 1)
+
+
+def spent(client_id: int, day: int) -> str:
+    return f'{(client_id * 31 + day) % 100000 / 100:.2f}'
+
+
+def dict_records(clients: int, days: int):
+    """Записи в виде, который коллекторы строили до records."""
+    return [
+        {
+            'name': f'client-{client_id}',
+            'source': 'vk_ads',
+            'user_id': 1,
+            'client_id': client_id,
+            'stats': [
+                {'date': (START + timedelta(days=day)).isoformat(),
+                 'cost': float(spent(client_id, day))}
+                for day in range(days)
+            ],
+            'balance': {'amount': 0.0, 'date': START.isoformat()}
+        }
+        for client_id in range(clients)
+    ]
+
+
+def slotted_records(clients: int, days: int):
+    return [
+        ClientRecord(
+            source='vk_ads',
+            user_id=1,
+            client_id=client_id,
+            name=f'client-{client_id}',
+            balance=BalanceSnapshot(0, START),
+            stats=[
+                DailyCost.parse((START + timedelta(days=day)).isoformat(),
+                                spent(client_id, day))
+                for day in range(days)
+            ]
+        )
+        for client_id in range(clients)
+    ]
+
+
+def measure(name, build, clients, days):
+    """Время замеряется отдельно от памяти: tracemalloc искажает время."""
+    started = perf_counter()
+    build(clients, days)
+    elapsed = perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    records = build(clients, days)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = clients * days
+    print(f'{name:<8} records: {len(records):>7} time: {elapsed:7.2f} s '
+          f'memory: {size / 2 ** 20:8.1f} MiB '
+          f'({size / rows:6.1f} B/day-row)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+    measure('dict', dict_records, args.clients, args.days)
+    measure('slotted', slotted_records, args.clients, args.days)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Сравнение потокового декодера ClientCostReport с прежним разбором через
+response.text на синтетическом TSV отчете.
+
+python -m benchmarks.report_decode --rows 1000000
+"""
+import argparse
+import io
+import tracemalloc
+from datetime import date, timedelta
+from time import perf_counter
+
+from requests import Response
+
+from core.yandex.direct import ClientCostReport, Payload
+
+FIELDS = ['Date', 'Cost']
+
+
+def make_body(rows: int) -> bytes:
+    start = date(2020, 1, 1)
+    lines = (
+        f'{start + timedelta(days=i % 3650)}\t{i % 100000 / 100:.2f}\n'
+        for i in range(rows)
+    )
+    return ''.join(lines).encode('utf-8')
+
+
+def make_response(body: bytes) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return response
+
+
+def legacy_decode(response, fields):
+    """Разбор отчета до перехода на потоковый декодер."""
+    response.encoding = 'utf-8'
+    result = []
+    if response.text:
+        metrics = response.text.replace('\n', '\t').split('\t')
+        raw = {}
+        i = 0
+        for metric_id in range(0, len(metrics)):
+            if i > len(fields) - 1:
+                result.append(raw)
+                raw = {}
+                i = 0
+            current_field = fields[i]
+            raw[current_field] = metrics[metric_id]
+            i += 1
+    return {'result': result}
+
+
+def streaming_decode(response, fields):
+    payload = Payload.payload_statistic(fields=fields, params=[])
+    report = ClientCostReport(access_token='', client_login='',
+                              payload=payload)
+    return report.api_response_decode(response)
+
+
+def consume(decode, body) -> int:
+    rows = 0
+    for _ in decode(make_response(body), FIELDS)['result']:
+        rows += 1
+    return rows
+
+
+def measure(name, decode, body):
+    """Время замеряется отдельно от памяти: tracemalloc искажает время."""
+    started = perf_counter()
+    rows = consume(decode, body)
+    elapsed = perf_counter() - started
+    tracemalloc.start()
+    consume(decode, body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<10} rows: {rows:>9} time: {elapsed:7.2f} s '
+          f'peak memory: {peak / 2 ** 20:8.1f} MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    body = make_body(args.rows)
+    print(f'report size: {len(body) / 2 ** 20:.1f} MiB')
+    measure('legacy', legacy_decode, body)
+    measure('streaming', streaming_decode, body)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import json
+from functools import wraps
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Tuple, Type)
+from weakref import WeakKeyDictionary
+
+import aiohttp
+import requests
+
+
+class Response:
+    """
+    Прочитанный ответ aiohttp с интерфейсом ответа requests: проверки
+    ответов клиентов API (status_code, headers, json, raise_for_status)
+    работают с ним без изменений.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            status_code: int,
+            headers,
+            content: bytes,
+            encoding: Optional[str] = None
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding)
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def close(self) -> None:
+        """Тело уже прочитано, соединение вернулось в пул."""
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                f'{self.status_code} Error for url: {self.url}',
+                response=self
+            )
+
+
+class AsyncTransport:
+    """
+    Асинхронный HTTP транспорт клиентов рекламных API.\n
+    Аналог core.transport.Transport на aiohttp: одна сессия с пулом
+    соединений на цикл событий, таймауты соединения и чтения, сжатие
+    ответов gzip. Тело ответа читается целиком, соединение сразу
+    возвращается в пул.\n
+    async with AsyncTransport(limit=100) as transport:\n
+        response = await transport.post(url, data=...)
+    """
+    LIMIT = 100
+    LIMIT_PER_HOST = 10
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 120
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+    def __init__(
+            self,
+            limit: int = LIMIT,
+            limit_per_host: int = LIMIT_PER_HOST,
+            connect_timeout: float = CONNECT_TIMEOUT,
+            read_timeout: float = READ_TIMEOUT
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Сессия создается при первом запросе внутри цикла событий."""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={'Accept-Encoding': self.ACCEPT_ENCODING}
+            )
+        return self.session
+
+    @staticmethod
+    def encode_params(params: Optional[Dict]) -> Optional[List[Tuple]]:
+        """
+        Параметры запроса как в requests: список - повторяющийся ключ,
+        None пропускается.
+        """
+        if params is None:
+            return None
+        pairs = []
+        for key, value in params.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            pairs += [(key, str(item)) for item in values
+                      if item is not None]
+        return pairs
+
+    async def request(self, method: str, url: str, **kwargs) -> Response:
+        """Отправка http запроса, тело ответа читается целиком."""
+        if 'params' in kwargs:
+            kwargs['params'] = self.encode_params(kwargs['params'])
+        session = self.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            content = await response.read()
+            return Response(str(response.url), response.status,
+                            response.headers, content,
+                            response.get_encoding() if content else None)
+
+    async def get(self, url: str, **kwargs) -> Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, data=None, **kwargs) -> Response:
+        return await self.request('POST', url, data=data, **kwargs)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> 'AsyncTransport':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+_default_transports: Dict[asyncio.AbstractEventLoop, AsyncTransport] = (
+    WeakKeyDictionary())
+
+
+def default_async_transport() -> AsyncTransport:
+    """
+    Общий транспорт текущего цикла событий: сессия aiohttp привязана к
+    циклу, в котором создана.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _default_transports:
+        _default_transports[loop] = AsyncTransport()
+    return _default_transports[loop]
+
+
+async def close_default_async_transport() -> None:
+    """Закрывает общий транспорт текущего цикла событий."""
+    transport = _default_transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.close()
+
+
+async def bounded_gather(
+        func: Callable[[Any], Awaitable[Any]],
+        items: Iterable[Any],
+        max_workers: int
+) -> List[Any]:
+    """
+    Аналог core.concurrency.bounded_map для корутин: одновременно
+    выполняется не более max_workers вызовов, результаты в порядке items.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+def with_retry(
+        func: Callable[..., Awaitable[Any]],
+        attempts: int,
+        retry_on: Tuple[Type[Exception], ...] = (Exception,),
+        delay: float = 0
+) -> Callable[..., Awaitable[Any]]:
+    """
+    Аналог core.concurrency.with_retry для корутин: пауза между повторами
+    не блокирует цикл событий.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        for attempt in range(1, attempts + 1):
+            try:
+                return await func(*args, **kwargs)
+            except retry_on:
+                if attempt == attempts:
+                    raise
+                await asyncio.sleep(delay)
+    return wrapper
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.core.cache import caches
+
+        from .store import FallbackStore, set_default_store
+        from .transport import Transport, set_default_transport
+
+        set_default_transport(Transport(**settings.HTTP_TRANSPORT))
+        set_default_store(FallbackStore(caches[settings.API_STORE_CACHE]))
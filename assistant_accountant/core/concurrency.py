@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from time import sleep
+from typing import Any, Callable, Iterable, List, Tuple, Type
+
+
+def bounded_map(
+        func: Callable[[Any], Any],
+        items: Iterable[Any],
+        max_workers: int
+) -> List[Any]:
+    """
+    Выполняет func для каждого элемента items, одновременно в работе не более
+    max_workers вызовов. Результаты возвращаются в порядке items.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    workers = min(max_workers, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+
+def with_retry(
+        func: Callable[..., Any],
+        attempts: int,
+        retry_on: Tuple[Type[Exception], ...] = (Exception,),
+        delay: float = 0
+) -> Callable[..., Any]:
+    """
+    Оборачивает func повторами: при исключениях из retry_on вызов
+    повторяется до attempts раз с паузой delay секунд. Последнее
+    исключение пробрасывается.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except retry_on:
+                if attempt == attempts:
+                    raise
+                sleep(delay)
+    return wrapper
@@ -1,9 +1,12 @@
-from typing import Dict, List
+from copy import copy
+from typing import Dict, Iterator, List
 from http import HTTPStatus
 
 import requests
 
 from . import exceptions
+from ..concurrency import bounded_map, with_retry
+from ..transport import Transport, default_transport
 
 
 class BaseApi:
@@ -17,12 +20,17 @@ class BaseApi:
     INVALID_TOKEN = 'invalid_token'
     EXPIRED_TOKEN = 'expired_token'
     HTTP_METHOD = 'get'
+    transport: Transport = None
 
     @property
     def endpoint(self):
         """Endpoint сервиса api."""
         raise NotImplementedError
 
+    def get_transport(self) -> Transport:
+        """HTTP транспорт: заданный экземпляру или общий для процесса."""
+        return self.transport or default_transport()
+
     def get_url(self) -> str:
         """Формирует урл."""
         return f'https://{self.HOST}/api/{self.VERSION}/{self.endpoint}'
@@ -46,11 +54,12 @@ class BaseApi:
             data: Dict = None,
     ) -> requests.Response:
         """Отправка http запроса."""
+        transport = self.get_transport()
         if self.HTTP_METHOD == 'get':
-            response = requests.get(url, params=params, headers=headers)
+            response = transport.get(url, params=params, headers=headers)
         elif self.HTTP_METHOD == 'post':
-            response = requests.post(url, data=data,
-                                     params=params, headers=headers)
+            response = transport.post(url, data=data,
+                                      params=params, headers=headers)
         else:
             raise exceptions.MyTargetUnknownHttpMethod(
                 f'Unknown method: {self.HTTP_METHOD}'
@@ -120,13 +129,24 @@ class AgencyClients(BaseApi):
     """
     Получение клиентов рекламного агентства.
     https://target.my.com/doc/api/ru/resource/AgencyClients
+
+    Первая страница возвращает общее число клиентов count, остальные
+    страницы запрашиваются параллельно, не более concurrency одновременно.
     """
     ENDPOINT = 'agency/clients.json'
-    OFFSET = 0
+    MAX_LIMIT = 50
+    CONCURRENCY = 5
 
-    def __init__(self, access_token: str, limit: int = 50):
+    def __init__(
+            self,
+            access_token: str,
+            limit: int = MAX_LIMIT,
+            concurrency: int = CONCURRENCY
+    ):
         self.access_token = access_token
-        self.limit = limit
+        self.limit = min(limit, self.MAX_LIMIT)
+        self.concurrency = concurrency
+        self.offset = 0
 
     @property
     def endpoint(self) -> str:
@@ -140,18 +160,78 @@ class AgencyClients(BaseApi):
     def get_params(self) -> Dict:
         return {
             'limit': self.limit,
-            'offset': self.OFFSET
+            'offset': self.offset
         }
 
+    def page(self, offset: int) -> Dict:
+        """Страница клиентов. Запрос идет от копии, offset не общий."""
+        api = copy(self)
+        api.offset = offset
+        return api.api_request()
+
     def run(self):
-        items = []
+        response = self.page(0)
+        items = response.get('items', [])
+        if 'count' not in response:
+            # Без count страницы запрашиваются по очереди до неполной.
+            offset = 0
+            page = items
+            while len(page) == self.limit:
+                offset += self.limit
+                page = self.page(offset).get('items', [])
+                items += page
+            return items
+        offsets = range(self.limit, response['count'], self.limit)
+        pages = bounded_map(self.page, offsets, max_workers=self.concurrency)
+        for page in pages:
+            items += page.get('items', [])
+        return items
+
+
+class Campaigns(BaseApi):
+    """
+    Постраничное получение кампаний. Для клиента агентства используется
+    токен клиента (auth.AgencyClientToken).
+    https://target.my.com/doc/api/ru/resource/Campaigns
+    """
+    ENDPOINT = 'campaigns.json'
+    FIELDS = 'id,name,status'
+    MAX_LIMIT = 250
+
+    def __init__(self, access_token: str, limit: int = MAX_LIMIT):
+        self.access_token = access_token
+        self.limit = min(limit, self.MAX_LIMIT)
+        self.offset = 0
+
+    @property
+    def endpoint(self) -> str:
+        return self.ENDPOINT
+
+    def get_headers(self) -> Dict:
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+    def get_params(self) -> Dict:
+        return {
+            'fields': self.FIELDS,
+            'limit': self.limit,
+            'offset': self.offset
+        }
+
+    def iter_pages(self) -> Iterator[List[Dict]]:
+        """Постраничная выдача, число страниц по count первого ответа."""
         while True:
             response = self.api_request()
-            item = response.get('items')
-            if not item:
-                break
-            items += item
-            self.OFFSET += self.limit
+            items = response.get('items', [])
+            if items:
+                yield items
+            self.offset += self.limit
+            if not items or self.offset >= response.get('count', 0):
+                return
+
+    def run(self):
+        items = []
+        for page in self.iter_pages():
+            items += page
         return items
 
 
@@ -164,8 +244,17 @@ class SummaryStatistic(BaseApi):
     date_from YYYY-MM-DD
     date_to YYYY-MM-DD
     ids	список идентификаторов
+
+    Список клиентов делится на части по MAX_IDS (ограничение числа id и
+    длины url), части запрашиваются параллельно, не более CONCURRENCY
+    одновременно, items ответов объединяются. Упавшая часть повторяется
+    отдельно, до CHUNK_ATTEMPTS раз.
     """
     ENDPOINT = 'statistics/users/summary.json'
+    MAX_IDS = 100
+    CONCURRENCY = 5
+    CHUNK_ATTEMPTS = 3
+    CHUNK_RETRY_DELAY = 1
 
     def __init__(
             self,
@@ -194,6 +283,35 @@ class SummaryStatistic(BaseApi):
             'date_to': self.date_to
         }
 
+    def split(self) -> List['SummaryStatistic']:
+        """Запросы на части клиентов не длиннее MAX_IDS."""
+        if len(self.clients_id) <= self.MAX_IDS:
+            return [self]
+        chunks = []
+        for start in range(0, len(self.clients_id), self.MAX_IDS):
+            chunk = copy(self)
+            chunk.clients_id = self.clients_id[start:start + self.MAX_IDS]
+            chunks.append(chunk)
+        return chunks
+
+    def fetch_chunk(self, chunk: 'SummaryStatistic') -> Dict:
+        request = with_retry(
+            chunk.api_request,
+            attempts=self.CHUNK_ATTEMPTS,
+            retry_on=(exceptions.MyTargetOtherError,
+                      requests.RequestException),
+            delay=self.CHUNK_RETRY_DELAY
+        )
+        return request()
+
+    def run(self):
+        results = bounded_map(self.fetch_chunk, self.split(),
+                              max_workers=self.CONCURRENCY)
+        data = dict(results[0])
+        data['items'] = [item for result in results
+                         for item in result.get('items', [])]
+        return data
+
 
 class DayStatistic(SummaryStatistic):
     ENDPOINT = 'statistics/users/day.json'
@@ -0,0 +1,135 @@
+import asyncio
+from copy import copy
+from typing import AsyncIterator, Dict, List
+
+import aiohttp
+import requests
+
+from . import ads, exceptions
+from ..aio import (AsyncTransport, Response, bounded_gather,
+                   default_async_transport, with_retry)
+
+
+class BaseApi(ads.BaseApi):
+    """
+    Асинхронный вариант ads.BaseApi: урл, заголовки, параметры и проверка
+    ответа берутся из синхронных классов, асинхронными становятся запрос и
+    оркестратор.\n
+    await AgencyClients(access_token).run()
+    """
+    transport: AsyncTransport = None
+
+    def get_transport(self) -> AsyncTransport:
+        """HTTP транспорт: заданный экземпляру или общий для цикла."""
+        return self.transport or default_async_transport()
+
+    async def send_response(
+            self, url: str,
+            params: Dict,
+            headers: Dict = None,
+            data: Dict = None,
+    ) -> Response:
+        """Отправка http запроса."""
+        transport = self.get_transport()
+        if self.HTTP_METHOD == 'get':
+            response = await transport.get(url, params=params,
+                                           headers=headers)
+        elif self.HTTP_METHOD == 'post':
+            response = await transport.post(url, data=data,
+                                            params=params, headers=headers)
+        else:
+            raise exceptions.MyTargetUnknownHttpMethod(
+                f'Unknown method: {self.HTTP_METHOD}'
+            )
+        return response
+
+    async def api_request(self) -> Dict:
+        """Оркестратор."""
+        url = self.get_url()
+        headers = self.get_headers()
+        data = self.get_data()
+        params = self.get_params()
+        response = await self.send_response(
+            url=url,
+            params=params,
+            headers=headers,
+            data=data
+        )
+        self.response_code_processing(response)
+        data = self.response_to_json(response)
+        return data
+
+    async def run(self):
+        return await self.api_request()
+
+
+class AgencyClients(BaseApi, ads.AgencyClients):
+
+    async def page(self, offset: int) -> Dict:
+        api = copy(self)
+        api.offset = offset
+        return await api.api_request()
+
+    async def run(self):
+        response = await self.page(0)
+        items = response.get('items', [])
+        if 'count' not in response:
+            offset = 0
+            page = items
+            while len(page) == self.limit:
+                offset += self.limit
+                page = (await self.page(offset)).get('items', [])
+                items += page
+            return items
+        offsets = range(self.limit, response['count'], self.limit)
+        pages = await bounded_gather(self.page, offsets,
+                                     max_workers=self.concurrency)
+        for page in pages:
+            items += page.get('items', [])
+        return items
+
+
+class Campaigns(BaseApi, ads.Campaigns):
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict]]:
+        while True:
+            response = await self.api_request()
+            items = response.get('items', [])
+            if items:
+                yield items
+            self.offset += self.limit
+            if not items or self.offset >= response.get('count', 0):
+                return
+
+    async def run(self):
+        items = []
+        async for page in self.iter_pages():
+            items += page
+        return items
+
+
+class SummaryStatistic(BaseApi, ads.SummaryStatistic):
+
+    async def fetch_chunk(self, chunk: 'SummaryStatistic') -> Dict:
+        request = with_retry(
+            chunk.api_request,
+            attempts=self.CHUNK_ATTEMPTS,
+            retry_on=(exceptions.MyTargetOtherError,
+                      requests.RequestException,
+                      aiohttp.ClientError,
+                      asyncio.TimeoutError),
+            delay=self.CHUNK_RETRY_DELAY
+        )
+        return await request()
+
+    async def run(self):
+        results = await bounded_gather(self.fetch_chunk, self.split(),
+                                       max_workers=self.CONCURRENCY)
+        data = dict(results[0])
+        data['items'] = [item for result in results
+                         for item in result.get('items', [])]
+        return data
+
+
+class DayStatistic(SummaryStatistic):
+    ENDPOINT = ads.DayStatistic.ENDPOINT
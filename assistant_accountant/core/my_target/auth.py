@@ -45,6 +45,36 @@ class ClientCredentialsToken(BaseAuth):
         }
 
 
+class AgencyClientToken(BaseAuth):
+    """
+    Получение access_token клиента агентства.
+    AgencyClientToken(client_id, client_secret, agency_client_name).run()
+    """
+    ENDPOINT = 'token.json'
+    GRANT_TYPE = 'agency_client_credentials'
+
+    def __init__(
+            self,
+            client_id: str,
+            client_secret: str,
+            agency_client_name: str
+    ):
+        super().__init__(client_id, client_secret)
+        self.agency_client_name = agency_client_name
+
+    @property
+    def endpoint(self):
+        return self.ENDPOINT
+
+    def get_data(self) -> Dict:
+        return {
+            'grant_type': self.GRANT_TYPE,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'agency_client_name': self.agency_client_name
+        }
+
+
 class DeleteTokens(BaseAuth):
     """
     Удаление токенов пользователя.
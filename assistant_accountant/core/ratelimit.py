@@ -0,0 +1,81 @@
+import asyncio
+from hashlib import sha256
+from math import ceil
+from time import sleep, time
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+
+from .store import default_store
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов по токену доступа в общем хранилище,
+    общее для всех воркеров.\n
+    Ведро из rate токенов пополняется в начале каждого окна period секунд.
+    Запрос берет токен атомарным incr счетчика окна, если токенов нет -
+    ждет начала следующего окна. Так запросы к API идут не чаще лимита и
+    ошибки превышения частоты не становятся штатным способом ожидания.
+    """
+    KEY_PREFIX = 'rate_limit'
+
+    def __init__(
+            self,
+            name: str,
+            rate: int,
+            period: float = 1.0,
+            store=None,
+            clock: Callable[[], float] = time,
+            wait: Callable[[float], None] = sleep
+    ):
+        self.name = name
+        self.rate = rate
+        self.period = period
+        self.store = store
+        self.clock = clock
+        self.wait = wait
+
+    def get_store(self):
+        return self.store or default_store()
+
+    def key(self, access_token: str, window: int) -> str:
+        token_hash = sha256(access_token.encode()).hexdigest()[:16]
+        return f'{self.KEY_PREFIX}:{self.name}:{token_hash}:{window}'
+
+    def try_acquire(self, access_token: str) -> float:
+        """Берет токен. Возвращает 0 или сколько секунд ждать до нового."""
+        now = self.clock()
+        window = int(now // self.period)
+        key = self.key(access_token, window)
+        store = self.get_store()
+        store.add(key, 0, ceil(self.period) + 1)
+        try:
+            count = store.incr(key)
+        except ValueError:
+            # Счетчик окна истек между add и incr.
+            store.add(key, 1, ceil(self.period) + 1)
+            count = 1
+        if count <= self.rate:
+            return 0
+        return (window + 1) * self.period - now
+
+    def acquire(self, access_token: str) -> None:
+        """Ждет, пока не получит токен."""
+        while True:
+            wait_for = self.try_acquire(access_token)
+            if not wait_for:
+                return
+            self.wait(wait_for)
+
+    async def acquire_async(self, access_token: str) -> None:
+        """
+        acquire для asyncio: ожидание и запросы к общему хранилищу не
+        блокируют цикл событий.
+        """
+        try_acquire = sync_to_async(self.try_acquire, thread_sensitive=False)
+        while True:
+            wait_for = await try_acquire(access_token)
+            if not wait_for:
+                return
+            await asyncio.sleep(wait_for)
@@ -0,0 +1,114 @@
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, Tuple
+
+
+class MemoryStore:
+    """
+    Хранилище в памяти процесса с интерфейсом кэша Django
+    (get, set, add, incr, delete). Используется в тестах и как замена
+    общему кэшу, когда он не настроен.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, float]] = {}
+        self._lock = Lock()
+
+    def _get(self, key: str):
+        value, expires_at = self._data.get(key, (None, None))
+        if expires_at is not None and expires_at <= monotonic():
+            del self._data[key]
+            return None, False
+        return value, key in self._data
+
+    def _set(self, key: str, value: Any, timeout: float = None) -> None:
+        expires_at = None if timeout is None else monotonic() + timeout
+        self._data[key] = (value, expires_at)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            value, exists = self._get(key)
+        return value if exists else default
+
+    def set(self, key: str, value: Any, timeout: float = None) -> None:
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        """Записывает значение, только если ключа нет. Атомарно."""
+        with self._lock:
+            _, exists = self._get(key)
+            if exists:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        with self._lock:
+            value, exists = self._get(key)
+            if not exists:
+                raise ValueError(f'Key {key} not found.')
+            _, expires_at = self._data[key]
+            self._data[key] = (value + delta, expires_at)
+            return value + delta
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+
+class FallbackStore:
+    """
+    Общее хранилище с запасным хранилищем процесса. Если основное
+    хранилище (Redis) недоступно, операции выполняются в запасном, и
+    основное не опрашивается RETRY_AFTER секунд.
+    """
+    RETRY_AFTER = 30
+
+    def __init__(self, primary, fallback=None, clock=monotonic):
+        self.primary = primary
+        self.fallback = fallback or MemoryStore()
+        self.clock = clock
+        self.primary_down_until = 0.0
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        if self.clock() >= self.primary_down_until:
+            try:
+                return getattr(self.primary, method)(*args, **kwargs)
+            except ValueError:
+                # incr отсутствующего ключа: ошибка данных, а не хранилища.
+                raise
+            except Exception:
+                self.primary_down_until = self.clock() + self.RETRY_AFTER
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._call('get', key, default)
+
+    def set(self, key: str, value: Any, timeout: float = None) -> None:
+        return self._call('set', key, value, timeout)
+
+    def add(self, key: str, value: Any, timeout: float = None) -> bool:
+        return self._call('add', key, value, timeout)
+
+    def incr(self, key: str, delta: int = 1) -> int:
+        return self._call('incr', key, delta)
+
+    def delete(self, key: str) -> bool:
+        return self._call('delete', key)
+
+
+_default_store = None
+
+
+def default_store():
+    """Общее хранилище процесса: кэш Django из настроек или MemoryStore."""
+    global _default_store
+    if _default_store is None:
+        _default_store = MemoryStore()
+    return _default_store
+
+
+def set_default_store(store) -> None:
+    global _default_store
+    _default_store = store
@@ -0,0 +1,93 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from django.test import SimpleTestCase
+
+from core.aio import AsyncTransport, Response
+from core.my_target import aio as my_target_aio
+from core.vk import aio as vk_aio
+from core.yandex import aio as yandex_aio
+from core.yandex import direct as yandex_direct
+
+
+class AsyncTransportTest(SimpleTestCase):
+
+    def test_encode_params(self):
+        """Списки в параметрах - повторяющиеся ключи, как в requests."""
+        self.assertEqual(
+            AsyncTransport.encode_params({'id': [1, 2], 'limit': 50,
+                                          'offset': None}),
+            [('id', '1'), ('id', '2'), ('limit', '50')]
+        )
+
+    def test_injected_transport(self):
+        """Клиенты API ходят через подставленный транспорт."""
+        stub = AsyncMock()
+        stub.get.return_value = Response('https://target.my.com/', 200, {},
+                                         b'{"count": 1, "items": [{}]}')
+        api = my_target_aio.AgencyClients('qwe')
+        api.transport = stub
+        self.assertEqual(asyncio.run(api.run()), [{}])
+        stub.get.assert_awaited_once()
+
+
+class StatisticTest(SimpleTestCase):
+
+    @patch('core.vk.aio.Statistic.run', autospec=True)
+    def test_get_merges_chunks(self, mock_run):
+        async def run(statistic):
+            return {'response': [{'id': client_id, 'stats': []}
+                                 for client_id in statistic.id_clients]}
+
+        mock_run.side_effect = run
+        ids = list(range(1000000, 1003000))
+        statistic = vk_aio.Statistic('qwe', account_id=1, id_clients=ids,
+                                     date_from='2022-11-01',
+                                     date_to='2022-11-02')
+        data = asyncio.run(statistic.get())
+        self.assertGreater(mock_run.call_count, 1)
+        self.assertEqual([raw['id'] for raw in data['response']], ids)
+
+
+class ReportPollerTest(SimpleTestCase):
+
+    def make_report(self, login):
+        payload = yandex_direct.Payload.payload_statistic(
+            fields=['Date', 'Cost'], params=[])
+        return yandex_aio.ClientCostReport('qwe', login, payload)
+
+    def test_poll(self):
+        """Отчеты ждут retryIn и не превышают max_in_flight."""
+        in_flight = []
+        polls = {}
+
+        async def poll(report):
+            polls[report.client_login] = polls.get(report.client_login, 0)
+            polls[report.client_login] += 1
+            if polls[report.client_login] == 1:
+                in_flight.append(report.client_login)
+                return None, 0
+            self.assertLessEqual(len(in_flight), 2)
+            in_flight.remove(report.client_login)
+            if report.client_login == 'failed':
+                raise ValueError('outage')
+            return {'result': report.client_login}, None
+
+        poller = yandex_aio.ReportPoller(max_in_flight=2, raise_errors=False)
+        for login in ('login-1', 'login-2', 'failed'):
+            poller.add(login, self.make_report(login))
+        with patch('core.yandex.aio.ClientCostReport.poll', autospec=True,
+                   side_effect=poll):
+            results = asyncio.run(poller.run())
+        self.assertEqual(results, {'login-1': {'result': 'login-1'},
+                                   'login-2': {'result': 'login-2'}})
+        self.assertEqual(list(poller.errors), ['failed'])
+        self.assertEqual(set(poller.build_times), {'login-1', 'login-2'})
+
+    def test_decode_report(self):
+        """Строки отчета разбираются из прочитанного тела ответа."""
+        report = self.make_report('login-1')
+        response = Response('https://api.direct.yandex.com/', 200, {},
+                            b'2022-11-01\t1.5\n2022-11-02\t--\n')
+        rows = list(report.api_response_decode(response)['result'])
+        self.assertEqual([str(row['Cost']) for row in rows], ['1.5', 'None'])
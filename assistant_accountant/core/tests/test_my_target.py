@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.my_target import ads as my_target_ads
+from core.my_target.exceptions import MyTargetOtherError
+
+
+class AgencyClientsTest(SimpleTestCase):
+
+    @patch('core.my_target.ads.BaseApi.api_request', autospec=True)
+    def test_pages_by_count(self, mock_request):
+        """Страницы запрашиваются по count, без пустого запроса в конце."""
+        total = 120
+
+        def api_request(api):
+            ids = range(api.offset, min(api.offset + api.limit, total))
+            return {'count': total, 'items': [{'id': i} for i in ids]}
+
+        mock_request.side_effect = api_request
+        items = my_target_ads.AgencyClients('qwe', limit=100).run()
+        self.assertEqual([item['id'] for item in items], list(range(total)))
+        self.assertEqual(mock_request.call_count, 3)
+
+
+class DayStatisticTest(SimpleTestCase):
+
+    @patch('core.my_target.ads.BaseApi.api_request', autospec=True)
+    def test_chunks_merge_and_retry(self, mock_request):
+        """Части запрашиваются отдельно, упавшая часть повторяется."""
+        failed = []
+
+        def api_request(api):
+            if api.clients_id[0] == 100 and not failed:
+                failed.append(api.clients_id[0])
+                raise MyTargetOtherError()
+            return {'items': [{'id': i, 'rows': []} for i in api.clients_id]}
+
+        mock_request.side_effect = api_request
+        statistic = my_target_ads.DayStatistic(
+            'qwe', clients_id=list(range(250)),
+            date_from='2022-11-01', date_to='2022-11-02'
+        )
+        statistic.CHUNK_RETRY_DELAY = 0
+        data = statistic.run()
+        self.assertEqual([item['id'] for item in data['items']],
+                         list(range(250)))
+        self.assertEqual(mock_request.call_count, 4)
@@ -0,0 +1,85 @@
+import asyncio
+from threading import get_ident
+
+from django.test import SimpleTestCase
+
+from core.ratelimit import RateLimiter
+from core.store import FallbackStore, MemoryStore
+
+
+class FakeClock:
+
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class BrokenStore:
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            raise ConnectionError('store is down')
+        return method
+
+
+class ThreadStore(MemoryStore):
+    """Запоминает потоки, в которых к нему обращались."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def add(self, *args, **kwargs):
+        self.threads.add(get_ident())
+        return super().add(*args, **kwargs)
+
+
+class RateLimiterTest(SimpleTestCase):
+
+    def test_acquire_waits_for_next_window(self):
+        clock = FakeClock(100.5)
+        limiter = RateLimiter('test', rate=2, store=MemoryStore(),
+                              clock=clock, wait=clock.sleep)
+        for _ in range(5):
+            limiter.acquire('token')
+        self.assertEqual(clock.now, 102.0)
+
+    def test_tokens_are_separate(self):
+        limiter = RateLimiter('test', rate=1, store=MemoryStore(),
+                              clock=FakeClock())
+        self.assertEqual(limiter.try_acquire('token-1'), 0)
+        self.assertEqual(limiter.try_acquire('token-2'), 0)
+        self.assertGreater(limiter.try_acquire('token-1'), 0)
+
+    def test_acquire_async_off_loop(self):
+        """Хранилище не вызывается из потока цикла событий."""
+        store = ThreadStore()
+        limiter = RateLimiter('test', rate=1, store=store,
+                              clock=FakeClock())
+
+        async def acquire():
+            await limiter.acquire_async('token')
+            return get_ident()
+
+        self.assertNotIn(asyncio.run(acquire()), store.threads)
+        self.assertTrue(store.threads)
+
+
+class FallbackStoreTest(SimpleTestCase):
+
+    def test_fallback_when_primary_is_down(self):
+        clock = FakeClock()
+        primary = MemoryStore()
+        store = FallbackStore(BrokenStore(), clock=clock)
+        store.set('key', 1)
+        self.assertEqual(store.get('key'), 1)
+
+        store.primary = primary
+        self.assertEqual(store.get('key'), 1)
+        clock.sleep(FallbackStore.RETRY_AFTER)
+        self.assertIsNone(store.get('key'))
@@ -0,0 +1,50 @@
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from core import transport
+from core.my_target.ads import AgencyClients
+from core.transport import Transport
+from core.vk.ads import Account
+
+
+class TransportTest(SimpleTestCase):
+
+    def test_session_pool(self):
+        """Адаптер сессии использует заданные размеры пулов."""
+        http = Transport(pool_connections=3, pool_maxsize=7)
+        adapter = http.session.get_adapter('https://api.vk.com/')
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertIn('gzip', http.session.headers['Accept-Encoding'])
+
+    def test_default_timeout(self):
+        """Таймауты подставляются, если не заданы в запросе."""
+        http = Transport(connect_timeout=1, read_timeout=2)
+        http.session = Mock()
+        http.get('https://example.com/')
+        http.session.request.assert_called_once_with(
+            'GET', 'https://example.com/', timeout=(1, 2)
+        )
+
+    def test_injected_transport(self):
+        """Клиенты API ходят через подставленный транспорт."""
+        stub = Mock()
+        stub.get.return_value.json.return_value = {'response': []}
+        api = Account(access_token='qwe')
+        api.transport = stub
+        self.assertEqual(api.get(), {'response': []})
+        stub.get.assert_called_once()
+
+    def test_default_transport(self):
+        """Без явного транспорта используется общий транспорт процесса."""
+        stub = Mock()
+        stub.get.return_value.status_code = 200
+        stub.get.return_value.json.return_value = {'items': []}
+        previous = transport.default_transport()
+        transport.set_default_transport(stub)
+        try:
+            self.assertEqual(AgencyClients('qwe').run(), [])
+        finally:
+            transport.set_default_transport(previous)
+        stub.get.assert_called_once()
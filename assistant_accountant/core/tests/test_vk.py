@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.vk import ads as vk_ads
+from core.vk.exceptions import (VkDataError, VkExecuteLimitError,
+                                VkManyRequestPerSecondError)
+
+
+class ExecuteTest(SimpleTestCase):
+
+    def test_code(self):
+        """Вызовы собираются в VKScript без параметров самого execute."""
+        execute = vk_ads.Execute('qwe', [
+            vk_ads.Clients('qwe', account_id=1),
+            vk_ads.GetBudget('qwe', account_id=2),
+        ])
+        self.assertEqual(
+            execute.get_params()['code'],
+            'return [API.ads.getClients({"account_id": 1}),'
+            'API.ads.getBudget({"account_id": 2})];'
+        )
+
+    def test_calls_limit(self):
+        execute = vk_ads.Execute('qwe', [
+            vk_ads.Clients('qwe', account_id=i)
+            for i in range(vk_ads.Execute.MAX_CALLS)
+        ])
+        with self.assertRaises(VkExecuteLimitError):
+            execute.add(vk_ads.Clients('qwe', account_id=0))
+
+    def test_split(self):
+        """Ошибки вызовов сопоставляются упавшим вызовам по порядку."""
+        execute = vk_ads.Execute('qwe', [
+            vk_ads.Clients('qwe', account_id=i) for i in range(4)
+        ])
+        results = execute.split({
+            'response': [[{'id': 1}], False, [], False],
+            'execute_errors': [
+                {'method': 'ads.getClients', 'error_code': 6},
+                {'method': 'ads.getClients', 'error_code': 100},
+            ]
+        })
+        self.assertEqual(results[0], {'response': [{'id': 1}]})
+        self.assertIsInstance(results[1], VkManyRequestPerSecondError)
+        self.assertEqual(results[2], {'response': []})
+        self.assertIsInstance(results[3], VkDataError)
+
+
+class StatisticTest(SimpleTestCase):
+
+    def make_statistic(self, id_clients):
+        return vk_ads.Statistic('qwe', account_id=1, id_clients=id_clients,
+                                date_from='2022-11-01', date_to='2022-11-02')
+
+    def test_split(self):
+        """Части не превышают ни число клиентов, ни длину строки ids."""
+        statistic = self.make_statistic(list(range(1000000, 1005000)))
+        chunks = statistic.split()
+        self.assertEqual(sum(len(chunk.id_clients) for chunk in chunks),
+                         5000)
+        for chunk in chunks:
+            params = chunk.get_params()
+            self.assertLessEqual(len(params['ids']),
+                                 vk_ads.Statistic.MAX_IDS_LENGTH)
+        self.assertEqual(self.make_statistic([1, 2]).split()[0].id_clients,
+                         [1, 2])
+
+    @patch('core.vk.ads.Statistic.run', autospec=True)
+    def test_get_merges_chunks(self, mock_run):
+        mock_run.side_effect = lambda statistic: {
+            'response': [{'id': client_id, 'stats': []}
+                         for client_id in statistic.id_clients]
+        }
+        ids = list(range(1000000, 1003000))
+        data = self.make_statistic(ids).get()
+        self.assertGreater(mock_run.call_count, 1)
+        self.assertEqual([raw['id'] for raw in data['response']], ids)
@@ -0,0 +1,262 @@
+import io
+from datetime import date
+from decimal import Decimal
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+from requests import Response
+
+from core.store import MemoryStore
+from core.yandex.direct import AgencyClients, ClientCostReport, Payload
+from core.yandex.poller import ReportPoller, ReportState
+from core.yandex.splitting import ChunkSizeEstimator, split_date_range
+from core.yandex.units import Units, UnitsLedger
+
+
+def make_response(body: bytes) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return response
+
+
+class FakeReport:
+    """Отчет, который готов после заданного числа опросов."""
+
+    def __init__(self, name, polls_until_ready, retry_in=10):
+        self.name = name
+        self.polls_until_ready = polls_until_ready
+        self.retry_in = retry_in
+        self.polls = 0
+
+    def poll(self):
+        self.polls += 1
+        if self.polls >= self.polls_until_ready:
+            return {'result': self.name}, None
+        return None, self.retry_in
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, seconds):
+        self.now += seconds
+
+
+class ReportPollerTest(SimpleTestCase):
+
+    def make_poller(self, **kwargs):
+        self.clock = FakeClock()
+        return ReportPoller(clock=self.clock, wait=self.clock.wait, **kwargs)
+
+    def test_run_collects_all_reports(self):
+        """Все отчеты опрашиваются до готовности с учетом retryIn."""
+        poller = self.make_poller()
+        reports = [FakeReport(f'r{i}', polls_until_ready=i + 1, retry_in=5)
+                   for i in range(4)]
+        for report in reports:
+            poller.add(report.name, report)
+        results = poller.run()
+        self.assertEqual(results,
+                         {r.name: {'result': r.name} for r in reports})
+        # Отчеты ждут параллельно, а не друг за другом.
+        self.assertEqual(self.clock.now, 15)
+
+    def test_max_in_flight(self):
+        """В очереди API не больше max_in_flight отчетов."""
+        poller = self.make_poller(max_in_flight=2)
+        for i in range(5):
+            poller.add(i, FakeReport(i, polls_until_ready=2))
+        poller.submit()
+        self.assertEqual(len(poller.table), 2)
+        self.assertEqual(len(poller.run()), 5)
+
+    def test_max_in_flight_per_group(self):
+        """Лимит действует на группу (логин), общий лимит больше."""
+        poller = self.make_poller(max_in_flight=10,
+                                  max_in_flight_per_group=2,
+                                  group=lambda key: key[0])
+        for login in ('a', 'b'):
+            for i in range(4):
+                poller.add((login, i), FakeReport(i, polls_until_ready=2))
+        poller.submit()
+        self.assertEqual(sorted(poller.table),
+                         [('a', 0), ('a', 1), ('b', 0), ('b', 1)])
+        self.assertEqual(len(poller.run()), 8)
+        self.assertEqual(poller.group_in_flight, {'a': 0, 'b': 0})
+
+    def test_errors_without_raise(self):
+        """Ошибка одного отчета не останавливает опрос остальных."""
+        broken = FakeReport('broken', polls_until_ready=1)
+        broken.poll = lambda: (_ for _ in ()).throw(ValueError('boom'))
+        poller = self.make_poller(raise_errors=False)
+        poller.add('broken', broken)
+        poller.add('ok', FakeReport('ok', polls_until_ready=2))
+        self.assertEqual(list(poller.run()), ['ok'])
+        self.assertIsInstance(poller.errors['broken'], ValueError)
+
+    def test_stop_on(self):
+        """Ошибка stop_on в on_result прерывает опрос остальных отчетов."""
+        reports = [FakeReport(i, polls_until_ready=2) for i in range(6)]
+
+        def on_result(key, data):
+            raise LookupError(key)
+
+        poller = self.make_poller(max_in_flight=2, raise_errors=False,
+                                  on_result=on_result, stop_on=(LookupError,))
+        for report in reports:
+            poller.add(report.name, report)
+        with self.assertRaises(LookupError):
+            poller.run()
+        self.assertEqual(poller.errors, {})
+        self.assertEqual([report.polls for report in reports],
+                         [2, 1, 0, 0, 0, 0])
+
+    def test_poll_state(self):
+        """Строка таблицы хранит состояние и время следующего опроса."""
+        poller = self.make_poller()
+        poller.add('r', FakeReport('r', polls_until_ready=3, retry_in=7))
+        poller.submit()
+        poller.poll_one('r')
+        row = poller.table['r']
+        self.assertEqual(row.state, ReportState.BUILDING)
+        self.assertEqual(row.next_poll_at, 7)
+
+
+class ClientCostReportDecodeTest(SimpleTestCase):
+
+    def make_report(self, fields):
+        payload = Payload.payload_statistic(fields=fields, params=[])
+        return ClientCostReport(access_token='qwe', client_login='login',
+                                payload=payload)
+
+    def test_typed_rows(self):
+        """Строки отчета приводятся к типам полей, последняя не теряется."""
+        report = self.make_report(['Date', 'Cost', 'Clicks'])
+        response = make_response(
+            b'2022-11-01\t10.50\t3\n2022-11-02\t0.25\t--\n'
+        )
+        rows = list(report.api_response_decode(response)['result'])
+        self.assertEqual(rows, [
+            {'Date': date(2022, 11, 1), 'Cost': Decimal('10.50'),
+             'Clicks': 3},
+            {'Date': date(2022, 11, 2), 'Cost': Decimal('0.25'),
+             'Clicks': None},
+        ])
+
+    def test_unknown_fields_are_strings(self):
+        """Поля без описания типа остаются строками."""
+        report = self.make_report(['CampaignName', 'Cost'])
+        response = make_response(b'\xd0\x9a\xd0\xb0\xd0\xbc\t1.00')
+        rows = list(report.api_response_decode(response)['result'])
+        self.assertEqual(rows,
+                         [{'CampaignName': 'Кам', 'Cost': Decimal('1.00')}])
+
+    def test_empty_report(self):
+        report = self.make_report(['Date', 'Cost'])
+        rows = list(report.api_response_decode(make_response(b''))['result'])
+        self.assertEqual(rows, [])
+
+    def test_stream_closed(self):
+        """Поток ответа закрывается после чтения и при брошенных строках."""
+        report = self.make_report(['Date', 'Cost'])
+        for read in (list, next):
+            response = make_response(b'2022-11-01\t1\n2022-11-02\t2\n')
+            response.close = Mock()
+            rows = report.api_response_decode(response)['result']
+            read(rows)
+            rows.close()
+            response.close.assert_called_once()
+
+    def test_poll_releases_pending_response(self):
+        """Ответ 202 без отчета дочитывается и закрывается."""
+        report = self.make_report(['Date', 'Cost'])
+        response = make_response(b'')
+        response.status_code = 202
+        response.headers['retryIn'] = '5'
+        report.transport = Mock()
+        report.transport.post.return_value = response
+        report.units_ledger = UnitsLedger(MemoryStore())
+        response.close = Mock()
+        self.assertEqual(report.poll(), (None, 5))
+        response.close.assert_called_once()
+
+
+class UnitsTest(SimpleTestCase):
+
+    def test_parse(self):
+        self.assertEqual(Units.parse('10/20828/64000'),
+                         Units(10, 20828, 64000))
+        self.assertIsNone(Units.parse(None))
+        self.assertIsNone(Units.parse('broken'))
+
+    def test_api_request_records_units(self):
+        """Баллы из ответа API попадают в учет логина и токена."""
+        response = Mock(status_code=200, headers={
+            'Units': '10/990/1000', 'Units-Used-Login': 'login'
+        })
+        response.json.return_value = {'result': {'Clients': []}}
+        payload = Payload.payload_pagination(fields=['Login'], offset=0,
+                                             limit=10, method='get')
+        api = AgencyClients(access_token='qwe', payload=payload)
+        api.transport = Mock()
+        api.transport.post.return_value = response
+        api.units_ledger = UnitsLedger(MemoryStore())
+        api.get()
+        self.assertEqual(api.units, Units(10, 990, 1000))
+        self.assertEqual(api.units_ledger.get('login'), Units(10, 990, 1000))
+        self.assertEqual(api.units_ledger.get_token('qwe'),
+                         Units(10, 990, 1000))
+
+
+class SplittingTest(SimpleTestCase):
+
+    def test_split_date_range(self):
+        self.assertEqual(
+            split_date_range(date(2022, 1, 1), date(2022, 1, 5), 2),
+            [(date(2022, 1, 1), date(2022, 1, 2)),
+             (date(2022, 1, 3), date(2022, 1, 4)),
+             (date(2022, 1, 5), date(2022, 1, 5))]
+        )
+        self.assertEqual(
+            split_date_range(date(2022, 1, 1), date(2022, 1, 1), 30),
+            [(date(2022, 1, 1), date(2022, 1, 1))]
+        )
+
+    def test_chunk_days(self):
+        """Длина куска подстраивается под время формирования отчетов."""
+        estimator = ChunkSizeEstimator('REPORT', MemoryStore())
+        self.assertEqual(estimator.chunk_days(1),
+                         ChunkSizeEstimator.DEFAULT_DAYS)
+        estimator.observe(rows=10, seconds=10)
+        self.assertEqual(estimator.chunk_days(1), 120)
+        self.assertEqual(estimator.chunk_days(100),
+                         ChunkSizeEstimator.MIN_DAYS)
+        self.assertEqual(estimator.chunk_days(0),
+                         ChunkSizeEstimator.MAX_DAYS)
+
+    def test_build_time_model(self):
+        """Накладные расходы отчета отделяются от времени на строку,
+        пустые отчеты не учитываются."""
+        estimator = ChunkSizeEstimator('REPORT', MemoryStore())
+        for rows in (10, 50, 30, 90):
+            estimator.observe(rows=rows, seconds=20 + 0.5 * rows)
+            estimator.observe(rows=0, seconds=20)
+        overhead, per_row = estimator.build_time_model()
+        self.assertAlmostEqual(overhead, 20)
+        self.assertAlmostEqual(per_row, 0.5)
+        self.assertEqual(estimator.chunk_days(1), 200)
+
+    def test_rows_per_day(self):
+        """Строки в день оцениваются по отчетам своего логина."""
+        estimator = ChunkSizeEstimator('REPORT', MemoryStore())
+        self.assertIsNone(estimator.rows_per_day('login'))
+        estimator.observe_rows('login', rows=0, days=30)
+        estimator.observe_rows('login', rows=10, days=10)
+        self.assertAlmostEqual(estimator.rows_per_day('login'), 0.3)
+        self.assertIsNone(estimator.rows_per_day('other'))
@@ -0,0 +1,80 @@
+from typing import Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+    """
+    Общий HTTP транспорт клиентов рекламных API.\n
+    Держит keep-alive пулы соединений по хостам, проставляет таймауты
+    соединения и чтения и запрашивает сжатие ответов gzip.\n
+    Transport(pool_connections=10, pool_maxsize=10,
+              connect_timeout=10, read_timeout=120).post(url, data=...)
+    """
+    POOL_CONNECTIONS = 10
+    POOL_MAXSIZE = 10
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 120
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+    def __init__(
+            self,
+            pool_connections: int = POOL_CONNECTIONS,
+            pool_maxsize: int = POOL_MAXSIZE,
+            connect_timeout: float = CONNECT_TIMEOUT,
+            read_timeout: float = READ_TIMEOUT,
+            max_retries: int = 0
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.session = self.make_session()
+
+    def make_session(self) -> requests.Session:
+        """
+        Сессия с адаптером на пул соединений: pool_connections - число
+        хостов, pool_maxsize - соединений к одному хосту.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self.max_retries
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = self.ACCEPT_ENCODING
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Отправка http запроса, таймаут по умолчанию из настроек."""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, data=None, **kwargs) -> requests.Response:
+        return self.request('POST', url, data=data, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_transport = None
+
+
+def default_transport() -> Transport:
+    """Общий транспорт процесса, создается при первом обращении."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = Transport()
+    return _default_transport
+
+
+def set_default_transport(transport: Transport) -> None:
+    """Подмена общего транспорта: настройки проекта, заглушка в тестах."""
+    global _default_transport
+    _default_transport = transport
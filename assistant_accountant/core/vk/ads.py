@@ -1,8 +1,18 @@
-from typing import Dict
+import json
+from copy import copy
+from typing import Dict, List, Union
 
 import requests
 
 from . import exceptions
+from ..concurrency import bounded_map
+from ..ratelimit import RateLimiter
+from ..transport import Transport, default_transport
+
+# Лимит методов ads: запросов в секунду на токен.
+REQUESTS_PER_SECOND = 2
+
+_default_rate_limiter = RateLimiter('vk_ads', rate=REQUESTS_PER_SECOND)
 
 
 class BaseApi:
@@ -13,6 +23,8 @@ class BaseApi:
     FLOOD_ERROR_CODE = 9
     MANY_REQUEST_PER_SECOND_ERROR_CODE = 6
     REQUEST_TIMEOUT = 1
+    transport: Transport = None
+    rate_limiter: RateLimiter = None
 
     def __init__(self, access_token: str):
         self.access_token = access_token
@@ -37,9 +49,17 @@ class BaseApi:
         """Формирует урл для запроса к API."""
         return self.API_URL + self.api_method
 
+    def get_transport(self) -> Transport:
+        """HTTP транспорт: заданный экземпляру или общий для процесса."""
+        return self.transport or default_transport()
+
+    def get_rate_limiter(self) -> RateLimiter:
+        """Ограничитель частоты: заданный экземпляру или общий."""
+        return self.rate_limiter or _default_rate_limiter
+
     def send_request(self, url: str, params: Dict) -> requests.Response:
         """Отправка http запроса."""
-        response = requests.get(url, params=params)
+        response = self.get_transport().get(url, params=params)
         return response
 
     def dict_converting(self, response: requests.Response) -> Dict:
@@ -55,23 +75,27 @@ class BaseApi:
             raise exceptions.VkRequestError(error)
         return response
 
+    def make_error(self, error: Dict) -> Exception:
+        """Исключение для ошибки из ответа API."""
+        error_code = error.get('error_code')
+        if error_code == self.FLOOD_ERROR_CODE:
+            return exceptions.VkFloodControlError()
+        elif error_code == self.MANY_REQUEST_PER_SECOND_ERROR_CODE:
+            return exceptions.VkManyRequestPerSecondError()
+        return exceptions.VkDataError(error)
+
     def error_checking(self, data: Dict) -> Dict:
         """Проверка овета от API на ошибки."""
         error = data.get('error')
         if error:
-            error_code = error.get('error_code')
-            if error_code == self.FLOOD_ERROR_CODE:
-                raise exceptions.VkFloodControlError()
-            elif error_code == self.MANY_REQUEST_PER_SECOND_ERROR_CODE:
-                raise exceptions.VkManyRequestPerSecondError()
-            else:
-                raise exceptions.VkDataError(error)
+            raise self.make_error(error)
         return data
 
     def run(self):
         """Метод оркестратор."""
         url = self.get_url()
         params = self.get_params()
+        self.get_rate_limiter().acquire(self.access_token)
         response = self.get_response(url, params)
         data = self.dict_converting(response)
         data = self.error_checking(data)
@@ -111,6 +135,38 @@ class Clients(BaseApi):
         return params
 
 
+class Campaigns(BaseApi):
+    """
+    Список кампаний клиента агентства.
+    https://dev.vk.com/method/ads.getCampaigns
+    """
+
+    METHOD = 'ads.getCampaigns'
+
+    def __init__(
+            self,
+            access_token: str,
+            account_id: int,
+            client_id: int,
+            include_deleted: bool = False
+    ):
+        super().__init__(access_token)
+        self.account_id = account_id
+        self.client_id = client_id
+        self.include_deleted = include_deleted
+
+    @property
+    def api_method(self) -> str:
+        return self.METHOD
+
+    def get_params(self) -> Dict:
+        params = super().get_params()
+        params['account_id'] = self.account_id
+        params['client_id'] = self.client_id
+        params['include_deleted'] = int(self.include_deleted)
+        return params
+
+
 class Statistic(BaseApi):
     """
     Сбор статистики.
@@ -137,9 +193,14 @@ class Statistic(BaseApi):
     month: YYYY-MM, пример: 2011-09 - сентябрь 2011. \n
     year: YYYY, пример: 2011 - 2011 год. \n
     overall: 0 \n
+
+    Если клиентов больше MAX_IDS или строка ids длиннее MAX_IDS_LENGTH
+    (ограничение длины url), get делит запрос на части (split), отправляет
+    их параллельно в пределах ограничения частоты и объединяет response.
     """
     METHOD = 'ads.getStatistics'
     MAX_IDS = 2000
+    MAX_IDS_LENGTH = 6000
 
     def __init__(
             self,
@@ -178,6 +239,42 @@ class Statistic(BaseApi):
         params['period'] = self.period
         return params
 
+    def split(self) -> List['Statistic']:
+        """Запросы на части клиентов в пределах MAX_IDS и MAX_IDS_LENGTH."""
+        chunks = []
+        chunk = []
+        length = 0
+        for client_id in self.id_clients:
+            id_length = len(str(client_id))
+            full = (len(chunk) == self.MAX_IDS
+                    or length + id_length > self.MAX_IDS_LENGTH)
+            if chunk and full:
+                chunks.append(chunk)
+                chunk = []
+                length = 0
+            chunk.append(client_id)
+            # Учитывается запятая-разделитель.
+            length += id_length + 1
+        if chunk:
+            chunks.append(chunk)
+        if len(chunks) <= 1:
+            return [self]
+        statistics = []
+        for chunk in chunks:
+            statistic = copy(self)
+            statistic.id_clients = chunk
+            statistics.append(statistic)
+        return statistics
+
+    def get(self) -> Dict:
+        statistics = self.split()
+        if len(statistics) == 1:
+            return self.run()
+        results = bounded_map(lambda statistic: statistic.run(), statistics,
+                              max_workers=REQUESTS_PER_SECOND)
+        return {'response': [raw for data in results
+                             for raw in data['response']]}
+
 
 class GetBudget(BaseApi):
     """Возвращает текущий бюджет рекламного кабинета."""
@@ -195,3 +292,69 @@ class GetBudget(BaseApi):
         params = super().get_params()
         params['account_id'] = self.account_id
         return params
+
+
+class Execute(BaseApi):
+    """
+    Пакетный вызов методов API. https://dev.vk.com/method/execute\n
+    До MAX_CALLS вызовов собираются в один код VKScript и отправляются одним
+    запросом, лимит запросов в секунду расходуется один раз на пачку.
+    split разбирает ответ на результаты вызовов в порядке добавления:
+    {'response': ...} или исключение, если вызов упал.\n
+    execute = Execute(access_token, [Clients(access_token, account_id)])\n
+    results = execute.split(execute.get())
+    """
+    METHOD = 'execute'
+    MAX_CALLS = 25
+    # Параметры запроса, которые задаются самим execute.
+    OWN_PARAMS = ('access_token', 'v')
+
+    def __init__(self, access_token: str, calls: List[BaseApi] = None):
+        super().__init__(access_token)
+        self.calls: List[BaseApi] = []
+        for call in calls or []:
+            self.add(call)
+
+    @property
+    def api_method(self) -> str:
+        return self.METHOD
+
+    def add(self, call: BaseApi) -> None:
+        if len(self.calls) >= self.MAX_CALLS:
+            raise exceptions.VkExecuteLimitError(
+                f'Calls limit exceeded: {self.MAX_CALLS}')
+        self.calls.append(call)
+
+    def call_code(self, call: BaseApi) -> str:
+        params = {key: value for key, value in call.get_params().items()
+                  if key not in self.OWN_PARAMS}
+        return f'API.{call.api_method}({json.dumps(params)})'
+
+    def get_code(self) -> str:
+        """Код VKScript: массив результатов всех вызовов."""
+        calls = ','.join(self.call_code(call) for call in self.calls)
+        return f'return [{calls}];'
+
+    def get_params(self) -> Dict:
+        params = super().get_params()
+        params['code'] = self.get_code()
+        return params
+
+    def send_request(self, url: str, params: Dict) -> requests.Response:
+        """Код пачки может быть длинным, поэтому запрос отправляется POST."""
+        return self.get_transport().post(url, data=params)
+
+    def split(self, data: Dict) -> List[Union[Dict, Exception]]:
+        """
+        Результаты вызовов пачки. Упавший вызов возвращает false, его ошибки
+        перечислены в execute_errors в порядке вызовов.
+        """
+        errors = iter(data.get('execute_errors', []))
+        results = []
+        for call, response in zip(self.calls, data['response']):
+            if response is False:
+                error = next(errors, {'error_msg': 'Unknown execute error'})
+                results.append(call.make_error(error))
+            else:
+                results.append({'response': response})
+        return results
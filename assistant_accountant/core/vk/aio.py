@@ -0,0 +1,81 @@
+from typing import Dict
+
+from . import ads, exceptions
+from ..aio import (AsyncTransport, Response, bounded_gather,
+                   default_async_transport)
+
+
+class BaseApi(ads.BaseApi):
+    """
+    Асинхронный вариант ads.BaseApi: параметры, урл и проверка ответа
+    берутся из синхронных классов, асинхронными становятся ожидание
+    ограничителя частоты и запрос.\n
+    await Clients(access_token, account_id).get()
+    """
+    transport: AsyncTransport = None
+
+    def get_transport(self) -> AsyncTransport:
+        """HTTP транспорт: заданный экземпляру или общий для цикла."""
+        return self.transport or default_async_transport()
+
+    async def send_request(self, url: str, params: Dict) -> Response:
+        """Отправка http запроса."""
+        return await self.get_transport().get(url, params=params)
+
+    async def get_response(self, url: str, params: Dict) -> Response:
+        """Возвращает ответ от API."""
+        try:
+            response = await self.send_request(url, params)
+            response.raise_for_status()
+        except Exception as error:
+            raise exceptions.VkRequestError(error)
+        return response
+
+    async def run(self):
+        """Метод оркестратор."""
+        url = self.get_url()
+        params = self.get_params()
+        await self.get_rate_limiter().acquire_async(self.access_token)
+        response = await self.get_response(url, params)
+        data = self.dict_converting(response)
+        data = self.error_checking(data)
+        return data
+
+    async def get(self):
+        return await self.run()
+
+
+class Account(BaseApi, ads.Account):
+    pass
+
+
+class Clients(BaseApi, ads.Clients):
+    pass
+
+
+class Campaigns(BaseApi, ads.Campaigns):
+    pass
+
+
+class GetBudget(BaseApi, ads.GetBudget):
+    pass
+
+
+class Statistic(BaseApi, ads.Statistic):
+
+    async def get(self) -> Dict:
+        statistics = self.split()
+        if len(statistics) == 1:
+            return await self.run()
+        results = await bounded_gather(lambda statistic: statistic.run(),
+                                       statistics,
+                                       max_workers=ads.REQUESTS_PER_SECOND)
+        return {'response': [raw for data in results
+                             for raw in data['response']]}
+
+
+class Execute(BaseApi, ads.Execute):
+
+    async def send_request(self, url: str, params: Dict) -> Response:
+        """Код пачки может быть длинным, поэтому запрос отправляется POST."""
+        return await self.get_transport().post(url, data=params)
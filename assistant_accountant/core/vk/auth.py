@@ -1,6 +1,5 @@
-import requests
-
 from . import exceptions
+from ..transport import default_transport
 
 AUTH_URL = 'https://oauth.vk.com/authorize'
 ACCESS_TOKEN_URL = 'https://oauth.vk.com/access_token'
@@ -62,7 +61,7 @@ def get_access_token(
     :return: access_token, expires_in
     """
     try:
-        response = requests.get(ACCESS_TOKEN_URL, params={
+        response = default_transport().get(ACCESS_TOKEN_URL, params={
             'client_id': client_id,
             'client_secret': client_secret,
             'redirect_uri': redirect_uri,
@@ -20,3 +20,7 @@ class VkManyRequestPerSecondError(Exception):
 
 class VKMaxCountAttemptError(Exception):
     pass
+
+
+class VkExecuteLimitError(Exception):
+    pass
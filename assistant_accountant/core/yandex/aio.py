@@ -0,0 +1,231 @@
+import asyncio
+from time import monotonic
+from typing import (Any, AsyncIterator, Callable, Dict, Hashable, List,
+                    Optional, Tuple, Type)
+
+from asgiref.sync import sync_to_async
+
+from . import direct
+from ..aio import AsyncTransport, Response, default_async_transport
+
+
+class BaseApi(direct.BaseApi):
+    """
+    Асинхронный вариант direct.BaseApi.\n
+    URL, заголовки, payload и проверка ответа берутся из синхронных
+    классов, асинхронными становятся только запрос и методы, которые его
+    ждут. Клиент конкретного сервиса наследуется от этого класса и от
+    синхронного клиента сервиса:\n
+    class AgencyClients(BaseApi, direct.AgencyClients)\n
+    await AgencyClients(access_token=..., payload=...).get()
+    """
+    transport: AsyncTransport = None
+
+    def get_transport(self) -> AsyncTransport:
+        """HTTP транспорт: заданный экземпляру или общий для цикла."""
+        return self.transport or default_async_transport()
+
+    async def get_response(self, url, payload, headers) -> Response:
+        return await self.get_transport().post(
+            url,
+            str(payload),
+            headers=headers
+        )
+
+    async def api_request(
+            self,
+            url: str,
+            headers: Dict[str, str],
+            payload: direct.Payload
+    ) -> Response:
+        """
+        Запрос к API. Баллы пишутся в учет (общее хранилище) в потоке, не
+        блокируя цикл событий.
+        """
+        try:
+            response = await self.get_response(
+                url,
+                payload,
+                headers
+            )
+            await sync_to_async(self.accept_response,
+                                thread_sensitive=False)(response)
+        except Exception as error:
+            raise self.request_error(url, headers, payload, error)
+        return response
+
+    async def run_api_request(self) -> Dict:
+        """Оркестратор."""
+        payload = self.get_payload()
+        url = self.get_url()
+        headers = self.get_headers()
+        response = await self.api_request(url=url, headers=headers,
+                                          payload=payload)
+        response = self.api_response_decode(response)
+        response = self.check_response(response)
+        return response
+
+    async def get(self):
+        return await self.run_api_request()
+
+
+class AgencyClients(BaseApi, direct.AgencyClients):
+
+    async def get(self):
+        data = []
+        while True:
+            response = await self.run_api_request()
+            limited_by = response[self.RESULT_KEY].get(self.LIMITED_BY_KEY)
+            data += response.get(self.RESULT_KEY).get('Clients')
+            if not limited_by:
+                return data
+            self.change_offset(limited_by)
+
+
+class BaseReport(BaseApi, direct.BaseReport):
+
+    async def poll(self) -> Tuple[Optional[Dict], Optional[int]]:
+        """Один запрос к сервису отчетов без ожидания, см. direct."""
+        payload = self.get_payload()
+        url = self.get_url()
+        headers = self.get_headers()
+        response = await self.api_request(url=url,
+                                          headers=headers,
+                                          payload=payload)
+        return self.poll_result(response, headers, payload)
+
+    async def run_api_request(self) -> Dict:
+        """Ожидание отчета не блокирует цикл событий."""
+        while True:
+            response, retry_in = await self.poll()
+            if retry_in is None:
+                return response
+            await asyncio.sleep(retry_in)
+
+
+class ClientCostReport(BaseReport, direct.ClientCostReport):
+
+    def api_response_decode(self, response: Response):
+        """
+        Тело ответа уже прочитано транспортом, строки разбираются из него:
+        в отчете затрат одна строка на день.
+        """
+        return {'result': self.iter_rows(response.text.splitlines())}
+
+
+class Campaigns(BaseApi, direct.Campaigns):
+
+    async def iter_pages(self) -> AsyncIterator[List[Dict]]:
+        while True:
+            response = await self.run_api_request()
+            limited_by = response[self.RESULT_KEY].get(self.LIMITED_BY_KEY)
+            yield response.get(self.RESULT_KEY).get('Campaigns', [])
+            if not limited_by:
+                return
+            self.payload.change_offset(limited_by)
+
+    async def get(self):
+        data = []
+        async for page in self.iter_pages():
+            data += page
+        return {'result': data}
+
+
+class AccountManagement(BaseApi, direct.AccountManagement):
+    pass
+
+
+class ReportPoller:
+    """
+    Асинхронный вариант poller.ReportPoller с тем же интерфейсом.\n
+    Каждый отчет опрашивается своей корутиной, паузы retryIn ждет цикл
+    событий, в очереди API не более max_in_flight отчетов одновременно и
+    не более max_in_flight_per_group отчетов одной группы. stop
+    вызывается перед отправкой каждого отчета, исключение из него и ошибки
+    stop_on в on_result прерывают опрос.\n
+    poller = ReportPoller(max_in_flight=5)\n
+    poller.add(key, ClientCostReport(...))\n
+    results = await poller.run()
+    """
+
+    def __init__(
+            self,
+            max_in_flight: int = None,
+            max_in_flight_per_group: int = None,
+            group: Callable[[Hashable], Hashable] = None,
+            raise_errors: bool = True,
+            on_result: Callable[[Hashable, Dict], Any] = None,
+            clock: Callable[[], float] = monotonic,
+            stop: Callable[[], Any] = None,
+            stop_on: Tuple[Type[Exception], ...] = ()
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_group = max_in_flight_per_group
+        self.group = group
+        self.group_semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+        self.raise_errors = raise_errors
+        self.on_result = on_result
+        self.clock = clock
+        self.stop = stop
+        self.stop_on = stop_on
+        self.pending: List[Tuple[Hashable, BaseReport]] = []
+        self.results: Dict[Hashable, Dict] = {}
+        self.errors: Dict[Hashable, Exception] = {}
+        self.build_times: Dict[Hashable, float] = {}
+
+    def add(self, key: Hashable, report: BaseReport) -> None:
+        """Добавляет отчет в очередь на отправку."""
+        self.pending.append((key, report))
+
+    def group_semaphore(self, key: Hashable) -> asyncio.Semaphore:
+        group = None if self.group is None else self.group(key)
+        if group not in self.group_semaphores:
+            self.group_semaphores[group] = asyncio.Semaphore(
+                self.max_in_flight_per_group)
+        return self.group_semaphores[group]
+
+    async def poll_report(
+            self,
+            semaphore: asyncio.Semaphore,
+            key: Hashable,
+            report: BaseReport
+    ) -> None:
+        if self.max_in_flight_per_group is not None:
+            # Место группы занимается раньше общего: отчеты занятой группы
+            # не держат общие места.
+            async with self.group_semaphore(key):
+                await self.poll_in_flight(semaphore, key, report)
+        else:
+            await self.poll_in_flight(semaphore, key, report)
+
+    async def poll_in_flight(
+            self,
+            semaphore: asyncio.Semaphore,
+            key: Hashable,
+            report: BaseReport
+    ) -> None:
+        async with semaphore:
+            if self.stop is not None:
+                self.stop()
+            try:
+                submitted_at = self.clock()
+                data = await report.run_api_request()
+                self.build_times[key] = self.clock() - submitted_at
+                if self.on_result is None:
+                    self.results[key] = data
+                else:
+                    self.on_result(key, data)
+            except self.stop_on:
+                raise
+            except Exception as error:
+                self.errors[key] = error
+                if self.raise_errors:
+                    raise
+
+    async def run(self) -> Dict[Hashable, Dict]:
+        """Опрашивает отчеты до готовности всех. Возвращает {key: данные}."""
+        pending, self.pending = self.pending, []
+        semaphore = asyncio.Semaphore(self.max_in_flight or len(pending) or 1)
+        await asyncio.gather(*(self.poll_report(semaphore, key, report)
+                               for key, report in pending))
+        return self.results
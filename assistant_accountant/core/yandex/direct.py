@@ -1,13 +1,18 @@
 import json
+from datetime import date
+from decimal import Decimal
 from enum import Enum
 from time import sleep
-from typing import List, Dict, Tuple
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Tuple)
 
 import requests
 from http import HTTPStatus
 from requests import Response
 
 from . import exceptions
+from .units import Units, UnitsLedger, default_ledger
+from ..transport import Transport, default_transport
 
 
 class Endpoints(Enum):
@@ -26,20 +31,23 @@ def get_url_verification_code_request(client_id):
         'response_type': 'code',
         'client_id': client_id
     }
-    return requests.get(url, payload).url
+    return requests.Request('GET', url, params=payload).prepare().url
 
 
-def exchange_code_on_token(client_id, client_secret, code):
-    """Обмен кода подтверждения на токен."""
+def release(response: Response) -> None:
+    """
+    Дочитывает и закрывает ответ, запрошенный потоком: соединение
+    возвращается в пул keep-alive.
+    """
+    response.content
+    response.close()
+
+
+def token_request(data: Dict) -> Dict:
+    """Запрос к OAuth Яндекса за токеном."""
     url = 'https://oauth.yandex.ru/' + Endpoints.TOKEN.value
-    data = {
-        'grant_type': 'authorization_code',
-        'code': code,
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
     try:
-        response = requests.post(url, data=data)
+        response = default_transport().post(url, data=data)
     except Exception as error:
         raise exceptions.ExchangeCodeOnTokenError(error)
 
@@ -60,6 +68,26 @@ def exchange_code_on_token(client_id, client_secret, code):
     return response_json
 
 
+def exchange_code_on_token(client_id, client_secret, code):
+    """Обмен кода подтверждения на токен."""
+    return token_request({
+        'grant_type': 'authorization_code',
+        'code': code,
+        'client_id': client_id,
+        'client_secret': client_secret
+    })
+
+
+def refresh_token(client_id, client_secret, refresh_token):
+    """Обновление токена по refresh_token."""
+    return token_request({
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token,
+        'client_id': client_id,
+        'client_secret': client_secret
+    })
+
+
 class Payload:
 
     def __init__(self):
@@ -177,6 +205,12 @@ class BaseApi:
     URL = 'https://api.direct.yandex.com/'
     SANDBOX_URL = 'https://api-sandbox.direct.yandex.com/'
     VERSION_API = 'json/v5/'
+    UNITS_HEADER = 'Units'
+    UNITS_USED_LOGIN_HEADER = 'Units-Used-Login'
+    transport: Transport = None
+    units_ledger: UnitsLedger = None
+    # Логин клиента, от имени которого идет запрос (заголовок Client-Login).
+    client_login: str = None
 
     def __init__(
             self,
@@ -191,12 +225,35 @@ class BaseApi:
         self.on_sandbox = on_sandbox
         self.language = language
         self.status_code = None
+        self.units = None
 
     @property
     def endpoint_service(self) -> Endpoints:
         """Endpoint сервиса API."""
         raise NotImplementedError
 
+    def get_transport(self) -> Transport:
+        """HTTP транспорт: заданный экземпляру или общий для процесса."""
+        return self.transport or default_transport()
+
+    def get_units_ledger(self) -> UnitsLedger:
+        """Учет баллов API: заданный экземпляру или общий."""
+        return self.units_ledger or default_ledger()
+
+    def record_units(self, response: Response) -> None:
+        """
+        Сохраняет баллы из заголовка Units в учет. Баллы списываются с
+        логина из заголовка Units-Used-Login.
+        """
+        self.units = Units.parse(response.headers.get(self.UNITS_HEADER))
+        if self.units is None:
+            return
+        login = response.headers.get(self.UNITS_USED_LOGIN_HEADER)
+        self.get_units_ledger().record(
+            self.access_token, login, self.units,
+            client_login=self.client_login
+        )
+
     @property
     def headers(self) -> Dict[str, str]:
         """HTTP заголовки."""
@@ -239,7 +296,7 @@ class BaseApi:
         :param headers:
         :return: response
         """
-        return requests.post(
+        return self.get_transport().post(
             url,
             str(payload),
             headers=headers
@@ -259,24 +316,41 @@ class BaseApi:
             payload: Payload
     ) -> Response:
         """Запрос к API."""
+        response = None
         try:
             response = self.get_response(
                 url,
                 payload,
                 headers
             )
-            self.status_code = response.status_code
-            response.raise_for_status()
+            self.accept_response(response)
         except Exception as error:
-            raise exceptions.YandexDirectApiRequestError(
-                f'Api request error url: {url} '
-                f'payload: {payload} '
-                f'headers:  {headers} '
-                f'status_code: {self.status_code} '
-                f'error: {error}'
-            )
+            if response is not None:
+                release(response)
+            raise self.request_error(url, headers, payload, error)
         return response
 
+    def accept_response(self, response: Response) -> None:
+        """Статус и баллы ответа, ошибка HTTP статуса."""
+        self.status_code = response.status_code
+        self.record_units(response)
+        response.raise_for_status()
+
+    def request_error(
+            self,
+            url: str,
+            headers: Dict[str, str],
+            payload: Payload,
+            error: Exception
+    ) -> exceptions.YandexDirectApiRequestError:
+        return exceptions.YandexDirectApiRequestError(
+            f'Api request error url: {url} '
+            f'payload: {payload} '
+            f'headers:  {headers} '
+            f'status_code: {self.status_code} '
+            f'error: {error}'
+        )
+
     def check_response(self, response: Dict) -> Dict:
         """Проверка ответа от API директа."""
         if not isinstance(response, dict):
@@ -361,39 +435,61 @@ class BaseReport(BaseApi):
     def endpoint_service(self) -> Endpoints:
         return Endpoints.REPORTS
 
-    def run_api_request(self) -> Dict:
-        """Оркестратор."""
+    def get_retry_in(self, response: Response) -> int:
+        """Через сколько секунд API предлагает повторить запрос отчета."""
+        return int(response.headers.get(self.RETRY_IN_KEY, self.RETRY_IN))
+
+    def poll(self) -> Tuple[Optional[Dict], Optional[int]]:
+        """
+        Один запрос к сервису отчетов без ожидания.
+        Первый вызов ставит отчет в очередь, последующие проверяют его
+        готовность.
+        :return: (данные, None) если отчет готов,
+                 (None, retry_in) если отчет еще формируется.
+        """
         payload = self.get_payload()
         url = self.get_url()
         headers = self.get_headers()
+        response = self.api_request(url=url,
+                                    headers=headers,
+                                    payload=payload)
+        return self.poll_result(response, headers, payload)
+
+    def poll_result(
+            self,
+            response: Response,
+            headers: Dict[str, str],
+            payload: Payload
+    ) -> Tuple[Optional[Dict], Optional[int]]:
+        """Разбор ответа сервиса отчетов, см. poll."""
+        if response.status_code == HTTPStatus.OK:
+            # Отчет создан успешно
+            response = self.api_response_decode(response)
+            response = self.check_response(response)
+            return response, None
+        # Тело ответа без отчета не нужно, соединение возвращается в пул.
+        release(response)
+        if response.status_code in (HTTPStatus.CREATED, HTTPStatus.ACCEPTED):
+            # 201 - успешно поставлен в очередь в режиме offline,
+            # 202 - отчет формируется в режиме офлайн.
+            return None, self.get_retry_in(response)
+        raise exceptions.UnexpectedError(
+            f'endpoint: {self.endpoint_service} '
+            f'payload: {payload} ',
+            f'headers: {headers} ',
+            f'status_code: {self.status_code} ',
+        )
+
+    def run_api_request(self) -> Dict:
+        """
+        Оркестратор. Блокирует поток до готовности отчета, для
+        одновременного получения многих отчетов используется ReportPoller.
+        """
         while True:
-            response = self.api_request(url=url,
-                                        headers=headers,
-                                        payload=payload)
-            if response.status_code == HTTPStatus.OK:
-                # Отчет создан успешно
-                response = self.api_response_decode(response)
-                response = self.check_response(response)
+            response, retry_in = self.poll()
+            if retry_in is None:
                 return response
-            elif response.status_code == HTTPStatus.CREATED:
-                # успешно поставлен в очередь в режиме offline
-                retry_in = int(
-                    response.headers.get(self.RETRY_IN_KEY, self.RETRY_IN)
-                )
-                sleep(retry_in)
-            elif response.status_code == HTTPStatus.ACCEPTED:
-                # Отчет формируется в режиме офлайн
-                retry_in = int(
-                    response.headers.get(self.RETRY_IN_KEY, self.RETRY_IN)
-                )
-                sleep(retry_in)
-            else:
-                raise exceptions.UnexpectedError(
-                    f'endpoint: {self.endpoint_service} '
-                    f'payload: {payload} ',
-                    f'headers: {headers} ',
-                    f'status_code: {self.status_code} ',
-                )
+            sleep(retry_in)
 
 
 class ClientCostReport(BaseReport):
@@ -403,6 +499,22 @@ class ClientCostReport(BaseReport):
 
     COST_FIELD = 'Cost'
     CLICKS_FIELD = 'Clicks'
+    SEPARATOR = '\t'
+    EMPTY_VALUE = '--'
+    CHUNK_SIZE = 64 * 1024
+    FIELD_TYPES = {
+        'Date': date.fromisoformat,
+        'Cost': Decimal,
+        'AvgCpc': Decimal,
+        'AvgCpm': Decimal,
+        'Ctr': Decimal,
+        'Clicks': int,
+        'Impressions': int,
+        'Conversions': int,
+        'CampaignId': int,
+        'AdGroupId': int,
+        'AdId': int,
+    }
 
     def __init__(
             self,
@@ -425,23 +537,51 @@ class ClientCostReport(BaseReport):
         headers['returnMoneyInMicros'] = 'false'
         return headers
 
+    def get_response(self, url, payload, headers) -> Response:
+        """Тело отчета читается потоком в api_response_decode."""
+        return self.get_transport().post(
+            url,
+            str(payload),
+            headers=headers,
+            stream=True
+        )
+
+    def get_converters(self) -> List[Callable[[str], Any]]:
+        """Функции приведения типов для полей отчета в порядке колонок."""
+        return [self.FIELD_TYPES.get(field, str)
+                for field in self.payload.get_fields()]
+
+    def iter_rows(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Построчный разбор TSV отчета в словари с типизированными полями."""
+        fields = self.payload.get_fields()
+        converters = self.get_converters()
+        for line in lines:
+            if not line:
+                continue
+            values = line.split(self.SEPARATOR)
+            yield {
+                field: None if value == self.EMPTY_VALUE else convert(value)
+                for field, convert, value in zip(fields, converters, values)
+            }
+
     def api_response_decode(self, response):
+        """
+        Возвращает генератор строк отчета, тело ответа не загружается в
+        память целиком.
+        """
         response.encoding = 'utf-8'
-        result = []
-        if response.text:
-            metrics = response.text.replace('\n', '\t').split('\t')
-            fields = self.payload.get_fields()
-            raw = {}
-            i = 0
-            for metric_id in range(0, len(metrics)):
-                if i > len(fields) - 1:
-                    result.append(raw)
-                    raw = {}
-                    i = 0
-                current_field = fields[i]
-                raw[current_field] = metrics[metric_id]
-                i += 1
-        return {'result': result}
+        return {'result': self.iter_rows(self.iter_lines(response))}
+
+    def iter_lines(self, response: Response) -> Iterator[str]:
+        """
+        Строки тела ответа. Ответ закрывается, когда строки закончились или
+        генератор брошен (GeneratorExit).
+        """
+        try:
+            yield from response.iter_lines(chunk_size=self.CHUNK_SIZE,
+                                           decode_unicode=True)
+        finally:
+            response.close()
 
 
 class Campaigns(BaseApi):
@@ -469,17 +609,20 @@ class Campaigns(BaseApi):
         headers['Client-Login'] = self.client_login
         return headers
 
-    def get(self):
-        data = []
-        has_all_clients_received = False
-        while not has_all_clients_received:
+    def iter_pages(self) -> Iterator[List[Dict]]:
+        """Постраничная выдача кампаний, следующая страница по LimitedBy."""
+        while True:
             response = self.run_api_request()
             limited_by = response[self.RESULT_KEY].get(self.LIMITED_BY_KEY)
-            data += response.get(self.RESULT_KEY).get('Campaigns')
-            if limited_by:
-                self.payload.change_offset(limited_by)
-            else:
-                has_all_clients_received = True
+            yield response.get(self.RESULT_KEY).get('Campaigns', [])
+            if not limited_by:
+                return
+            self.payload.change_offset(limited_by)
+
+    def get(self):
+        data = []
+        for page in self.iter_pages():
+            data += page
         return {'result': data}
 
 
@@ -16,3 +16,7 @@ class ParamsAlreadyExistError(Exception):
 
 class UnexpectedError(Exception):
     pass
+
+
+class UnitsExhaustedError(Exception):
+    pass
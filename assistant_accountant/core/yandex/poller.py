@@ -0,0 +1,176 @@
+from collections import deque
+from enum import Enum
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+from .direct import BaseReport
+
+
+class ReportState(Enum):
+    QUEUED = 'queued'
+    BUILDING = 'building'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class PolledReport:
+    """Строка таблицы опроса: отчет, его состояние и время следующего
+    запроса."""
+
+    __slots__ = ('report', 'state', 'submitted_at', 'next_poll_at', 'polls')
+
+    def __init__(self, report: BaseReport, next_poll_at: float):
+        self.report = report
+        self.state = ReportState.QUEUED
+        self.submitted_at = next_poll_at
+        self.next_poll_at = next_poll_at
+        self.polls = 0
+
+
+class ReportPoller:
+    """
+    Опрос офлайн-отчетов API Яндекс директ без блокировки на каждом
+    отчете.\n
+    Отчеты ставятся в очередь не более max_in_flight одновременно, затем
+    опрашиваются по кругу, каждый не раньше чем через retryIn секунд,
+    которые вернуло API. Один поток обслуживает сотни отчетов.\n
+    Лимит API на офлайн-отчеты действует на рекламодателя (Client-Login):
+    group возвращает группу отчета по ключу, в очереди не больше
+    max_in_flight_per_group отчетов одной группы.\n
+    poller = ReportPoller(max_in_flight=5)\n
+    poller.add(key, ClientCostReport(...))\n
+    results = poller.run()\n
+    Если передан on_result, готовые отчеты сразу отдаются в него и не
+    накапливаются в results: так потоковое тело отчета читается, пока
+    остальные отчеты еще формируются. Ошибка в on_result считается ошибкой
+    отчета, кроме ошибок stop_on: они прерывают опрос (например, отмена
+    потокового сбора).\n
+    stop вызывается перед каждой отправкой и опросом отчета: исключение из
+    него прерывает опрос (отмена сбора).\n
+    build_times - время от постановки отчета в очередь до готовности.
+    """
+
+    def __init__(
+            self,
+            max_in_flight: int = None,
+            max_in_flight_per_group: int = None,
+            group: Callable[[Hashable], Hashable] = None,
+            raise_errors: bool = True,
+            on_result: Callable[[Hashable, Dict], Any] = None,
+            clock: Callable[[], float] = monotonic,
+            wait: Callable[[float], Any] = sleep,
+            stop: Callable[[], Any] = None,
+            stop_on: Tuple[Type[Exception], ...] = ()
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_group = max_in_flight_per_group
+        self.group = group
+        self.group_in_flight: Dict[Hashable, int] = {}
+        self.raise_errors = raise_errors
+        self.on_result = on_result
+        self.clock = clock
+        self.wait = wait
+        self.stop = stop
+        self.stop_on = stop_on
+        self.pending = deque()
+        self.table: Dict[Hashable, PolledReport] = {}
+        self.results: Dict[Hashable, Dict] = {}
+        self.errors: Dict[Hashable, Exception] = {}
+        self.build_times: Dict[Hashable, float] = {}
+
+    def add(self, key: Hashable, report: BaseReport) -> None:
+        """Добавляет отчет в очередь на отправку."""
+        self.pending.append((key, report))
+
+    def has_slot(self) -> bool:
+        return (self.max_in_flight is None
+                or len(self.table) < self.max_in_flight)
+
+    def group_of(self, key: Hashable) -> Hashable:
+        return None if self.group is None else self.group(key)
+
+    def has_group_slot(self, key: Hashable) -> bool:
+        return (self.max_in_flight_per_group is None
+                or self.group_in_flight.get(self.group_of(key), 0)
+                < self.max_in_flight_per_group)
+
+    def submit(self) -> None:
+        """
+        Переносит ожидающие отчеты в таблицу опроса, пока есть места.
+        Отчеты групп без свободных мест остаются в очереди в прежнем
+        порядке.
+        """
+        now = self.clock()
+        waiting = deque()
+        while self.pending and self.has_slot():
+            key, report = self.pending.popleft()
+            if not self.has_group_slot(key):
+                waiting.append((key, report))
+                continue
+            group = self.group_of(key)
+            self.group_in_flight[group] = (
+                self.group_in_flight.get(group, 0) + 1)
+            self.table[key] = PolledReport(report, next_poll_at=now)
+        waiting.extend(self.pending)
+        self.pending = waiting
+
+    def release(self, key: Hashable) -> None:
+        """Освобождает место группы готового или упавшего отчета."""
+        self.group_in_flight[self.group_of(key)] -= 1
+
+    def poll_one(self, key: Hashable) -> None:
+        """Один запрос статуса отчета и обновление строки таблицы."""
+        row = self.table.pop(key)
+        row.polls += 1
+        try:
+            data, retry_in = row.report.poll()
+            if retry_in is None:
+                self.build_times[key] = self.clock() - row.submitted_at
+                if self.on_result is None:
+                    self.results[key] = data
+                else:
+                    self.on_result(key, data)
+                row.state = ReportState.DONE
+                self.release(key)
+                return
+        except self.stop_on:
+            raise
+        except Exception as error:
+            row.state = ReportState.FAILED
+            self.release(key)
+            self.errors[key] = error
+            if self.raise_errors:
+                raise
+            return
+        row.state = ReportState.BUILDING
+        row.next_poll_at = self.clock() + retry_in
+        # Возвращается в конец таблицы: опрос идет по кругу.
+        self.table[key] = row
+
+    def check_stop(self) -> None:
+        if self.stop is not None:
+            self.stop()
+
+    def next_poll_in(self) -> Optional[float]:
+        """Сколько секунд до ближайшего запланированного опроса."""
+        if not self.table:
+            return None
+        next_poll_at = min(row.next_poll_at for row in self.table.values())
+        return max(0.0, next_poll_at - self.clock())
+
+    def run(self) -> Dict[Hashable, Dict]:
+        """Опрашивает отчеты до готовности всех. Возвращает {key: данные}."""
+        while self.pending or self.table:
+            self.check_stop()
+            self.submit()
+            now = self.clock()
+            due = [key for key, row in self.table.items()
+                   if row.next_poll_at <= now]
+            if not due:
+                self.wait(self.next_poll_in())
+                continue
+            for key in due:
+                self.check_stop()
+                self.poll_one(key)
+                self.submit()
+        return self.results
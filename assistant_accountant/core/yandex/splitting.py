@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from ..store import default_store
+
+
+def split_date_range(
+        date_from: date,
+        date_to: date,
+        days: int
+) -> List[Tuple[date, date]]:
+    """Делит период на последовательные куски не длиннее days дней."""
+    ranges = []
+    start = date_from
+    while start <= date_to:
+        end = min(start + timedelta(days=days - 1), date_to)
+        ranges.append((start, end))
+        start = end + timedelta(days=1)
+    return ranges
+
+
+class ChunkSizeEstimator:
+    """
+    Подбор длины куска периода для отчетов API Яндекс директ.\n
+    Время формирования отчета - постоянные накладные расходы на отчет и
+    время на каждую строку. Обе части оцениваются регрессией по прошлым
+    отчетам: в общем хранилище (его видят все воркеры) хранятся
+    скользящие средние строк, секунд и их произведений. Отчеты без строк
+    о стоимости строки ничего не говорят и не учитываются.\n
+    Число строк в день у каждого логина свое и тоже оценивается по его
+    прошлым отчетам. Длина куска в днях подбирается так, чтобы отчет
+    формировался за TARGET_BUILD_TIME секунд.
+    """
+    KEY = 'yandex_direct_report_build_time:{}'
+    ROWS_PER_DAY_KEY = 'yandex_direct_report_rows_per_day:{}:{}'
+    TIMEOUT = 30 * 24 * 60 * 60
+    TARGET_BUILD_TIME = 120
+    SMOOTHING = 0.3
+    DEFAULT_DAYS = 92
+    MIN_DAYS = 7
+    MAX_DAYS = 366
+
+    def __init__(self, report_type: str, store=None):
+        self.report_type = report_type
+        self.store = store
+
+    def get_store(self):
+        return self.store or default_store()
+
+    @property
+    def key(self) -> str:
+        return self.KEY.format(self.report_type)
+
+    def rows_per_day_key(self, login: str) -> str:
+        return self.ROWS_PER_DAY_KEY.format(self.report_type, login)
+
+    def smooth(
+            self,
+            current: Optional[Tuple[float, ...]],
+            value: Tuple[float, ...]
+    ) -> Tuple[float, ...]:
+        """Скользящее среднее с весом SMOOTHING нового значения."""
+        if current is None:
+            return value
+        return tuple(self.SMOOTHING * new + (1 - self.SMOOTHING) * old
+                     for new, old in zip(value, current))
+
+    def build_time_model(self) -> Optional[Tuple[float, float]]:
+        """
+        Оценка (секунды на отчет, секунды на строку) или None без данных.
+        Пока отчеты были одного размера, накладные расходы не отделить, и
+        все время относится к строкам.
+        """
+        moments = self.get_store().get(self.key)
+        if moments is None:
+            return None
+        rows, seconds, rows_squared, rows_seconds = moments
+        variance = rows_squared - rows * rows
+        if variance <= 1e-9 * rows_squared:
+            return 0.0, seconds / rows
+        per_row = max(0.0, (rows_seconds - rows * seconds) / variance)
+        overhead = max(0.0, seconds - per_row * rows)
+        return overhead, per_row
+
+    def seconds_per_row(self) -> Optional[float]:
+        model = self.build_time_model()
+        return None if model is None else model[1]
+
+    def observe(self, rows: int, seconds: float) -> None:
+        """Учитывает время формирования отчета с rows строками."""
+        if rows <= 0:
+            return
+        moments = self.smooth(self.get_store().get(self.key),
+                              (rows, seconds, rows * rows, rows * seconds))
+        self.get_store().set(self.key, moments, self.TIMEOUT)
+
+    def rows_per_day(self, login: str) -> Optional[float]:
+        """Оценка строк отчета логина в день или None без данных."""
+        return self.get_store().get(self.rows_per_day_key(login))
+
+    def observe_rows(self, login: str, rows: int, days: int) -> None:
+        """Учитывает число строк отчета логина за days дней."""
+        current = self.rows_per_day(login)
+        value, = self.smooth(None if current is None else (current,),
+                             (rows / days,))
+        self.get_store().set(self.rows_per_day_key(login), value,
+                             self.TIMEOUT)
+
+    def chunk_days(self, rows_per_day: float) -> int:
+        """
+        Длина куска периода в днях. Если накладные расходы отчета больше
+        целевого времени или строк нет, выгоднее самые длинные куски.
+        """
+        model = self.build_time_model()
+        if model is None:
+            return self.DEFAULT_DAYS
+        overhead, per_row = model
+        seconds_per_day = per_row * rows_per_day
+        budget = self.TARGET_BUILD_TIME - overhead
+        if seconds_per_day <= 0 or budget <= 0:
+            return self.MAX_DAYS
+        days = budget / seconds_per_day
+        return int(max(self.MIN_DAYS, min(days, self.MAX_DAYS)))
@@ -0,0 +1,121 @@
+from hashlib import sha256
+from time import time
+from typing import NamedTuple, Optional
+
+from ..store import default_store
+
+
+class Units(NamedTuple):
+    """
+    Баллы API из заголовка Units: израсходовано запросом, остаток и
+    суточный лимит. Формат заголовка: 10/20828/64000.
+    """
+    spent: int
+    remaining: int
+    limit: int
+
+    @classmethod
+    def parse(cls, header: Optional[str]) -> Optional['Units']:
+        if not header:
+            return None
+        try:
+            spent, remaining, limit = (int(part) for part in header.split('/'))
+        except ValueError:
+            return None
+        return cls(spent, remaining, limit)
+
+    @property
+    def fraction_left(self) -> float:
+        """Доля оставшихся баллов от суточного лимита."""
+        if not self.limit:
+            return 0.0
+        return self.remaining / self.limit
+
+
+class UnitsLedger:
+    """
+    Учет баллов API Яндекс директ по логинам и токенам в общем хранилище
+    (кэш Django/Redis), чтобы его видели все воркеры.\n
+    Запись обновляется после каждого ответа API, хранится сутки - период
+    восстановления баллов. Баллы списываются с логина из заголовка
+    Units-Used-Login: для запросов от имени клиента (Client-Login) это
+    может быть и клиент, и агентство, поэтому запоминается, с кого
+    списываются баллы клиента (charged).
+    """
+    KEY_PREFIX = 'yandex_direct_units'
+    TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, store=None):
+        self.store = store
+
+    def get_store(self):
+        return self.store or default_store()
+
+    def login_key(self, login: str) -> str:
+        return f'{self.KEY_PREFIX}:login:{login}'
+
+    def token_key(self, access_token: str) -> str:
+        token_hash = sha256(access_token.encode()).hexdigest()[:16]
+        return f'{self.KEY_PREFIX}:token:{token_hash}'
+
+    def charged_key(self, client_login: str) -> str:
+        return f'{self.KEY_PREFIX}:charged:{client_login}'
+
+    def record(
+            self,
+            access_token: str,
+            login: str,
+            units: Units,
+            client_login: str = None
+    ) -> None:
+        """
+        Сохраняет последние известные баллы логина, с которого они списаны.
+        Для запроса от имени клиента запоминается этот логин, для запроса
+        без Client-Login баллы сохраняются и как баллы токена.
+        """
+        value = (units.spent, units.remaining, units.limit, time())
+        store = self.get_store()
+        if login:
+            store.set(self.login_key(login), value, self.TIMEOUT)
+        if client_login:
+            if login:
+                store.set(self.charged_key(client_login), login,
+                          self.TIMEOUT)
+        else:
+            store.set(self.token_key(access_token), value, self.TIMEOUT)
+
+    def _units(self, key: str) -> Optional[Units]:
+        value = self.get_store().get(key)
+        if value is None:
+            return None
+        spent, remaining, limit, _ = value
+        return Units(spent, remaining, limit)
+
+    def get(self, login: str) -> Optional[Units]:
+        """Последние известные баллы логина или None."""
+        return self._units(self.login_key(login))
+
+    def get_token(self, access_token: str) -> Optional[Units]:
+        """Последние известные баллы по токену или None."""
+        return self._units(self.token_key(access_token))
+
+    def get_charged(
+            self,
+            access_token: str,
+            client_login: str
+    ) -> Optional[Units]:
+        """
+        Баллы, из которых оплачиваются запросы от имени клиента: логина из
+        последнего ответа по клиенту, для клиентов без запросов - токена.
+        """
+        login = self.get_store().get(self.charged_key(client_login))
+        if login is None:
+            return self.get_token(access_token)
+        return self.get(login)
+
+
+_default_ledger = UnitsLedger()
+
+
+def default_ledger() -> UnitsLedger:
+    return _default_ledger
@@ -10,7 +10,7 @@ admin.site.empty_value_display = 'NONE'
 
 @admin.register(models.Token)
 class TokenAdmin(admin.ModelAdmin):
-    list_display = ('source', 'user', 'expires_in')
+    list_display = ('source', 'user', 'expires_in', 'expires_at')
     list_filter = ('source',)
 
 
@@ -44,3 +44,9 @@ class StatisticByAgencyClientAdmin(admin.ModelAdmin):
     list_display = ('date', 'source', 'client')
     list_filter = ('source',)
     search_fields = ('client__name',)
+
+
+@admin.register(models.CollectionRun)
+class CollectionRunAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date_from', 'date_to', 'status', 'created')
+    list_filter = ('status',)
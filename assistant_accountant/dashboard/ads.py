@@ -1,42 +1,275 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
-from time import sleep
-from typing import List, Dict, Any
+from datetime import date, timedelta
+from queue import Queue
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import (List, Dict, Any, Callable, Iterable, Iterator,
+                    Optional, Set, Tuple)
 
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
 
-from .models import YANDEX_DIRECT, MY_TARGET, VK_ADS, Token
+from .models import YANDEX_DIRECT, MY_TARGET, VK_ADS, AgencyClient, Token
+from .records import BalanceSnapshot, ClientRecord, DailyCost, to_minor
+from .report_cache import ReportCache
+from .tokens import TokenService
+from core.concurrency import bounded_map, with_retry
+from core.store import default_store
 from core.yandex import direct as yandex_direct
+from core.yandex.exceptions import (UnitsExhaustedError,
+                                    YandexDirectApiRequestError,
+                                    YandexDirectResponseError)
+from core.yandex.poller import ReportPoller
+from core.yandex.splitting import ChunkSizeEstimator, split_date_range
+from core.yandex.units import Units, default_ledger
 from core.vk import ads as vk_ads
 from core.vk.exceptions import (VkFloodControlError,
                                 VkManyRequestPerSecondError,
                                 VKMaxCountAttemptError)
 from core.my_target import ads as my_target_ads
-from core.my_target import auth as my_target_auth
 from core.my_target.exceptions import (MyTargetExpiredTokenError,
                                        MyTargetMaxAttemptCountError)
 
 
-def get(user_id: int, date_from: str, date_to: str) -> List[Dict]:
-    """Format date_from, date_to %Y-%d-%m ."""
-    yandex = YandexCollectData(user_id, date_from, date_to)
-    vk = VKCollectData(user_id, date_from, date_to)
-    my_target = MyTargetCollectData(user_id, date_from, date_to)
-    cabinets = [yandex, my_target, vk]
-    data = []
-    for cabinet in cabinets:
-        api = API(cabinet)
-        data += api.collect_data_ads()
-    return data
+# Список клиентов источника, общий для частей запуска сбора.
+ROSTER_KEY = 'collection_run_roster:{}:{}'
+ROSTER_WAIT = 5 * 60
+ROSTER_POLL_INTERVAL = 1
+
+
+def stream_collector(collector: 'Ads') -> 'RecordStream':
+    """Поток записей клиентов одного коллектора для WriteDB."""
+    def collect_records(sink):
+        collector.sink = sink
+        try:
+            return {'data': collector.get(), 'sources': {}}
+        finally:
+            connections.close_all()
+
+    stream = RecordStream(collect_records,
+                          maxsize=settings.ADS_RECORDS_QUEUE_SIZE)
+    # Остановка потребителя прерывает сбор между запросами к API.
+    collector.cancelled = stream.cancelled
+    return stream
+
+
+class StreamCancelledError(Exception):
+    pass
+
+
+class RecordStream:
+    """
+    Записи клиентов от коллекторов к потребителю (WriteDB) через
+    ограниченную очередь. Сбор идет в фоновом потоке, коллекторы ждут на
+    полной очереди, пока потребитель не догонит: в памяти не больше maxsize
+    готовых записей, и они пишутся в БД, пока сбор продолжается.\n
+    Если потребитель остановился (ошибка, брошенный итератор, мягкий
+    лимит времени таски), устанавливается cancelled: sink и следующий
+    запрос коллектора к API (Ads.check_cancelled) бросают
+    StreamCancelledError, очередь дочитывается до конца сбора и поток
+    завершается.\n
+    После итерации result - результат collect (статусы источников).
+    """
+    DONE = object()
+
+    def __init__(
+            self,
+            collect: Callable[[Callable[[ClientRecord], None]],
+                              Dict[str, Any]],
+            maxsize: int
+    ):
+        self.collect = collect
+        self.queue = Queue(maxsize=maxsize)
+        self.cancelled = Event()
+        self.result = None
+        self.error = None
+
+    def put(self, record: ClientRecord) -> None:
+        """Sink коллекторов."""
+        if self.cancelled.is_set():
+            raise StreamCancelledError('Record stream consumer stopped')
+        self.queue.put(record)
+
+    def run(self) -> None:
+        try:
+            self.result = self.collect(self.put)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.queue.put(self.DONE)
+
+    def __iter__(self) -> Iterator[ClientRecord]:
+        thread = Thread(target=self.run, daemon=True)
+        thread.start()
+        finished = False
+        try:
+            while True:
+                record = self.queue.get()
+                if record is self.DONE:
+                    finished = True
+                    break
+                yield record
+        finally:
+            if not finished:
+                # Освобождает поток, ждущий на полной очереди.
+                self.cancelled.set()
+                while self.queue.get() is not self.DONE:
+                    pass
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        # Записи источников, не отданные потоком (без sink).
+        yield from self.result['data']
 
 
 class Ads(ABC):
+    SOURCE = None
+    # Ключ записи клиента в self.data.
+    DATA_KEY = 'client_id'
+    # Потребитель готовых записей, задается потоковым сбором
+    # (stream_collector).
+    sink: Callable[[ClientRecord], None] = None
+    # Отбор клиентов при сборе частями (tasks.collect_source_spending).
+    client_ids: Set[int] = None
+    exclude_client_ids: Set[int] = None
+    # Ключ списка клиентов запуска в общем хранилище (share_roster).
+    roster_key: str = None
+    # Отмена сбора, задается потоковым сбором (stream_collector).
+    cancelled: Event = None
 
-    def current_date(self):
-        return datetime.now().strftime('%Y-%m-%d')
+    def select_clients(
+            self,
+            client_ids: Iterable[int] = None,
+            exclude_client_ids: Iterable[int] = None
+    ) -> None:
+        """Собирать только client_ids и/или всех, кроме exclude_client_ids."""
+        if client_ids is not None:
+            self.client_ids = set(client_ids)
+        if exclude_client_ids is not None:
+            self.exclude_client_ids = set(exclude_client_ids)
+
+    def share_roster(self, run_id: int) -> None:
+        """
+        Список клиентов источника загружается из API один раз на запуск
+        сбора и берется всеми его частями из общего хранилища.
+        """
+        self.roster_key = ROSTER_KEY.format(run_id, self.SOURCE)
+
+    def cached_roster(self, fetch: Callable[[], Any]) -> Any:
+        """
+        Результат fetch, общий для частей запуска. Загружает его одна
+        часть, остальные ждут до ROSTER_WAIT секунд и загружают сами, если
+        он так и не появился.
+        """
+        if self.roster_key is None:
+            return fetch()
+        store = default_store()
+        lock_key = f'{self.roster_key}:lock'
+        deadline = monotonic() + ROSTER_WAIT
+        while True:
+            roster = store.get(self.roster_key)
+            if roster is not None:
+                return roster
+            if store.add(lock_key, 1, ROSTER_WAIT):
+                break
+            if monotonic() >= deadline:
+                break
+            self.pause(ROSTER_POLL_INTERVAL)
+        try:
+            roster = fetch()
+        except Exception:
+            store.delete(lock_key)
+            raise
+        store.set(self.roster_key, roster,
+                  settings.COLLECTION_RUN_STALE_AFTER)
+        return roster
+
+    def shared_roster(self) -> Any:
+        """Список клиентов, уже загруженный другой частью запуска."""
+        if self.roster_key is None:
+            return None
+        return default_store().get(self.roster_key)
+
+    def check_cancelled(self) -> None:
+        """
+        Бросает StreamCancelledError, если потребитель записей остановился
+        (ошибка записи, мягкий лимит времени таски). Вызывается перед
+        каждым запросом к API.
+        """
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise StreamCancelledError('Record stream consumer stopped')
+
+    def pause(self, seconds: float) -> None:
+        """Пауза перед повтором запроса, прерывается отменой сбора."""
+        if self.cancelled is None:
+            sleep(seconds)
+        else:
+            self.cancelled.wait(seconds)
+        self.check_cancelled()
+
+    def is_selected(self, client_id: int) -> bool:
+        if self.client_ids is not None and client_id not in self.client_ids:
+            return False
+        return (self.exclude_client_ids is None
+                or client_id not in self.exclude_client_ids)
+
+    def current_date(self) -> date:
+        return date.today()
+
+    def make_cache(
+            self,
+            force_refresh: bool,
+            incremental: bool = False
+    ) -> ReportCache:
+        return ReportCache(self.user_id, self.SOURCE, self.date_from,
+                           self.date_to, force=force_refresh,
+                           incremental=incremental)
+
+    def mark_collected(self, records: List[ClientRecord]) -> None:
+        """
+        Отмечает, что статистика клиентов собрана за весь период: после
+        записи в БД закрытые дни периода попадут в кэш. В записях только
+        дни, запрошенные у API: закрытые дни из кэша уже есть в БД и
+        повторно не пишутся.
+        """
+        for record in records:
+            fetch_from = self.cache.fetch_from(record.client_id)
+            record.stats_period = (fetch_from or self.date_from,
+                                   self.date_to)
+
+    def emit_collected(self, clients_id: Iterable[int]) -> None:
+        """
+        Отмечает собранными и отдает в sink записи клиентов, статистика
+        которых уже получена, не дожидаясь остальных клиентов.
+        """
+        records = [self.data[client_id] for client_id in clients_id
+                   if client_id in self.data]
+        self.mark_collected(records)
+        self.emit(records)
+
+    @property
+    def postponed(self) -> bool:
+        """
+        Часть клиентов отложена до восстановления лимитов API: их записи
+        не отдаются, сбор нужно повторить позже.
+        """
+        return False
+
+    def emit(self, records: List[ClientRecord]) -> None:
+        """
+        Отдает готовые записи в sink и удаляет их из self.data, так память
+        коллектора не растет с числом клиентов. Без sink записи остаются в
+        self.data и возвращаются get.
+        """
+        if self.sink is None:
+            return
+        for record in list(records):
+            self.data.pop(getattr(record, self.DATA_KEY), None)
+            self.sink(record)
 
     @abstractmethod
-    def get(self) -> List[Dict]:
+    def get(self) -> List[ClientRecord]:
         ...
 
 
@@ -50,22 +283,64 @@ class API:
 
 
 class YandexCollectData(Ads):
+    SOURCE = YANDEX_DIRECT
+    # Клиенты API и поллер отчетов, aio_ads подставляет асинхронные.
+    api = yandex_direct
+    poller_class = ReportPoller
+    DATA_KEY = 'name'
     LIMIT = 2000
     CAMPAIGNS_LIMIT = 10000
     METHOD = 'get'
+    # Ограничение API на число отчетов рекламодателя (Client-Login),
+    # одновременно стоящих в очереди на формирование в режиме офлайн.
+    MAX_REPORTS_IN_FLIGHT = 5
+    # Доля суточного лимита баллов API, которая оставляется на приоритетные
+    # запросы (клиенты, балансы). Отчеты логинов с меньшим остатком
+    # откладываются, приоритетные запросы - только когда баллы кончились.
+    UNITS_RESERVE = 0.1
+    REPORT_NAME = 'ACCOUNT_COST'
+    REPORT_TYPE = 'ACCOUNT_PERFORMANCE_REPORT'
+    # Число строк отчета за день для логинов без прошлых отчетов: не больше
+    # одной строки на дату.
+    REPORT_ROWS_PER_DAY = 1
+    REPORT_ATTEMPTS = 3
+    ACCOUNT_MANAGEMENT_CONCURRENCY = 5
+    ACCOUNT_MANAGEMENT_ATTEMPTS = 3
+    ACCOUNT_MANAGEMENT_RETRY_DELAY = 5
 
     def __init__(
             self, user_id: int,
             date_from: str,
             date_to: str,
-            on_sandbox=False
+            on_sandbox=False,
+            reports_concurrency: int = None,
+            reports_total: int = None,
+            incremental_clients: bool = True,
+            force_refresh: bool = False,
+            incremental: bool = False
     ):
+        if reports_concurrency is None:
+            reports_concurrency = settings.YANDEX_DIRECT_REPORTS_CONCURRENCY
+        self.reports_concurrency = max(
+            1, min(reports_concurrency, self.MAX_REPORTS_IN_FLIGHT)
+        )
+        if reports_total is None:
+            reports_total = settings.YANDEX_DIRECT_REPORTS_TOTAL
+        self.reports_total = max(1, reports_total)
+        self.incremental_clients = incremental_clients
         self.on_sandbox = on_sandbox
         self.user_id = user_id
         self.date_from = date_from
         self.date_to = date_to
-        self.tokens = Token.objects.get(user__pk=self.user_id,
-                                        source__name=YANDEX_DIRECT)
+        self.tokens = TokenService().ensure_fresh(
+            Token.objects.get(user__pk=self.user_id,
+                              source__name=YANDEX_DIRECT)
+        )
+        self.units_ledger = default_ledger()
+        self.postponed_logins = []
+        self.cache = self.make_cache(force_refresh, incremental)
+        self.chunk_estimator = ChunkSizeEstimator(self.REPORT_TYPE)
+        self.chunk_observations = []
         self.data = {}
 
     def agency_clients_payload(self) -> yandex_direct.Payload:
@@ -77,13 +352,22 @@ class YandexCollectData(Ads):
             method=self.METHOD
         )
 
-    def statistic_payload(self) -> yandex_direct.Payload:
+    def statistic_payload(
+            self,
+            date_from: str = None,
+            date_to: str = None
+    ) -> yandex_direct.Payload:
+        date_from = date_from or self.date_from
+        date_to = date_to or self.date_to
+        # Имя отчета уникально для периода: API не принимает отчет с
+        # именем уже поставленного в очередь отчета и другими параметрами.
+        report_name = f'{self.REPORT_NAME}_{date_from}_{date_to}'
         payload = yandex_direct.Payload.payload_statistic(
             fields=['Date', 'Cost'],
-            criteria={'DateFrom': self.date_from, 'DateTo': self.date_to},
+            criteria={'DateFrom': date_from, 'DateTo': date_to},
             params=[
-                ('ReportName', 'ACCOUNT_COST'),
-                ('ReportType', 'ACCOUNT_PERFORMANCE_REPORT'),
+                ('ReportName', report_name),
+                ('ReportType', self.REPORT_TYPE),
                 ('DateRangeType', 'CUSTOM_DATE'),
                 ('Format', 'TSV'),
                 ('IncludeVAT', 'NO'),
@@ -105,244 +389,731 @@ class YandexCollectData(Ads):
         for raw in ag_data:
             client_id = raw['ClientId']
             login = raw['Login']
-            self.data[login] = {
-                'name': raw['Login'],
-                'source': YANDEX_DIRECT,
-                'user_id': self.user_id,
-                'client_id': client_id,
-                'stats': [],
-                'balance': {
-                    'amount': 0.0,
-                    'date': self.current_date()
-                }
-            }
-
-    def prepare_statistic(self, stat_data: Dict, login: str):
+            if not self.is_selected(client_id):
+                continue
+            self.data[login] = ClientRecord(
+                source=YANDEX_DIRECT,
+                user_id=self.user_id,
+                client_id=client_id,
+                name=login,
+                balance=BalanceSnapshot(0, self.current_date())
+            )
+
+    def prepare_statistic(self, stat_data: Dict, login: str) -> int:
+        """
+        Добавляет строки отчета в статистику логина, строки за уже
+        имеющиеся даты пропускаются. Возвращает число строк отчета.
+        """
+        stats = self.data[login].stats
+        dates = {stat.date for stat in stats}
+        rows = 0
         for raw in stat_data['result']:
-            self.data[login]['stats'].append({
-                'cost': raw['Cost'],
-                'date': raw['Date']
-            })
+            rows += 1
+            stat = DailyCost.parse(raw['Date'], raw['Cost'])
+            if stat.date in dates:
+                continue
+            dates.add(stat.date)
+            stats.append(stat)
+        return rows
 
     def prepare_account_management(self, acc_management_data):
         for account_data in acc_management_data['data']['Accounts']:
             login = account_data['Login']
-            self.data[login]['balance']['amount'] = float(
+            self.data[login].balance.amount = to_minor(
                 account_data['Amount'])
 
     def api_request(self, yandex_api: yandex_direct.BaseApi):
+        self.check_cancelled()
         return yandex_api.get()
 
     def get_data(self):
         return list(self.data.values())
 
+    @property
+    def postponed(self) -> bool:
+        return bool(self.postponed_logins)
+
+    def postpone(self, logins: Iterable[str]) -> None:
+        """
+        Откладывает логины: их записи удаляются из self.data, не отдаются
+        и не отмечаются собранными.
+        """
+        for login in logins:
+            self.data.pop(login, None)
+            self.postponed_logins.append(login)
+
+    def token_units_exhausted(self) -> bool:
+        """Кончились баллы токена: клиенты и балансы не запросить."""
+        units = self.units_ledger.get_token(self.tokens.access_token)
+        return units is not None and units.remaining <= 0
+
+    def report_units(self, login: str) -> Optional[Units]:
+        """Баллы, из которых оплачиваются отчеты логина."""
+        return self.units_ledger.get_charged(self.tokens.access_token, login)
+
+    def clients_sync_required(self) -> bool:
+        """Нужна ли полная загрузка клиентов агентства из API."""
+        if not self.incremental_clients:
+            return True
+        synced_at = self.tokens.clients_synced_at
+        if synced_at is None:
+            return True
+        interval = timedelta(
+            hours=settings.YANDEX_DIRECT_CLIENTS_SYNC_INTERVAL)
+        return timezone.now() - synced_at >= interval
+
+    def stored_agency_clients(self) -> List[Dict]:
+        """Сохраненные клиенты агентства в формате ответа AgencyClients."""
+        clients = AgencyClient.objects.filter(
+            user__pk=self.user_id,
+            source__name=YANDEX_DIRECT
+        ).values_list('name', 'client_id')
+        return [{'Login': login, 'ClientId': client_id}
+                for login, client_id in clients]
+
+    def use_stored_agency_clients(self) -> bool:
+        """
+        Берет сохраненных клиентов, если полная загрузка не нужна или
+        кончились баллы токена. Возвращает, взяты ли клиенты.
+        """
+        exhausted = self.token_units_exhausted()
+        if exhausted or not self.clients_sync_required():
+            ag_data = self.stored_agency_clients()
+            if ag_data:
+                self.prepare_agency_clients(ag_data)
+                return True
+        if exhausted:
+            raise UnitsExhaustedError(
+                f'No API units left to load agency clients, '
+                f'user_id: {self.user_id}'
+            )
+        return False
+
     def agency_clients(self):
-        agency_clients = yandex_direct.AgencyClients(
+        """
+        Список клиентов агентства. В инкрементальном режиме используются
+        сохраненные клиенты, пока не прошел интервал полной загрузки
+        YANDEX_DIRECT_CLIENTS_SYNC_INTERVAL. Полный список загружается из
+        API один раз на запуск сбора (share_roster), части запуска берут
+        уже загруженный список.
+        """
+        roster = self.shared_roster()
+        if roster is not None:
+            self.prepare_agency_clients(roster)
+            return
+        if self.use_stored_agency_clients():
+            return
+        ag_data = self.cached_roster(self.fetch_roster)
+        self.synced_agency_clients(ag_data)
+
+    def fetch_roster(self) -> List[Dict]:
+        return self.api_request(self.agency_clients_api())
+
+    def agency_clients_api(self) -> yandex_direct.AgencyClients:
+        return self.api.AgencyClients(
             access_token=self.tokens.access_token,
             payload=self.agency_clients_payload(),
             on_sandbox=self.on_sandbox)
-        ag_data = self.api_request(agency_clients)
+
+    def synced_agency_clients(self, ag_data) -> None:
+        """Разбирает полный список клиентов и запоминает время загрузки."""
         self.prepare_agency_clients(ag_data)
+        self.tokens.clients_synced_at = timezone.now()
+        self.tokens.save(update_fields=['clients_synced_at'])
+
+    def client_statistic(
+            self,
+            login: str,
+            date_from: str = None,
+            date_to: str = None
+    ) -> yandex_direct.ClientCostReport:
+        return self.api.ClientCostReport(
+            access_token=self.tokens.access_token,
+            client_login=login,
+            payload=self.statistic_payload(date_from, date_to),
+            on_sandbox=False
+        )
+
+    def statistic_ranges(
+            self,
+            login: str,
+            date_from: str
+    ) -> List[Tuple[str, str]]:
+        """
+        Делит период отчета на куски, длина которых подобрана по времени
+        формирования прошлых отчетов и числу строк в день у логина.
+        """
+        rows_per_day = self.chunk_estimator.rows_per_day(login)
+        if rows_per_day is None:
+            rows_per_day = self.REPORT_ROWS_PER_DAY
+        days = self.chunk_estimator.chunk_days(rows_per_day)
+        ranges = split_date_range(date.fromisoformat(date_from),
+                                  date.fromisoformat(self.date_to), days)
+        return [(start.isoformat(), end.isoformat())
+                for start, end in ranges]
+
+    def order_by_units(self, logins: List[str]) -> List[str]:
+        """
+        Упорядочивает логины по остатку баллов API, из которых оплачиваются
+        их отчеты (report_units): сначала логины без данных в учете и с
+        большим остатком. Логины, у которых остаток ниже резерва
+        UNITS_RESERVE, откладываются (postpone).
+        """
+        ordered = []
+        postponed = []
+        for login in logins:
+            units = self.report_units(login)
+            if units is not None and units.fraction_left < self.UNITS_RESERVE:
+                postponed.append(login)
+                continue
+            remaining = float('inf') if units is None else units.remaining
+            ordered.append((remaining, login))
+        self.postpone(postponed)
+        ordered.sort(key=lambda item: item[0], reverse=True)
+        return [login for _, login in ordered]
+
+    def statistic_chunks(self) -> Tuple[List[Tuple[str, str, str]],
+                                        Dict[str, int]]:
+        """
+        Куски отчетов (login, date_from, date_to) и число кусков каждого
+        логина. Логины, у которых все дни есть в кэше, сразу отдаются.
+        """
+        chunks = []
+        pending = {}
+        logins = [record.name for record in self.get_data()]
+        for login in self.order_by_units(logins):
+            fetch_from = self.cache.fetch_from(self.data[login].client_id)
+            if fetch_from is None:
+                self.mark_collected([self.data[login]])
+                self.emit([self.data[login]])
+                continue
+            ranges = self.statistic_ranges(login, fetch_from)
+            chunks += [(login, *date_range) for date_range in ranges]
+            pending[login] = len(ranges)
+        return chunks, pending
+
+    @staticmethod
+    def chunk_login(chunk: Tuple[str, str, str]) -> str:
+        return chunk[0]
+
+    def statistic_result(
+            self,
+            pending: Dict[str, int],
+            chunk: Tuple[str, str, str],
+            stat_data: Dict,
+            build_time: float
+    ) -> None:
+        """
+        Разбирает готовый кусок, запись логина отдается с последним. Время
+        формирования запоминается и пишется в хранилище observe_chunks.
+        """
+        login, date_from, date_to = chunk
+        rows = self.prepare_statistic(stat_data=stat_data, login=login)
+        days = (date.fromisoformat(date_to)
+                - date.fromisoformat(date_from)).days + 1
+        self.chunk_observations.append((login, rows, days, build_time))
+        pending[login] -= 1
+        if not pending[login]:
+            self.mark_collected([self.data[login]])
+            self.emit([self.data[login]])
+
+    def observe_chunks(self) -> None:
+        """Передает оценщику размера кусков время готовых отчетов."""
+        observations, self.chunk_observations = self.chunk_observations, []
+        for login, rows, days, build_time in observations:
+            self.chunk_estimator.observe(rows, build_time)
+            self.chunk_estimator.observe_rows(login, rows, days)
+
+    def statistic_poller(
+            self,
+            chunks: List[Tuple[str, str, str]],
+            pending: Dict[str, int]
+    ) -> ReportPoller:
+        """Поллер кусков, готовый кусок сразу разбирает statistic_result."""
+        def on_result(chunk, stat_data):
+            self.statistic_result(pending, chunk, stat_data,
+                                  poller.build_times[chunk])
+
+        poller = self.poller_class(
+            max_in_flight=self.reports_total,
+            max_in_flight_per_group=self.reports_concurrency,
+            group=self.chunk_login,
+            raise_errors=False,
+            on_result=on_result,
+            stop=self.check_cancelled,
+            stop_on=(StreamCancelledError,)
+        )
+        for chunk in chunks:
+            poller.add(chunk, self.client_statistic(*chunk))
+        return poller
+
+    def failed_chunks(
+            self,
+            poller: ReportPoller,
+            attempt: int
+    ) -> List[Tuple[str, str, str]]:
+        """Куски для повтора, после REPORT_ATTEMPTS - ошибка первого."""
+        chunks = list(poller.errors)
+        if chunks and attempt + 1 == self.REPORT_ATTEMPTS:
+            raise poller.errors[chunks[0]]
+        return chunks
 
     def statistic(self):
-        for data_raw in self.get_data():
-            statistic = yandex_direct.ClientCostReport(
-                access_token=self.tokens.access_token,
-                client_login=data_raw['name'],
-                payload=self.statistic_payload(),
-                on_sandbox=False
-            )
-            stat_data = self.api_request(statistic)
-            self.prepare_statistic(stat_data=stat_data,
-                                   login=data_raw['name'])
+        """
+        Период отчета каждого клиента делится на куски, все куски ставятся
+        в очередь и опрашиваются одним потоком, в очереди не более
+        reports_concurrency отчетов логина и reports_total отчетов всего
+        одновременно. Готовый отчет сразу
+        разбирается в данные своего логина. Упавшие куски запрашиваются
+        повторно, до REPORT_ATTEMPTS раз. Закрытые дни, которые уже есть в
+        кэше, у API не запрашиваются.
+        """
+        chunks, pending = self.statistic_chunks()
+        try:
+            for attempt in range(self.REPORT_ATTEMPTS):
+                if not chunks:
+                    return
+                poller = self.statistic_poller(chunks, pending)
+                poller.run()
+                chunks = self.failed_chunks(poller, attempt)
+        finally:
+            self.observe_chunks()
 
-    def account_management(self):
+    def chunk_account_management(
+            self,
+            payload: yandex_direct.PayloadV4
+    ) -> Dict:
+        return self.api_request(self.account_management_api(payload))
+
+    def account_management_api(
+            self,
+            payload: yandex_direct.PayloadV4
+    ) -> yandex_direct.AccountManagement:
+        return self.api.AccountManagement(
+            access_token=self.tokens.access_token,
+            payload=payload,
+        )
+
+    def account_management_retry(self) -> Dict[str, Any]:
+        """Параметры with_retry для запроса пачки балансов."""
+        return {
+            'attempts': self.ACCOUNT_MANAGEMENT_ATTEMPTS,
+            'retry_on': (YandexDirectApiRequestError,
+                         YandexDirectResponseError),
+            'delay': self.ACCOUNT_MANAGEMENT_RETRY_DELAY
+        }
+
+    def account_management_logins(self) -> List[str]:
+        """Логины для запроса балансов, без баллов токена все откладываются."""
         logins = list(self.data.keys())
-        for payload in self.account_management_payload(logins):
-            account_management = yandex_direct.AccountManagement(
-                access_token=self.tokens.access_token,
-                payload=payload,
-            )
-            data = self.api_request(account_management)
+        if self.token_units_exhausted():
+            self.postpone(logins)
+            return []
+        return logins
+
+    def account_management(self):
+        """
+        Балансы запрашиваются пачками логинов параллельно, не более
+        ACCOUNT_MANAGEMENT_CONCURRENCY одновременно. Ошибка пачки повторяется
+        только для нее, результаты разбираются в порядке пачек.
+        """
+        logins = self.account_management_logins()
+        request = with_retry(self.chunk_account_management,
+                             **self.account_management_retry())
+        chunks_data = bounded_map(request,
+                                  self.account_management_payload(logins),
+                                  self.ACCOUNT_MANAGEMENT_CONCURRENCY)
+        for data in chunks_data:
             self.prepare_account_management(data)
 
-    def get(self) -> List[Dict]:
+    def get(self) -> List[ClientRecord]:
+        """
+        Балансы запрашиваются до отчетов: запись логина готова, как только
+        готова его статистика, и сразу отдается в sink (emit).
+        """
         self.agency_clients()
-        self.statistic()
         self.account_management()
+        self.statistic()
+        self.emit(self.get_data())
         return self.get_data()
 
 
 class VKCollectData(Ads):
+    """
+    Частота запросов ограничивается до отправки (core.ratelimit), паузы
+    FLOOD_TIMEOUT и REQUEST_PER_SECOND_TIMEOUT - крайняя мера, если лимит
+    все же превышен, например другим клиентом того же токена.
+    """
+    SOURCE = VK_ADS
+    # Клиенты API, aio_ads подставляет асинхронные.
+    api = vk_ads
     FLOOD_TIMEOUT = 60
     REQUEST_PER_SECOND_TIMEOUT = 20
-    MAX_COUNT_ATTEMPT = 10
+    MAX_COUNT_ATTEMPT = 3
+    MAX_ACCOUNTS_CONCURRENCY = 5
+    # Ошибки лимитов запросов, после которых запрос повторяется.
+    RETRY_ERRORS = (VkFloodControlError, VkManyRequestPerSecondError)
 
-    def __init__(self, user_id: int, date_from: str, date_to: str):
+    def __init__(
+            self,
+            user_id: int,
+            date_from: str,
+            date_to: str,
+            force_refresh: bool = False,
+            accounts_concurrency: int = None,
+            incremental: bool = False
+    ):
         self.user_id = user_id
         self.date_from = date_from
         self.date_to = date_to
         self.tokens = Token.objects.get(user=self.user_id,
                                         source__name=VK_ADS)
+        self.cache = self.make_cache(force_refresh, incremental)
+        if accounts_concurrency is None:
+            accounts_concurrency = settings.VK_ADS_ACCOUNTS_CONCURRENCY
+        self.accounts_concurrency = max(
+            1, min(accounts_concurrency, self.MAX_ACCOUNTS_CONCURRENCY)
+        )
+        self.lock = Lock()
+        self.clients_id = set()
         self.data = {}
 
     def prepare_agency_clients(self, account_id, data):
         for raw in data['response']:
             client_id = raw['id']
-            if self.data.get(client_id):
+            # Записи уходят из self.data после emit, поэтому повторы
+            # проверяются по всем полученным client_id.
+            if client_id in self.clients_id:
                 raise ValueError(
                     'client_id already exists: {}'.format(client_id))
-            self.data[client_id] = {
-                'stats': [],
-                'name': raw['name'],
-                'client_id': client_id,
-                'user_id': self.user_id,
-                'account_id': account_id,
-                'source': VK_ADS,
-                'balance': {
-                    'amount': 0.0,
-                    'date': self.current_date()
-                }
-            }
+            self.clients_id.add(client_id)
+            if not self.is_selected(client_id):
+                continue
+            self.data[client_id] = ClientRecord(
+                source=VK_ADS,
+                user_id=self.user_id,
+                client_id=client_id,
+                name=raw['name'],
+                balance=BalanceSnapshot(0, self.current_date()),
+                account_id=account_id
+            )
 
     def prepare_statistic(self, data):
         for raw in data['response']:
+            stats = self.data[raw['id']].stats
             for stat in raw['stats']:
-                client_id = raw['id']
-                self.data[client_id]['stats'].append(
-                    {
-                        'date': stat['day'],
-                        'cost': stat.get('spent', 0.0),
-                    }
-                )
+                stats.append(DailyCost.parse(stat['day'], stat.get('spent')))
 
     def get_clients_id(self, ag_data) -> List[int]:
-        id_clients = [raw['id'] for raw in ag_data['response']]
+        id_clients = [raw['id'] for raw in ag_data['response']
+                      if self.is_selected(raw['id'])]
         return id_clients
 
     def get_accounts_id(self) -> List[int]:
-        accounts = vk_ads.Account(
-            access_token=self.tokens.access_token).get()
-        accounts_id = []
-        for account in accounts['response']:
-            accounts_id.append(account['account_id'])
-        return accounts_id
+        self.check_cancelled()
+        accounts = self.account_api().get()
+        return self.parse_accounts_id(accounts)
+
+    def account_api(self) -> vk_ads.Account:
+        return self.api.Account(access_token=self.tokens.access_token)
+
+    @staticmethod
+    def parse_accounts_id(accounts: Dict) -> List[int]:
+        return [account['account_id'] for account in accounts['response']]
+
+    def retry_timeout(self, error: Exception) -> int:
+        """Пауза перед повтором запроса после ошибки лимита."""
+        if isinstance(error, VkFloodControlError):
+            print('flood error')
+            return self.FLOOD_TIMEOUT
+        print('per second error')
+        return self.REQUEST_PER_SECOND_TIMEOUT
 
     def api_request(self, vk_api: vk_ads.BaseApi):
-        attempt_count = 0
-        while True:
-            if attempt_count == self.MAX_COUNT_ATTEMPT:
-                raise VKMaxCountAttemptError()
-            attempt_count += 1
+        for _ in range(self.MAX_COUNT_ATTEMPT):
+            self.check_cancelled()
             try:
-                data = vk_api.get()
-                return data
-            except VkFloodControlError:
-                print('flood error')
-                sleep(self.FLOOD_TIMEOUT)
-            except VkManyRequestPerSecondError:
-                print('per second error')
-                sleep(self.REQUEST_PER_SECOND_TIMEOUT)
+                return vk_api.get()
+            except self.RETRY_ERRORS as error:
+                self.pause(self.retry_timeout(error))
+        raise VKMaxCountAttemptError()
 
     def get_data(self) -> List:
         return list(self.data.values())
 
-    def get(self, count_attempt=0) -> List[Dict[Any, Any]]:
-        for account_id in self.get_accounts_id():
-            agency_clients = vk_ads.Clients(
+    def execute(
+            self,
+            calls: List[vk_ads.BaseApi],
+            on_result: Callable[[int, Dict], Any] = None
+    ) -> List[Dict]:
+        """
+        Выполняет вызовы пачками через execute. Вызовы, упавшие по лимиту
+        запросов, повторяются следующими пачками, не более
+        MAX_COUNT_ATTEMPT раз. Результаты возвращаются в порядке calls.
+        Если передан on_result, результат вызова сразу отдается в него
+        (индекс вызова, данные) и не накапливается.
+        """
+        results = [None] * len(calls)
+        pending = list(range(len(calls)))
+        for attempt in range(self.MAX_COUNT_ATTEMPT):
+            if not pending:
+                return results
+            if attempt:
+                self.pause(self.REQUEST_PER_SECOND_TIMEOUT)
+            retry = []
+            for chunk, execute in self.execute_batches(calls, pending):
+                data = self.api_request(execute)
+                retry += self.execute_result(chunk, execute, data, results,
+                                             on_result)
+            pending = retry
+        if pending:
+            raise VKMaxCountAttemptError()
+        return results
+
+    def execute_batches(
+            self,
+            calls: List[vk_ads.BaseApi],
+            pending: List[int]
+    ) -> List[Tuple[List[int], vk_ads.Execute]]:
+        """Пачки execute из вызовов с индексами pending."""
+        step = self.api.Execute.MAX_CALLS
+        batches = []
+        for start in range(0, len(pending), step):
+            chunk = pending[start:start + step]
+            batches.append((chunk, self.api.Execute(
                 access_token=self.tokens.access_token,
-                account_id=account_id
-            )
-            ag_data = self.api_request(agency_clients)
-            self.prepare_agency_clients(account_id, ag_data)
-            statistic = vk_ads.Statistic(
+                calls=[calls[index] for index in chunk]
+            )))
+        return batches
+
+    def execute_result(
+            self,
+            chunk: List[int],
+            execute: vk_ads.Execute,
+            data: Dict,
+            results: List[Dict],
+            on_result: Callable[[int, Dict], Any] = None
+    ) -> List[int]:
+        """
+        Раскладывает ответ пачки по results или отдает в on_result.
+        Возвращает индексы вызовов, упавших по лимиту запросов.
+        """
+        retry = []
+        for index, result in zip(chunk, execute.split(data)):
+            if isinstance(result, self.RETRY_ERRORS):
+                retry.append(index)
+            elif isinstance(result, Exception):
+                raise result
+            elif on_result is None:
+                results[index] = result
+            else:
+                on_result(index, result)
+        return retry
+
+    def account_statistics(
+            self,
+            account_id: int,
+            clients_id: List[int]
+    ) -> List[vk_ads.Statistic]:
+        """Запросы статистики клиентов кабинета за некэшированные дни."""
+        groups = self.cache.group_by_fetch_from(clients_id)
+        return [
+            self.api.Statistic(
                 access_token=self.tokens.access_token,
                 account_id=account_id,
-                id_clients=self.get_clients_id(ag_data),
-                date_from=self.date_from,
+                id_clients=group_clients_id,
+                date_from=date_from,
                 date_to=self.date_to,
                 period='day'
             )
-            stat_data = self.api_request(statistic)
+            for date_from, group_clients_id in groups.items()
+        ]
+
+    def account_clients(self, account_id: int) -> Dict:
+        return self.api_request(self.clients_api(account_id))
+
+    def clients_api(self, account_id: int) -> vk_ads.Clients:
+        return self.api.Clients(access_token=self.tokens.access_token,
+                                account_id=account_id)
+
+    def fetch_roster(self) -> List[Tuple[int, Dict]]:
+        """
+        Кабинеты и ответы Clients по каждому: параллельно, не более
+        accounts_concurrency запросов, или пачками execute.
+        """
+        accounts_id = self.get_accounts_id()
+        if self.accounts_concurrency > 1:
+            clients = bounded_map(self.account_clients, accounts_id,
+                                  max_workers=self.accounts_concurrency)
+        else:
+            clients = self.execute([self.clients_api(account_id)
+                                    for account_id in accounts_id])
+        return list(zip(accounts_id, clients))
+
+    def collect_batched(self, roster: List[Tuple[int, Dict]]) -> None:
+        """
+        Статистика всех кабинетов запрашивается пачками execute: запрос на
+        MAX_CALLS кабинетов вместо запроса на каждый. Записи клиентов
+        отдаются по мере ответов пачек.
+        """
+        statistics = self.roster_statistics(roster)
+
+        def on_result(index, stat_data):
             self.prepare_statistic(stat_data)
+            self.emit_collected(statistics[index].id_clients)
+
+        self.execute(statistics, on_result=on_result)
+
+    def roster_statistics(
+            self,
+            roster: List[Tuple[int, Dict]]
+    ) -> List[vk_ads.Statistic]:
+        """Разбирает клиентов всех кабинетов, возвращает вызовы для execute."""
+        statistics = []
+        for account_id, ag_data in roster:
+            self.prepare_agency_clients(account_id, ag_data)
+            clients_id = self.get_clients_id(ag_data)
+            for statistic in self.account_statistics(account_id, clients_id):
+                statistics += statistic.split()
+        return statistics
+
+    def collect_account(self, account: Tuple[int, Dict]) -> None:
+        """
+        Статистика клиентов одного кабинета, записи отдаются по мере
+        ответов. Выполняется в потоке, данные коллектора меняются под
+        блокировкой.
+        """
+        account_id, ag_data = account
+        with self.lock:
+            self.prepare_agency_clients(account_id, ag_data)
+        clients_id = self.get_clients_id(ag_data)
+        for statistic in self.account_statistics(account_id, clients_id):
+            stat_data = self.api_request(statistic)
+            with self.lock:
+                self.prepare_statistic(stat_data)
+                self.emit_collected(statistic.id_clients)
+
+    def get(self) -> List[ClientRecord]:
+        """
+        При accounts_concurrency больше 1 кабинеты собираются параллельно,
+        не более accounts_concurrency одновременно на токен, время сбора
+        близко к времени самого медленного кабинета. Иначе запросы
+        кабинетов объединяются в пачки execute.
+        """
+        roster = self.cached_roster(self.fetch_roster)
+        if self.accounts_concurrency > 1:
+            bounded_map(self.collect_account, roster,
+                        max_workers=self.accounts_concurrency)
+        else:
+            self.collect_batched(roster)
+        self.mark_collected(self.get_data())
+        self.emit(self.get_data())
         return self.get_data()
 
 
 class MyTargetCollectData(Ads):
+    SOURCE = MY_TARGET
+    # Клиенты API, aio_ads подставляет асинхронные.
+    api = my_target_ads
     MAX_ATTEMPT_COUNT = 10
 
-    def __init__(self, user_id, date_from: str, date_to: str):
+    def __init__(
+            self,
+            user_id,
+            date_from: str,
+            date_to: str,
+            force_refresh: bool = False,
+            incremental: bool = False
+    ):
         self.user_id = user_id
         self.date_from = date_from
         self.date_to = date_to
-        self.tokens = Token.objects.get(user=self.user_id,
-                                        source__name=MY_TARGET)
+        self.token_service = TokenService()
+        self.tokens = self.token_service.ensure_fresh(
+            Token.objects.get(user=self.user_id, source__name=MY_TARGET)
+        )
+        self.cache = self.make_cache(force_refresh, incremental)
         self.data = {}
 
     def refresh_token(self):
-        tokens = my_target_auth.RefreshToken(
-            client_id=settings.MY_TARGET_CLIENT_ID,
-            client_secret=settings.MY_TARGET_CLIENT_SECRET,
-            refresh_token=self.tokens.refresh_token
-        ).run()
-        self.tokens.access_token = tokens['access_token']
-        self.tokens.refresh_token = tokens['refresh_token']
-        self.tokens.expires_in = tokens['expires_in']
-        self.tokens.save()
+        """
+        Токен обновляется заранее (TokenService), здесь - только если API
+        все же ответило, что токен истек.
+        """
+        self.tokens = self.token_service.refresh(self.tokens, force=True)
 
     def prepare_agency_clients(self, ag_data):
         for raw in ag_data:
             client_id = raw['user']['id']
-            self.data[client_id] = {
-                'stats': [],
-                'name': raw['user']['client_username'],
-                'source': MY_TARGET,
-                'user_id': self.user_id,
-                'client_id': client_id,
-                'balance': {
-                    'amount': float(raw['user']['account']['balance']),
-                    'date': self.current_date()
-                }
-            }
+            if not self.is_selected(client_id):
+                continue
+            self.data[client_id] = ClientRecord(
+                source=MY_TARGET,
+                user_id=self.user_id,
+                client_id=client_id,
+                name=raw['user']['client_username'],
+                balance=BalanceSnapshot(
+                    to_minor(raw['user']['account']['balance']),
+                    self.current_date()
+                )
+            )
 
     def prepare_statistic(self, stat_data):
         for item in stat_data['items']:
-            client_id = item['id']
+            stats = self.data[item['id']].stats
             for row in item['rows']:
-                self.data[client_id]['stats'].append({
-                    'date': row['date'],
-                    'cost': float(row['base']['spent'])
-                })
+                stats.append(DailyCost.parse(row['date'],
+                                             row['base']['spent']))
 
     def api_request(self, my_target_api: my_target_ads.BaseApi):
-        attempt_count = 0
-        while True:
-            if attempt_count == self.MAX_ATTEMPT_COUNT:
-                raise MyTargetMaxAttemptCountError('Max attempt count.')
-            attempt_count += 1
+        for _ in range(self.MAX_ATTEMPT_COUNT):
+            self.check_cancelled()
             try:
-                data = my_target_api.run()
-                return data
+                return my_target_api.run()
             except MyTargetExpiredTokenError:
                 self.refresh_token()
+                my_target_api.access_token = self.tokens.access_token
+        raise MyTargetMaxAttemptCountError('Max attempt count.')
 
     def get_data(self) -> List:
         return list(self.data.values())
 
     def get_clients_id(self, ag_data: List) -> List[int]:
-        return [raw['user']['id'] for raw in ag_data]
+        return [raw['user']['id'] for raw in ag_data
+                if self.is_selected(raw['user']['id'])]
 
-    def get(self) -> List[Dict]:
-        agency_clients = my_target_ads.AgencyClients(
-            self.tokens.access_token)
-        ag_data = self.api_request(agency_clients)
-        self.prepare_agency_clients(ag_data)
-        statistic = my_target_ads.DayStatistic(
+    def fetch_roster(self) -> List:
+        return self.api_request(
+            self.api.AgencyClients(self.tokens.access_token))
+
+    def day_statistic(
+            self,
+            date_from: str,
+            clients_id: List[int]
+    ) -> my_target_ads.DayStatistic:
+        return self.api.DayStatistic(
             self.tokens.access_token,
-            clients_id=self.get_clients_id(ag_data),
-            date_from=self.date_from,
+            clients_id=clients_id,
+            date_from=date_from,
             date_to=self.date_to
         )
-        stat_data = self.api_request(statistic)
-        self.prepare_statistic(stat_data)
+
+    def get(self) -> List[ClientRecord]:
+        ag_data = self.cached_roster(self.fetch_roster)
+        self.prepare_agency_clients(ag_data)
+        groups = self.cache.group_by_fetch_from(self.get_clients_id(ag_data))
+        for date_from, clients_id in groups.items():
+            stat_data = self.api_request(
+                self.day_statistic(date_from, clients_id))
+            self.prepare_statistic(stat_data)
+            self.emit_collected(clients_id)
+        self.mark_collected(self.get_data())
+        self.emit(self.get_data())
         return self.get_data()
+
+
+COLLECTORS = {
+    collector_class.SOURCE: collector_class
+    for collector_class in (YandexCollectData, MyTargetCollectData,
+                            VKCollectData)
+}
@@ -0,0 +1,334 @@
+"""
+Асинхронные варианты коллекторов ads, подключаются явно: таски сбора
+(dashboard.tasks.collect_source_spending) собирают часть запуска
+синхронным коллектором из ads.COLLECTORS через ads.stream_collector,
+aio_ads.get и aio_ads.collect в них не используются.\n
+Логика сбора общая с ads: здесь переопределены только методы, которые
+ждут ответа API, запросы к общему хранилищу и БД выполняются в потоках.
+"""
+import asyncio
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import ads
+from .records import ClientRecord
+from core.aio import bounded_gather, close_default_async_transport, with_retry
+from core.yandex import aio as yandex_aio
+from core.yandex import direct as yandex_direct
+from core.vk import aio as vk_aio
+from core.vk.exceptions import VKMaxCountAttemptError
+from core.my_target import aio as my_target_aio
+from core.my_target.exceptions import (MyTargetExpiredTokenError,
+                                       MyTargetMaxAttemptCountError)
+
+
+def get(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False
+) -> List[ClientRecord]:
+    """
+    Записи клиентов всех кабинетов за период, вызывается из синхронного
+    кода. Format date_from, date_to %Y-%m-%d .
+    """
+    return run(user_id, date_from, date_to, force_refresh)['data']
+
+
+def run(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False
+) -> Dict[str, Any]:
+    """Запускает collect в своем цикле событий и закрывает транспорт."""
+    async def collect_all():
+        try:
+            return await collect(user_id, date_from, date_to,
+                                 force_refresh=force_refresh)
+        finally:
+            await close_default_async_transport()
+
+    return asyncio.run(collect_all())
+
+
+async def collect(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False,
+        sink: Callable[[ClientRecord], None] = None
+) -> Dict[str, Any]:
+    """
+    Параллельный сбор данных всех кабинетов.\n
+    Возвращает {'data': [...], 'sources': {source: status}}, status -
+    {'status': 'ok' | 'error' | 'timeout', 'seconds': ..., 'records': ...,
+    'error': ...}. Все кабинеты собираются корутинами одного цикла
+    событий: запросы и опрос отчетов ждут ответа, не занимая потоков.
+    Сбор кабинета с истекшим таймаутом (settings.ADS_SOURCE_TIMEOUTS)
+    отменяется, данные остальных сохраняются.\n
+    Если передан sink, готовые записи клиентов отдаются в него по мере
+    сбора и в data не попадают.
+    """
+    emitted = {}
+
+    def source_sink(source):
+        def put(record):
+            sink(record)
+            emitted[source] = emitted.get(source, 0) + 1
+        return put
+
+    def job(collector_class):
+        async def run_collector():
+            # Конструкторы коллекторов читают токены из БД.
+            cabinet = await sync_to_async(collector_class)(
+                user_id, date_from, date_to, force_refresh=force_refresh)
+            if sink is not None:
+                cabinet.sink = source_sink(collector_class.SOURCE)
+            return await cabinet.get()
+        return run_collector
+
+    jobs = {collector_class.SOURCE: job(collector_class)
+            for collector_class in COLLECTORS.values()}
+    result = await run_sources(jobs, settings.ADS_SOURCE_TIMEOUTS)
+    for source, count in emitted.items():
+        status = result['sources'][source]
+        status['records'] = status.get('records', 0) + count
+    return result
+
+
+async def run_sources(
+        jobs: Dict[str, Callable[[], Awaitable[List[ClientRecord]]]],
+        timeouts: Dict[str, float] = None
+) -> Dict[str, Any]:
+    """
+    Выполняет сбор каждого источника корутиной: сбор источника
+    отменяется по истечении его таймаута, ошибка источника не отменяет
+    остальные.
+    """
+    timeouts = timeouts or {}
+    started = monotonic()
+
+    async def run_source(source):
+        try:
+            records = await asyncio.wait_for(jobs[source](),
+                                             timeouts.get(source))
+        except asyncio.TimeoutError:
+            return {'status': 'timeout',
+                    'seconds': monotonic() - started}, []
+        except Exception as error:
+            return {'status': 'error',
+                    'seconds': monotonic() - started,
+                    'error': repr(error)}, []
+        return {'status': 'ok', 'seconds': monotonic() - started,
+                'records': len(records)}, records
+
+    results = await asyncio.gather(*(run_source(source) for source in jobs))
+    data = []
+    sources = {}
+    for source, (status, records) in zip(jobs, results):
+        data += records
+        sources[source] = status
+    return {'data': data, 'sources': sources}
+
+
+class YandexCollectData(ads.YandexCollectData):
+    """
+    Асинхронный сбор Яндекс директ: отчеты всех логинов опрашиваются
+    корутинами, паузы retryIn не занимают поток. Запросы к хранилищу
+    (баллы, оценка кусков) и к БД выполняются в потоках.
+    """
+    api = yandex_aio
+    poller_class = yandex_aio.ReportPoller
+
+    async def api_request(self, yandex_api: yandex_aio.BaseApi):
+        self.check_cancelled()
+        return await yandex_api.get()
+
+    async def agency_clients(self):
+        if await sync_to_async(self.use_stored_agency_clients)():
+            return
+        ag_data = await self.api_request(self.agency_clients_api())
+        await sync_to_async(self.synced_agency_clients)(ag_data)
+
+    async def statistic(self):
+        chunks, pending = await sync_to_async(
+            self.statistic_chunks, thread_sensitive=False)()
+        try:
+            for attempt in range(self.REPORT_ATTEMPTS):
+                if not chunks:
+                    return
+                poller = self.statistic_poller(chunks, pending)
+                await poller.run()
+                chunks = self.failed_chunks(poller, attempt)
+        finally:
+            await sync_to_async(self.observe_chunks,
+                                thread_sensitive=False)()
+
+    async def chunk_account_management(
+            self,
+            payload: yandex_direct.PayloadV4
+    ) -> Dict:
+        return await self.api_request(self.account_management_api(payload))
+
+    async def account_management(self):
+        logins = await sync_to_async(self.account_management_logins,
+                                     thread_sensitive=False)()
+        request = with_retry(self.chunk_account_management,
+                             **self.account_management_retry())
+        chunks_data = await bounded_gather(
+            request,
+            self.account_management_payload(logins),
+            self.ACCOUNT_MANAGEMENT_CONCURRENCY
+        )
+        for data in chunks_data:
+            self.prepare_account_management(data)
+
+    async def get(self) -> List[ClientRecord]:
+        await self.agency_clients()
+        await self.account_management()
+        await self.statistic()
+        self.emit(self.get_data())
+        return self.get_data()
+
+
+class VKCollectData(ads.VKCollectData):
+    """
+    Асинхронный сбор VK: кабинеты собираются корутинами, частоту запросов
+    по-прежнему ограничивает core.ratelimit. Список клиентов загружается
+    каждым сбором, общий список запуска (share_roster) не используется.
+    """
+    api = vk_aio
+
+    async def api_request(self, vk_api: vk_aio.BaseApi):
+        for _ in range(self.MAX_COUNT_ATTEMPT):
+            self.check_cancelled()
+            try:
+                return await vk_api.get()
+            except self.RETRY_ERRORS as error:
+                await asyncio.sleep(self.retry_timeout(error))
+        raise VKMaxCountAttemptError()
+
+    async def get_accounts_id(self) -> List[int]:
+        self.check_cancelled()
+        accounts = await self.account_api().get()
+        return self.parse_accounts_id(accounts)
+
+    async def execute(
+            self,
+            calls: List[vk_aio.BaseApi],
+            on_result: Callable[[int, Dict], Any] = None
+    ) -> List[Dict]:
+        results = [None] * len(calls)
+        pending = list(range(len(calls)))
+        for attempt in range(self.MAX_COUNT_ATTEMPT):
+            if not pending:
+                return results
+            if attempt:
+                await asyncio.sleep(self.REQUEST_PER_SECOND_TIMEOUT)
+            retry = []
+            for chunk, execute in self.execute_batches(calls, pending):
+                data = await self.api_request(execute)
+                retry += self.execute_result(chunk, execute, data, results,
+                                             on_result)
+            pending = retry
+        if pending:
+            raise VKMaxCountAttemptError()
+        return results
+
+    async def account_clients(self, account_id: int) -> Dict:
+        return await self.api_request(self.clients_api(account_id))
+
+    async def fetch_roster(self) -> List[Tuple[int, Dict]]:
+        accounts_id = await self.get_accounts_id()
+        if self.accounts_concurrency > 1:
+            clients = await bounded_gather(
+                self.account_clients, accounts_id,
+                max_workers=self.accounts_concurrency)
+        else:
+            clients = await self.execute([self.clients_api(account_id)
+                                          for account_id in accounts_id])
+        return list(zip(accounts_id, clients))
+
+    async def collect_batched(self, roster: List[Tuple[int, Dict]]) -> None:
+        statistics = self.roster_statistics(roster)
+
+        def on_result(index, stat_data):
+            self.prepare_statistic(stat_data)
+            self.emit_collected(statistics[index].id_clients)
+
+        await self.execute(statistics, on_result=on_result)
+
+    async def collect_account(self, account: Tuple[int, Dict]) -> None:
+        """Корутины кабинетов работают в одном потоке, без блокировки."""
+        account_id, ag_data = account
+        self.prepare_agency_clients(account_id, ag_data)
+        clients_id = self.get_clients_id(ag_data)
+        for statistic in self.account_statistics(account_id, clients_id):
+            self.prepare_statistic(await self.api_request(statistic))
+            self.emit_collected(statistic.id_clients)
+
+    async def get(self) -> List[ClientRecord]:
+        roster = await self.fetch_roster()
+        if self.accounts_concurrency > 1:
+            await bounded_gather(self.collect_account, roster,
+                                 max_workers=self.accounts_concurrency)
+        else:
+            await self.collect_batched(roster)
+        self.mark_collected(self.get_data())
+        self.emit(self.get_data())
+        return self.get_data()
+
+
+class MyTargetCollectData(ads.MyTargetCollectData):
+    """
+    Асинхронный сбор myTarget: статистика групп клиентов с разной датой
+    начала запрашивается одновременно.
+    """
+    api = my_target_aio
+
+    async def refresh_token(self):
+        self.tokens = await sync_to_async(self.token_service.refresh)(
+            self.tokens, force=True)
+
+    async def api_request(self, my_target_api: my_target_aio.BaseApi):
+        for _ in range(self.MAX_ATTEMPT_COUNT):
+            self.check_cancelled()
+            try:
+                return await my_target_api.run()
+            except MyTargetExpiredTokenError:
+                await self.refresh_token()
+                my_target_api.access_token = self.tokens.access_token
+        raise MyTargetMaxAttemptCountError('Max attempt count.')
+
+    async def fetch_roster(self) -> List:
+        return await self.api_request(
+            self.api.AgencyClients(self.tokens.access_token))
+
+    async def collect_group(self, date_from: str, clients_id: List[int]):
+        stat_data = await self.api_request(
+            self.day_statistic(date_from, clients_id))
+        self.prepare_statistic(stat_data)
+        self.emit_collected(clients_id)
+
+    async def get(self) -> List[ClientRecord]:
+        ag_data = await self.fetch_roster()
+        self.prepare_agency_clients(ag_data)
+        groups = self.cache.group_by_fetch_from(self.get_clients_id(ag_data))
+        await asyncio.gather(*(
+            self.collect_group(date_from, clients_id)
+            for date_from, clients_id in groups.items()
+        ))
+        self.mark_collected(self.get_data())
+        self.emit(self.get_data())
+        return self.get_data()
+
+
+COLLECTORS = {
+    collector_class.SOURCE: collector_class
+    for collector_class in (YandexCollectData, MyTargetCollectData,
+                            VKCollectData)
+}
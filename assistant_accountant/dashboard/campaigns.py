@@ -0,0 +1,223 @@
+import json
+from abc import ABC, abstractmethod
+from hashlib import sha1
+from typing import Dict, Iterable, Iterator, List
+
+from django.conf import settings
+
+from .ads import YandexCollectData, VKCollectData
+from .models import (YANDEX_DIRECT, MY_TARGET, VK_ADS, AgencyClient,
+                     Campaign, Token)
+from core.concurrency import with_retry
+from core.store import default_store
+from core.yandex import direct as yandex_direct
+from core.vk import ads as vk_ads
+from core.vk.exceptions import (VkFloodControlError,
+                                VkManyRequestPerSecondError)
+from core.my_target import ads as my_target_ads
+from core.my_target import auth as my_target_auth
+from core.my_target.exceptions import MyTargetTokenLimitError
+
+
+class CampaignWriter:
+    """
+    Пакетная запись кампаний. Кампании, отпечаток которых совпадает с
+    сохраненным, пропускаются, остальные пишутся upsert'ом через
+    bulk_create(update_conflicts=True) пачками по batch_size.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self.batch: List[Campaign] = []
+        self.fingerprints: Dict[int, Dict[int, str]] = {}
+        self.written = 0
+        self.skipped = 0
+
+    @staticmethod
+    def fingerprint(campaign: Dict) -> str:
+        data = json.dumps(campaign, sort_keys=True, ensure_ascii=False)
+        return sha1(data.encode()).hexdigest()
+
+    def client_fingerprints(self, client: AgencyClient) -> Dict[int, str]:
+        """Сохраненные отпечатки кампаний клиента, один запрос на клиента."""
+        if client.pk not in self.fingerprints:
+            self.fingerprints[client.pk] = dict(
+                Campaign.objects.filter(client=client).values_list(
+                    'campaign_id', 'fingerprint')
+            )
+        return self.fingerprints[client.pk]
+
+    def write(self, client: AgencyClient, campaigns: Iterable[Dict]) -> None:
+        """campaigns - словари с ключами campaign_id и name."""
+        fingerprints = self.client_fingerprints(client)
+        for campaign in campaigns:
+            fingerprint = self.fingerprint(campaign)
+            if fingerprints.get(campaign['campaign_id']) == fingerprint:
+                self.skipped += 1
+                continue
+            fingerprints[campaign['campaign_id']] = fingerprint
+            self.batch.append(Campaign(
+                client=client,
+                source_id=client.source_id,
+                campaign_id=campaign['campaign_id'],
+                name=campaign['name'],
+                fingerprint=fingerprint
+            ))
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        if not self.batch:
+            return
+        Campaign.objects.bulk_create(
+            self.batch,
+            update_conflicts=True,
+            unique_fields=['client_id', 'source_id', 'campaign_id'],
+            update_fields=['name', 'fingerprint']
+        )
+        self.written += len(self.batch)
+        self.batch = []
+
+
+class CampaignSync(ABC):
+    """
+    Синхронизация каталога кампаний источника: страницы кампаний каждого
+    клиента агентства сразу передаются в CampaignWriter.
+    """
+    SOURCE = None
+
+    def __init__(self, user_id: int, writer: CampaignWriter = None):
+        self.user_id = user_id
+        self.tokens = Token.objects.get(user__pk=self.user_id,
+                                        source__name=self.SOURCE)
+        self.writer = writer or CampaignWriter()
+
+    def get_clients(self) -> Iterable[AgencyClient]:
+        return AgencyClient.objects.filter(
+            user__pk=self.user_id,
+            source__name=self.SOURCE
+        ).select_related('account')
+
+    @abstractmethod
+    def iter_pages(self, client: AgencyClient) -> Iterator[List[Dict]]:
+        """Страницы кампаний клиента в виде {'campaign_id', 'name'}."""
+        ...
+
+    def sync(self) -> CampaignWriter:
+        for client in self.get_clients():
+            for page in self.iter_pages(client):
+                self.writer.write(client, page)
+        self.writer.flush()
+        return self.writer
+
+
+class YandexCampaignSync(CampaignSync):
+    SOURCE = YANDEX_DIRECT
+    FIELDS = ['Id', 'Name']
+
+    def iter_pages(self, client: AgencyClient) -> Iterator[List[Dict]]:
+        payload = yandex_direct.Payload.payload_pagination(
+            fields=self.FIELDS,
+            limit=YandexCollectData.CAMPAIGNS_LIMIT,
+            offset=0,
+            method=YandexCollectData.METHOD
+        )
+        # SelectionCriteria обязателен в campaigns.get, пустой - все
+        # кампании клиента.
+        payload.add_criteria({})
+        campaigns = yandex_direct.Campaigns(
+            access_token=self.tokens.access_token,
+            payload=payload,
+            client_login=client.name
+        )
+        for page in campaigns.iter_pages():
+            yield [{'campaign_id': raw['Id'], 'name': raw['Name']}
+                   for raw in page]
+
+
+class VKCampaignSync(CampaignSync):
+    SOURCE = VK_ADS
+
+    def iter_pages(self, client: AgencyClient) -> Iterator[List[Dict]]:
+        campaigns = vk_ads.Campaigns(
+            access_token=self.tokens.access_token,
+            account_id=client.account.account_id,
+            client_id=client.client_id
+        )
+        request = with_retry(
+            campaigns.get,
+            attempts=VKCollectData.MAX_COUNT_ATTEMPT,
+            retry_on=(VkFloodControlError, VkManyRequestPerSecondError),
+            delay=VKCollectData.REQUEST_PER_SECOND_TIMEOUT
+        )
+        yield [{'campaign_id': raw['id'], 'name': raw['name']}
+               for raw in request()['response']]
+
+
+class MyTargetCampaignSync(CampaignSync):
+    """
+    Кампании клиентов myTarget доступны только по токену клиента. Токены
+    клиентов хранятся в общем хранилище до истечения срока действия.
+    """
+    SOURCE = MY_TARGET
+    CLIENT_TOKEN_KEY = 'my_target_client_token:{}'
+    EXPIRES_MARGIN = 60
+
+    def create_client_token(self, client: AgencyClient) -> Dict:
+        token = my_target_auth.AgencyClientToken(
+            client_id=settings.MY_TARGET_CLIENT_ID,
+            client_secret=settings.MY_TARGET_CLIENT_SECRET,
+            agency_client_name=client.name
+        )
+        try:
+            return token.run()
+        except MyTargetTokenLimitError as error:
+            my_target_auth.DeleteTokens(
+                client_id=settings.MY_TARGET_CLIENT_ID,
+                client_secret=settings.MY_TARGET_CLIENT_SECRET,
+                user_id=error.args[0].get('user_id')
+            ).run()
+            return token.run()
+
+    def client_access_token(self, client: AgencyClient) -> str:
+        store = default_store()
+        key = self.CLIENT_TOKEN_KEY.format(client.client_id)
+        access_token = store.get(key)
+        if access_token is None:
+            tokens = self.create_client_token(client)
+            access_token = tokens['access_token']
+            timeout = max(tokens['expires_in'] - self.EXPIRES_MARGIN, 0)
+            store.set(key, access_token, timeout)
+        return access_token
+
+    def iter_pages(self, client: AgencyClient) -> Iterator[List[Dict]]:
+        campaigns = my_target_ads.Campaigns(self.client_access_token(client))
+        for page in campaigns.iter_pages():
+            yield [{'campaign_id': raw['id'], 'name': raw['name']}
+                   for raw in page]
+
+
+CAMPAIGN_SYNCS = (YandexCampaignSync, VKCampaignSync, MyTargetCampaignSync)
+
+
+def sync(user_id: int) -> Dict[str, Dict[str, int]]:
+    """
+    Синхронизация кампаний всех источников пользователя. Источники, к
+    которым у пользователя нет токена, пропускаются.
+    """
+    result = {}
+    sources = set(Token.objects.filter(
+        user__pk=user_id,
+        source__name__in=[campaign_sync.SOURCE
+                          for campaign_sync in CAMPAIGN_SYNCS]
+    ).values_list('source__name', flat=True))
+    for campaign_sync in CAMPAIGN_SYNCS:
+        if campaign_sync.SOURCE not in sources:
+            continue
+        writer = campaign_sync(user_id).sync()
+        result[campaign_sync.SOURCE] = {
+            'written': writer.written,
+            'skipped': writer.skipped
+        }
+    return result
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-17 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_alter_source_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='clients_synced_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата полной загрузки клиентов агентства'),
+        ),
+    ]
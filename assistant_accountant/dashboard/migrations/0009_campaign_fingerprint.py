@@ -0,0 +1,22 @@
+# Generated by Django 4.1.3 on 2026-10-17 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_token_clients_synced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40, verbose_name='Отпечаток данных кампании'),
+        ),
+        migrations.AddConstraint(
+            model_name='campaign',
+            constraint=models.UniqueConstraint(fields=('client', 'source', 'campaign_id'), name='unique_client_source_campaign'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.3 on 2026-10-17 23:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_campaign_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='dashboard.agencyclient')),
+            ],
+            options={
+                'db_table': 'statistic_coverage',
+                'ordering': ['client'],
+                'default_related_name': 'statistic_coverage',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.3 on 2026-10-17 23:48
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_expires_at(apps, schema_editor):
+    """Срок существующих токенов считается от даты создания записи."""
+    Token = apps.get_model('dashboard', 'Token')
+    for token in Token.objects.all():
+        token.expires_at = token.created + timedelta(seconds=token.expires_in)
+        token.save(update_fields=['expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_statisticcoverage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата истечения access_token'),
+        ),
+        migrations.RunPython(fill_expires_at, migrations.RunPython.noop),
+    ]
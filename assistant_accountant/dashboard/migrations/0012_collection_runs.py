@@ -0,0 +1,69 @@
+# Generated by Django 4.1.3 on 2026-10-17 23:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dashboard', '0011_token_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('force_refresh', models.BooleanField(default=False)),
+                ('incremental', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Завершен с ошибками')], default='running', max_length=256)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'collection_runs',
+                'ordering': ['-created'],
+                'default_related_name': 'collection_runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='RunCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.IntegerField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.collectionrun')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.source')),
+            ],
+            options={
+                'db_table': 'run_checkpoints',
+                'ordering': ['run', 'source', 'client_id'],
+                'default_related_name': 'checkpoints',
+            },
+        ),
+        migrations.CreateModel(
+            name='CollectionPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_ids', models.JSONField(blank=True, null=True)),
+                ('exclude_client_ids', models.JSONField(blank=True, null=True)),
+                ('done', models.BooleanField(default=False)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.collectionrun')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.source')),
+            ],
+            options={
+                'db_table': 'collection_parts',
+                'ordering': ['run', 'pk'],
+                'default_related_name': 'parts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='runcheckpoint',
+            constraint=models.UniqueConstraint(fields=('run', 'source', 'client_id'), name='unique_run_source_client'),
+        ),
+    ]
@@ -1,8 +1,11 @@
+from datetime import timedelta
+
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
-from core.models import CreateModel
+from core.models import CreateModel, UpdateModel
 
 User = get_user_model()
 YANDEX_DIRECT = 'yandex_direct'
@@ -16,7 +19,17 @@ class Token(CreateModel):
     access_token = models.TextField()
     refresh_token = models.TextField(blank=True, null=True)
     expires_in = models.IntegerField()
+    expires_at = models.DateTimeField(
+        'Дата истечения access_token',
+        blank=True,
+        null=True
+    )
     source = models.ForeignKey('Source', on_delete=models.CASCADE)
+    clients_synced_at = models.DateTimeField(
+        'Дата полной загрузки клиентов агентства',
+        blank=True,
+        null=True
+    )
 
     class Meta:
         db_table = 'tokens'
@@ -26,6 +39,11 @@ class Token(CreateModel):
     def __str__(self):
         return self.source.name
 
+    @staticmethod
+    def expiry(expires_in: int):
+        """Дата истечения токена, выданного сейчас на expires_in секунд."""
+        return timezone.now() + timedelta(seconds=expires_in)
+
 
 class Source(models.Model):
     SOURCES = (
@@ -84,11 +102,22 @@ class Campaign(models.Model):
     name = models.CharField(max_length=DEFAULT_MAX_LENGTH)
     campaign_id = models.IntegerField()
     source = models.ForeignKey(Source, on_delete=models.CASCADE)
+    fingerprint = models.CharField(
+        'Отпечаток данных кампании',
+        max_length=40,
+        blank=True
+    )
 
     class Meta:
         db_table = 'campaigns'
         ordering = ['client', 'source', 'name']
         default_related_name = 'campaigns'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['client', 'source', 'campaign_id'],
+                name='unique_client_source_campaign'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -124,3 +153,95 @@ class StatisticByAgencyClient(models.Model):
 
     def __str__(self):
         return str(self.date)
+
+
+class StatisticCoverage(models.Model):
+    """
+    Диапазон закрытых дней, статистика клиента за которые уже сохранена.
+    Закрытый день старше окна корректировок источника и больше не
+    меняется в кабинете.
+    """
+    client = models.OneToOneField(AgencyClient, on_delete=models.CASCADE)
+    date_from = models.DateField()
+    date_to = models.DateField()
+
+    class Meta:
+        db_table = 'statistic_coverage'
+        ordering = ['client']
+        default_related_name = 'statistic_coverage'
+
+    def __str__(self):
+        return f'{self.client}: {self.date_from} - {self.date_to}'
+
+
+class CollectionRun(CreateModel, UpdateModel):
+    """
+    Запуск сбора статистики частями (dashboard.tasks). Части и отметки
+    о сохраненных клиентах пишутся по мере выполнения, повторный запуск
+    того же run пропускает готовую работу.
+    """
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершен'),
+        (FAILED, 'Завершен с ошибками'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date_from = models.DateField()
+    date_to = models.DateField()
+    force_refresh = models.BooleanField(default=False)
+    incremental = models.BooleanField(default=False)
+    status = models.CharField(choices=STATUSES, default=RUNNING,
+                              max_length=DEFAULT_MAX_LENGTH)
+
+    class Meta:
+        db_table = 'collection_runs'
+        ordering = ['-created']
+        default_related_name = 'collection_runs'
+
+    def __str__(self):
+        return f'{self.user}: {self.date_from} - {self.date_to}'
+
+
+class CollectionPart(models.Model):
+    """
+    Часть запуска: клиенты источника client_ids или все клиенты, кроме
+    exclude_client_ids.
+    """
+    run = models.ForeignKey(CollectionRun, on_delete=models.CASCADE)
+    source = models.ForeignKey(Source, on_delete=models.CASCADE)
+    client_ids = models.JSONField(blank=True, null=True)
+    exclude_client_ids = models.JSONField(blank=True, null=True)
+    done = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'collection_parts'
+        ordering = ['run', 'pk']
+        default_related_name = 'parts'
+
+    def __str__(self):
+        return f'{self.run}: {self.source}'
+
+
+class RunCheckpoint(models.Model):
+    """Отметка: данные клиента источника в запуске сохранены."""
+    run = models.ForeignKey(CollectionRun, on_delete=models.CASCADE)
+    source = models.ForeignKey(Source, on_delete=models.CASCADE)
+    client_id = models.IntegerField()
+
+    class Meta:
+        db_table = 'run_checkpoints'
+        ordering = ['run', 'source', 'client_id']
+        default_related_name = 'checkpoints'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['run', 'source', 'client_id'],
+                name='unique_run_source_client'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.run}: {self.source} {self.client_id}'
@@ -0,0 +1,104 @@
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import List, Optional, Tuple, Union
+
+# Денежные суммы хранятся в минимальных единицах валюты (копейках).
+MINOR_UNITS = 100
+
+Money = Union[int, float, str, Decimal, None]
+
+
+def to_minor(value: Money) -> int:
+    """
+    Сумма из ответа API (строка, float или Decimal) в минимальных
+    единицах. Пустое значение - ноль.
+    """
+    if value is None or value == '':
+        return 0
+    minor = Decimal(str(value)) * MINOR_UNITS
+    return int(minor.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(value: int) -> float:
+    """Сумма в единицах валюты для полей моделей."""
+    return value / MINOR_UNITS
+
+
+def to_date(value: Union[date, str]) -> date:
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+class Record:
+    """
+    Базовый класс записей коллекторов: поля в __slots__, без __dict__ на
+    каждый экземпляр. Сравнение и repr по полям.
+    """
+    __slots__ = ()
+
+    def values(self) -> Tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class DailyCost(Record):
+    """Затраты клиента за день, cost в минимальных единицах."""
+    __slots__ = ('date', 'cost')
+
+    def __init__(self, day: date, cost: int):
+        self.date = day
+        self.cost = cost
+
+    @classmethod
+    def parse(cls, day: Union[date, str], cost: Money) -> 'DailyCost':
+        """Строка статистики из ответа API любого источника."""
+        return cls(to_date(day), to_minor(cost))
+
+
+class BalanceSnapshot(Record):
+    """Баланс клиента на дату, amount в минимальных единицах."""
+    __slots__ = ('amount', 'date')
+
+    def __init__(self, amount: int, day: date):
+        self.amount = amount
+        self.date = day
+
+
+class ClientRecord(Record):
+    """
+    Запись клиента агентства, которую коллектор отдает в WriteDB.\n
+    account_id - кабинет VK, stats_period - собранный период (date_from,
+    date_to) для кэша закрытых дней.
+    """
+    __slots__ = ('source', 'user_id', 'client_id', 'name', 'stats',
+                 'balance', 'account_id', 'stats_period')
+
+    def __init__(
+            self,
+            source: str,
+            user_id: int,
+            client_id: int,
+            name: str,
+            balance: BalanceSnapshot,
+            stats: List[DailyCost] = None,
+            account_id: int = None,
+            stats_period: Optional[Tuple[str, str]] = None
+    ):
+        self.source = source
+        self.user_id = user_id
+        self.client_id = client_id
+        self.name = name
+        self.balance = balance
+        self.stats = [] if stats is None else stats
+        self.account_id = account_id
+        self.stats_period = stats_period
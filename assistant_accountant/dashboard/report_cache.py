@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from .models import AgencyClient, StatisticCoverage
+
+
+class ReportCache:
+    """
+    Кэш статистики за закрытые дни.\n
+    День закрыт, если он старше окна корректировок источника
+    (settings.STATISTIC_CORRECTION_WINDOW): статистика за него в кабинете
+    больше не меняется. Если закрытая часть запрошенного периода для
+    клиента уже сохранена (StatisticCoverage), у API запрашиваются только
+    открытые дни, закрытые остаются в БД как есть. force=True отключает
+    кэш.\n
+    incremental=True - инкрементальный сбор: StatisticCoverage.date_to
+    служит отметкой (watermark) последнего подтвержденного дня клиента, у
+    API запрашиваются дни после нее.
+    Клиенты без отметки собираются с date_from (загрузка истории).
+    """
+    DEFAULT_CORRECTION_WINDOW = 3
+
+    def __init__(
+            self,
+            user_id: int,
+            source: str,
+            date_from: str,
+            date_to: str,
+            force: bool = False,
+            incremental: bool = False
+    ):
+        self.user_id = user_id
+        self.source = source
+        self.date_from = date.fromisoformat(date_from)
+        self.date_to = date.fromisoformat(date_to)
+        self.force = force
+        self.incremental = incremental
+        self.closed_to = min(
+            self.date_to,
+            date.today() - timedelta(days=self.correction_window(source))
+        )
+        self.coverage = {} if force else self.load_coverage()
+
+    @classmethod
+    def correction_window(cls, source: str) -> int:
+        return settings.STATISTIC_CORRECTION_WINDOW.get(
+            source, cls.DEFAULT_CORRECTION_WINDOW)
+
+    def load_coverage(self) -> Dict[int, StatisticCoverage]:
+        coverage = StatisticCoverage.objects.filter(
+            client__user__pk=self.user_id,
+            client__source__name=self.source
+        ).select_related('client')
+        return {item.client.client_id: item for item in coverage}
+
+    def has_closed_days(self) -> bool:
+        return self.closed_to >= self.date_from
+
+    def is_covered(self, client_id: int) -> bool:
+        """Сохранена ли статистика клиента за все закрытые дни периода."""
+        if self.force or self.incremental or not self.has_closed_days():
+            return False
+        coverage = self.coverage.get(client_id)
+        return (coverage is not None
+                and coverage.date_from <= self.date_from
+                and coverage.date_to >= self.closed_to)
+
+    def fetch_from(self, client_id: int) -> Optional[str]:
+        """
+        С какой даты запрашивать статистику клиента у API или None, если
+        весь период есть в кэше.
+        """
+        if self.incremental:
+            return self.watermark_fetch_from(client_id)
+        if not self.is_covered(client_id):
+            return self.date_from.isoformat()
+        open_from = self.closed_to + timedelta(days=1)
+        if open_from > self.date_to:
+            return None
+        return open_from.isoformat()
+
+    def watermark_fetch_from(self, client_id: int) -> Optional[str]:
+        """Следующий день после отметки клиента или date_from."""
+        coverage = self.coverage.get(client_id)
+        if coverage is None:
+            return self.date_from.isoformat()
+        fetch_from = max(self.date_from,
+                         coverage.date_to + timedelta(days=1))
+        if fetch_from > self.date_to:
+            return None
+        return fetch_from.isoformat()
+
+    def group_by_fetch_from(
+            self,
+            client_ids: Iterable[int]
+    ) -> Dict[str, List[int]]:
+        """Клиенты, сгруппированные по дате начала запроса к API."""
+        groups = defaultdict(list)
+        for client_id in client_ids:
+            fetch_from = self.fetch_from(client_id)
+            if fetch_from is not None:
+                groups[fetch_from].append(client_id)
+        return dict(groups)
+
+    @classmethod
+    def mark_covered(
+            cls,
+            client: AgencyClient,
+            date_from: str,
+            date_to: str
+    ) -> None:
+        """
+        Отмечает закрытую часть сохраненного периода как закэшированную.
+        Пересекающийся или смежный диапазон объединяется с текущим.\n
+        Отметка date_to двигается только по непрерывным дням: более поздний
+        диапазон с пропуском заменяет текущий, только если пропуск целиком
+        раньше окна инкрементального сбора (SPENDING_BACKFILL_DAYS) и его
+        дни больше никто не запросит от отметки. Иначе, как и более ранний
+        несмежный диапазон, он не меняет отметку.
+        """
+        date_from = date.fromisoformat(date_from)
+        closed_to = min(
+            date.fromisoformat(date_to),
+            date.today() - timedelta(
+                days=cls.correction_window(client.source.name))
+        )
+        if closed_to < date_from:
+            return
+        coverage = StatisticCoverage.objects.filter(client=client).first()
+        if coverage is None:
+            StatisticCoverage.objects.create(
+                client=client, date_from=date_from, date_to=closed_to)
+            return
+        adjacent = (date_from <= coverage.date_to + timedelta(days=1)
+                    and closed_to >= coverage.date_from - timedelta(days=1))
+        backfill_from = date.today() - timedelta(
+            days=settings.SPENDING_BACKFILL_DAYS)
+        if adjacent:
+            coverage.date_from = min(coverage.date_from, date_from)
+            coverage.date_to = max(coverage.date_to, closed_to)
+        elif coverage.date_to < date_from <= backfill_from:
+            coverage.date_from = date_from
+            coverage.date_to = closed_to
+        else:
+            return
+        coverage.save()
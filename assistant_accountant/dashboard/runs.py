@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+from time import monotonic, sleep
+from typing import Dict, Iterator, List, Tuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ads
+from .models import (AgencyClient, CollectionPart, CollectionRun, Source,
+                     Token)
+from core.store import default_store
+
+RUN_LOCK_KEY = 'collection_run_lock:{}'
+RUN_LOCK_TIMEOUT = 30
+RUN_LOCK_POLL_INTERVAL = 0.1
+
+
+def collection_parts(user_id: int) -> List[Dict]:
+    """
+    Части сбора: по каждому источнику пачки сохраненных клиентов по
+    settings.COLLECT_CLIENTS_PER_TASK и одна часть для остальных (новых)
+    клиентов источника. Источники, к которым у пользователя нет токена,
+    не собираются.
+    """
+    parts = []
+    step = settings.COLLECT_CLIENTS_PER_TASK
+    sources = set(Token.objects.filter(
+        user__pk=user_id,
+        source__name__in=ads.COLLECTORS
+    ).values_list('source__name', flat=True))
+    for source in ads.COLLECTORS:
+        if source not in sources:
+            continue
+        clients_id = list(AgencyClient.objects.filter(
+            user__pk=user_id,
+            source__name=source
+        ).order_by('client_id').values_list('client_id', flat=True))
+        for start in range(0, len(clients_id), step):
+            parts.append({'source': source,
+                          'client_ids': clients_id[start:start + step]})
+        parts.append({'source': source, 'exclude_client_ids': clients_id})
+    return parts
+
+
+def create_run(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False,
+        incremental: bool = False
+) -> CollectionRun:
+    """Запуск сбора с сохраненным планом частей."""
+    sources = {source.name: source
+               for source in Source.objects.filter(name__in=ads.COLLECTORS)}
+    with transaction.atomic():
+        run = CollectionRun.objects.create(
+            user_id=user_id,
+            date_from=date_from,
+            date_to=date_to,
+            force_refresh=force_refresh,
+            incremental=incremental
+        )
+        CollectionPart.objects.bulk_create([
+            CollectionPart(run=run, source=sources[part['source']],
+                           client_ids=part.get('client_ids'),
+                           exclude_client_ids=part.get('exclude_client_ids'))
+            for part in collection_parts(user_id)
+            if part['source'] in sources
+        ])
+    return run
+
+
+@contextmanager
+def run_lock(user_id: int) -> Iterator[None]:
+    """
+    Блокировка запусков сбора пользователя в общем хранилище: проверка
+    выполняющихся запусков и создание нового идут атомарно для всех
+    воркеров. Значение блокировки - токен владельца, снимает ее только
+    тот, кто ее поставил.
+    """
+    store = default_store()
+    key = RUN_LOCK_KEY.format(user_id)
+    token = uuid4().hex
+    deadline = monotonic() + RUN_LOCK_TIMEOUT
+    while not store.add(key, token, RUN_LOCK_TIMEOUT):
+        if monotonic() >= deadline:
+            # Блокировка осталась от упавшего воркера и истечет сама.
+            break
+        sleep(RUN_LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        if store.get(key) == token:
+            store.delete(key)
+
+
+def in_flight_runs(
+        user_id: int,
+        date_from: date,
+        date_to: date
+) -> List[CollectionRun]:
+    """
+    Выполняющиеся запуски пользователя, период которых пересекается с
+    запрошенным: они пишут те же дни, с какими бы флагами ни были
+    запущены. Запуски, которые не обновлялись дольше
+    COLLECTION_RUN_STALE_AFTER секунд, считаются зависшими.
+    """
+    stale_at = timezone.now() - timedelta(
+        seconds=settings.COLLECTION_RUN_STALE_AFTER)
+    return list(CollectionRun.objects.filter(
+        user__pk=user_id,
+        status=CollectionRun.RUNNING,
+        updated__gte=stale_at,
+        date_from__lte=date_to,
+        date_to__gte=date_from
+    ).order_by('date_from'))
+
+
+def uncovered_ranges(
+        date_from: date,
+        date_to: date,
+        covered: List[Tuple[date, date]]
+) -> List[Tuple[date, date]]:
+    """Части периода, не входящие ни в один из диапазонов covered."""
+    ranges = []
+    start = date_from
+    for covered_from, covered_to in sorted(covered):
+        if covered_to < start:
+            continue
+        if covered_from > date_to:
+            break
+        if covered_from > start:
+            ranges.append((start, covered_from - timedelta(days=1)))
+        start = max(start, covered_to + timedelta(days=1))
+    if start <= date_to:
+        ranges.append((start, date_to))
+    return ranges
+
+
+def start_runs(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False,
+        incremental: bool = False
+) -> Tuple[List[CollectionRun], List[CollectionRun]]:
+    """
+    Создает запуски только для дней периода, которые не собирают
+    выполняющиеся запуски. Возвращает созданные запуски и выполняющиеся,
+    к которым присоединился запрос.
+    """
+    date_from = date.fromisoformat(date_from)
+    date_to = date.fromisoformat(date_to)
+    with run_lock(user_id):
+        attached = in_flight_runs(user_id, date_from, date_to)
+        ranges = uncovered_ranges(
+            date_from, date_to,
+            [(run.date_from, run.date_to) for run in attached]
+        )
+        created = [
+            create_run(user_id, range_from.isoformat(), range_to.isoformat(),
+                       force_refresh, incremental)
+            for range_from, range_to in ranges
+        ]
+    return created, attached
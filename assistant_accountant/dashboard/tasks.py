@@ -1,21 +1,217 @@
 import json
+from datetime import date, timedelta
+from time import monotonic
+from typing import Dict, List
 
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
 
-from . import ads
+from . import ads, campaigns
+from .models import CollectionPart, CollectionRun, RunCheckpoint, Token
+from .runs import start_runs
+from .tokens import TokenService
 from .write_ads_data import WriteDB
+from core.yandex.exceptions import UnitsExhaustedError
+
+
+def dispatch_run(run: CollectionRun) -> int:
+    """
+    Ставит в очередь незавершенные части запуска и итоговую таску. Время
+    части ограничено таймаутом ее источника (ADS_SOURCE_TIMEOUTS).
+    """
+    parts = list(run.parts.filter(done=False).values_list('pk',
+                                                          'source__name'))
+    if not parts:
+        summarise_spending.delay([], run.pk)
+        return 0
+    header = group(
+        collect_source_spending.s(part_id).set(
+            soft_time_limit=settings.ADS_SOURCE_TIMEOUTS.get(source))
+        for part_id, source in parts
+    )
+    chord(header)(summarise_spending.s(run.pk))
+    return len(parts)
 
 
 @shared_task(name='collect_agency_client_spending')
-def collect_agency_client_spending(user_id: int, date_from: str, date_to: str):
+def collect_agency_client_spending(
+        user_id: int,
+        date_from: str,
+        date_to: str,
+        force_refresh: bool = False,
+        incremental: bool = False
+):
     """
-    Format date_from, date_to %Y-%d-%m
+    Format date_from, date_to %Y-%m-%d
     Таска собирает финансовую статистику клиентов агентства из рекламных
-    кабинетов.
+    кабинетов. force_refresh - не использовать кэш закрытых дней,
+    incremental - собирать дни после отметки клиента (report_cache).\n
+    Сбор делится на части (collection_parts), каждая часть - отдельная
+    таска collect_source_spending, их выполняют все воркеры. Итог
+    подводит summarise_spending после завершения всех частей. План и
+    ход сбора сохраняются в CollectionRun, незавершенный запуск
+    продолжается таской resume_collection.\n
+    Дни, которые уже собирает выполняющийся запуск пользователя, повторно
+    не собираются (runs.start_runs): если весь период занят, таска
+    присоединяется к этим запускам.
     """
-    data = ads.get(user_id, date_from, date_to)
-    write_db = WriteDB(data)
-    write_db.save()
-    print(json.dumps(data, indent=4))
+    created, attached = start_runs(user_id, date_from, date_to,
+                                   force_refresh, incremental)
+    parts = sum(dispatch_run(run) for run in created)
     return (f'task: agency_client\nParameters: \n- user_id: {user_id}\n'
-            f'- date_from: {date_from}\n- date_to: {date_to}')
+            f'- date_from: {date_from}\n- date_to: {date_to}\n'
+            f'Runs: {[run.pk for run in created]}\nParts: {parts}\n'
+            f'Attached to runs: {[run.pk for run in attached]}')
+
+
+@shared_task(name='resume_collection')
+def resume_collection(run_id: int):
+    """
+    Продолжает запуск сбора: выполняются только незавершенные части, в них
+    пропускаются клиенты, данные которых уже сохранены.
+    """
+    run = CollectionRun.objects.get(pk=run_id)
+    run.status = CollectionRun.RUNNING
+    run.save(update_fields=['status', 'updated'])
+    parts = dispatch_run(run)
+    return f'task: resume_collection\nRun: {run_id}\nParts: {parts}'
+
+
+@shared_task(name='collect_incremental_spending')
+def collect_incremental_spending(user_id: int):
+    """
+    Инкрементальный сбор по сегодняшний день: для каждого клиента
+    запрашиваются дни после его отметки (с окном корректировок источника),
+    новые клиенты загружаются за SPENDING_BACKFILL_DAYS дней.
+    """
+    date_to = date.today()
+    date_from = date_to - timedelta(days=settings.SPENDING_BACKFILL_DAYS)
+    return collect_agency_client_spending(
+        user_id, date_from.isoformat(), date_to.isoformat(),
+        incremental=True
+    )
+
+
+@shared_task(name='schedule_incremental_spending')
+def schedule_incremental_spending():
+    """Периодическая таска: инкрементальный сбор для всех пользователей."""
+    users_id = list(Token.objects.values_list('user', flat=True).distinct())
+    for user_id in users_id:
+        collect_incremental_spending.delay(user_id)
+    return f'task: schedule_incremental_spending\nUsers: {users_id}'
+
+
+@shared_task(bind=True, name='collect_source_spending',
+             max_retries=3, default_retry_delay=60)
+def collect_source_spending(self, part_id: int) -> Dict:
+    """
+    Часть сбора (CollectionPart). Данные клиентов сразу пишутся в БД вместе
+    с отметками RunCheckpoint, клиенты с отметками пропускаются, поэтому
+    повтор части продолжает ее с места ошибки. Упавшая часть повторяется
+    отдельно, после max_retries возвращает статус error, чтобы итоговая
+    таска выполнилась для остальных частей. Если клиенты отложены до
+    восстановления лимитов API (Ads.postponed), часть остается
+    незавершенной со статусом postponed. Часть, не уложившаяся в таймаут
+    источника, не повторяется и возвращает статус timeout: сохраненные
+    клиенты остаются, остальных соберет resume_collection.
+    """
+    part = CollectionPart.objects.select_related('run', 'source').get(
+        pk=part_id)
+    run = part.run
+    source = part.source.name
+    started = monotonic()
+    done = set()
+    saved = 0
+    postponed = False
+    try:
+        done = set(RunCheckpoint.objects.filter(
+            run=run, source=part.source).values_list('client_id', flat=True))
+        if part.client_ids is None or not set(part.client_ids) <= done:
+            collector = ads.COLLECTORS[source](
+                run.user_id, run.date_from.isoformat(),
+                run.date_to.isoformat(), force_refresh=run.force_refresh,
+                incremental=run.incremental)
+            collector.select_clients(
+                part.client_ids, done | set(part.exclude_client_ids or []))
+            collector.share_roster(run.pk)
+            write_db = WriteDB(ads.stream_collector(collector), run=run)
+            write_db.save()
+            saved = write_db.saved
+            postponed = collector.postponed
+        if not postponed:
+            part.done = True
+            part.save(update_fields=['done'])
+        # Отметка активности запуска (runs.in_flight_runs).
+        run.save(update_fields=['updated'])
+    except UnitsExhaustedError:
+        postponed = True
+    except SoftTimeLimitExceeded:
+        return {'source': source, 'status': 'timeout',
+                'seconds': monotonic() - started}
+    except Exception as error:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=error)
+        return {'source': source, 'status': 'error', 'error': repr(error),
+                'seconds': monotonic() - started}
+    return {'source': source, 'status': 'postponed' if postponed else 'ok',
+            'records': saved, 'skipped': len(done),
+            'seconds': monotonic() - started}
+
+
+@shared_task(name='summarise_spending')
+def summarise_spending(results: List[Dict], run_id: int):
+    """
+    Итог сбора по источникам: записи, упавшие и отложенные части, время.
+    Запуск с отложенными частями остается выполняющимся и продолжается
+    таской resume_collection через COLLECTION_POSTPONED_RETRY_DELAY секунд.
+    """
+    run = CollectionRun.objects.get(pk=run_id)
+    summary = {}
+    postponed = False
+    for result in results:
+        source = summary.setdefault(result['source'], {
+            'parts': 0, 'failed': 0, 'postponed': 0, 'records': 0,
+            'seconds': 0.0
+        })
+        source['parts'] += 1
+        source['records'] += result.get('records', 0)
+        source['seconds'] += result['seconds']
+        if result['status'] == 'postponed':
+            source['postponed'] += 1
+            postponed = True
+        elif result['status'] != 'ok':
+            source['failed'] += 1
+    if postponed:
+        run.status = CollectionRun.RUNNING
+        resume_collection.apply_async(
+            (run.pk,), countdown=settings.COLLECTION_POSTPONED_RETRY_DELAY)
+    elif run.parts.filter(done=False).exists():
+        run.status = CollectionRun.FAILED
+    else:
+        run.status = CollectionRun.DONE
+    run.save(update_fields=['status', 'updated'])
+    return (f'task: summarise_spending\nParameters: \n- user_id: '
+            f'{run.user_id}\n- date_from: {run.date_from}\n- date_to: '
+            f'{run.date_to}\nRun: {run_id} {run.status}\n'
+            f'Sources: {json.dumps(summary)}')
+
+
+@shared_task(name='sync_campaigns')
+def sync_campaigns(user_id: int):
+    """
+    Таска синхронизирует каталог кампаний клиентов агентства из
+    рекламных кабинетов.
+    """
+    result = campaigns.sync(user_id)
+    return (f'task: sync_campaigns\nParameters: \n- user_id: {user_id}\n'
+            f'Result: {json.dumps(result)}')
+
+
+@shared_task(name='refresh_tokens')
+def refresh_tokens():
+    """
+    Периодическая таска: заранее обновляет токены, которые скоро истекут.
+    """
+    result = TokenService().refresh_expiring()
+    return f'task: refresh_tokens\nResult: {json.dumps(result)}'
@@ -0,0 +1,441 @@
+import asyncio
+import signal
+from datetime import date
+from time import sleep
+from unittest.mock import patch
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.test import SimpleTestCase, TestCase
+
+from core.store import MemoryStore
+from core.yandex.exceptions import (UnitsExhaustedError,
+                                    YandexDirectApiRequestError)
+from core.yandex.splitting import ChunkSizeEstimator
+from core.yandex.units import Units, UnitsLedger
+from core.vk import ads as vk_ads
+from dashboard import aio_ads
+from dashboard.ads import (RecordStream, StreamCancelledError,
+                           VKCollectData, YandexCollectData,
+                           stream_collector)
+from dashboard.models import (User, Source, Token, AgencyClient,
+                              YANDEX_DIRECT, VK_ADS)
+from dashboard.records import DailyCost
+
+
+class YandexCollectDataTest(TestCase):
+    USER1 = 'user1'
+    DATE_FROM = '2022-11-01'
+    DATE_TO = '2022-11-02'
+    LOGINS = ['login-1', 'login-2', 'login-3']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(cls.USER1)
+        cls.source = Source.objects.create(name=YANDEX_DIRECT)
+        cls.token = Token.objects.create(user=cls.user, source=cls.source,
+                                         access_token='qwe', expires_in=666)
+
+    def make_collector(self, **kwargs):
+        collector = YandexCollectData(self.user.pk, self.DATE_FROM,
+                                      self.DATE_TO, **kwargs)
+        collector.units_ledger = UnitsLedger(MemoryStore())
+        collector.chunk_estimator = ChunkSizeEstimator(
+            YandexCollectData.REPORT_TYPE, MemoryStore())
+        collector.prepare_agency_clients(
+            [{'Login': login, 'ClientId': i}
+             for i, login in enumerate(self.LOGINS)]
+        )
+        return collector
+
+    def test_reports_concurrency_limit(self):
+        """Число параллельных отчетов не превышает лимит API."""
+        collector = self.make_collector(reports_concurrency=100)
+        self.assertEqual(collector.reports_concurrency,
+                         YandexCollectData.MAX_REPORTS_IN_FLIGHT)
+
+    @patch('core.yandex.direct.ClientCostReport.poll', autospec=True)
+    def test_statistic_merge(self, mock_poll):
+        """Статистика каждого логина попадает в данные своего клиента."""
+        mock_poll.side_effect = lambda report: ({
+            'result': [{'Date': '2022-11-01',
+                        'Cost': report.client_login[-1]}]
+        }, None)
+        collector = self.make_collector(reports_concurrency=3)
+        collector.statistic()
+        for login in self.LOGINS:
+            with self.subTest(login=login):
+                self.assertEqual(
+                    collector.data[login].stats,
+                    [DailyCost(date(2022, 11, 1), int(login[-1]) * 100)]
+                )
+
+    @patch('core.yandex.direct.ClientCostReport.poll', autospec=True)
+    def test_statistic_chunk_retry(self, mock_poll):
+        """Период делится на куски, повторно запрашивается только
+        упавший кусок."""
+        calls = []
+
+        def poll(report):
+            criteria = report.payload.payload['params']['SelectionCriteria']
+            chunk = (report.client_login, criteria['DateFrom'])
+            calls.append(chunk)
+            if chunk == ('login-1', '2022-11-02') and calls.count(chunk) == 1:
+                raise YandexDirectApiRequestError()
+            rows = [{'Date': criteria['DateFrom'], 'Cost': 1}]
+            return {'result': rows}, None
+
+        mock_poll.side_effect = poll
+        collector = self.make_collector()
+        collector.chunk_estimator.chunk_days = lambda rows_per_day: 1
+        collector.statistic()
+        self.assertEqual(calls.count(('login-1', '2022-11-02')), 2)
+        self.assertEqual(len(calls), len(self.LOGINS) * 2 + 1)
+        for login in self.LOGINS:
+            with self.subTest(login=login):
+                self.assertEqual(
+                    [str(stat.date) for stat in collector.data[login].stats],
+                    ['2022-11-01', '2022-11-02']
+                )
+                self.assertEqual(collector.data[login].stats_period,
+                                 (self.DATE_FROM, self.DATE_TO))
+
+    @patch('core.yandex.direct.ClientCostReport.poll', autospec=True)
+    def test_statistic_emit(self, mock_poll):
+        """С sink готовые записи отдаются сразу и не копятся в data."""
+        mock_poll.return_value = ({'result': []}, None)
+        collector = self.make_collector()
+        emitted = []
+        collector.sink = emitted.append
+        collector.statistic()
+        self.assertEqual(sorted(record.name for record in emitted),
+                         self.LOGINS)
+        self.assertEqual(collector.data, {})
+
+    @patch('core.yandex.direct.ClientCostReport.poll', autospec=True)
+    def test_statistic_cancelled(self, mock_poll):
+        """Отмена потокового сбора прерывает опрос, куски не повторяются."""
+        mock_poll.return_value = ({'result': []}, None)
+        collector = self.make_collector()
+        collector.chunk_estimator.chunk_days = lambda rows_per_day: 1
+
+        def sink(record):
+            raise StreamCancelledError()
+
+        collector.sink = sink
+        with self.assertRaises(StreamCancelledError):
+            collector.statistic()
+        self.assertLess(mock_poll.call_count, len(self.LOGINS) * 2)
+
+    def test_order_by_units(self):
+        """Логины с малым остатком баллов откладываются, остальные
+        упорядочены по остатку."""
+        collector = self.make_collector()
+        ledger = collector.units_ledger
+        for login, remaining in (('login-1', 500), ('login-2', 50),
+                                 ('login-3', 900)):
+            ledger.record('qwe', login, Units(1, remaining, 1000),
+                          client_login=login)
+        self.assertEqual(collector.order_by_units(self.LOGINS + ['new']),
+                         ['new', 'login-3', 'login-1'])
+        self.assertEqual(collector.postponed_logins, ['login-2'])
+        self.assertNotIn('login-2', collector.data)
+
+    @patch('core.yandex.direct.ClientCostReport.poll', autospec=True)
+    def test_postponed_by_charged_units(self, mock_poll):
+        """Отчеты, оплачиваемые из баллов агентства, откладываются по ним,
+        записи отложенных логинов не отдаются."""
+        mock_poll.return_value = ({'result': []}, None)
+        collector = self.make_collector()
+        ledger = collector.units_ledger
+        ledger.record('qwe', 'login-1', Units(1, 900, 1000),
+                      client_login='login-1')
+        ledger.record('qwe', 'agency', Units(1, 10, 1000),
+                      client_login='login-2')
+        ledger.record('qwe', 'agency', Units(1, 10, 1000))
+        emitted = []
+        collector.sink = emitted.append
+        collector.statistic()
+        self.assertEqual([record.name for record in emitted], ['login-1'])
+        self.assertEqual(collector.postponed_logins, ['login-2', 'login-3'])
+        self.assertTrue(collector.postponed)
+
+    def test_exhausted_token_units(self):
+        """Без баллов токена балансы не запрашиваются, логины
+        откладываются."""
+        collector = self.make_collector()
+        collector.units_ledger.record('qwe', 'agency', Units(1, 0, 1000))
+        collector.account_management()
+        self.assertEqual(collector.postponed_logins, self.LOGINS)
+        self.assertEqual(collector.data, {})
+        with self.assertRaises(UnitsExhaustedError):
+            collector.agency_clients()
+
+    @patch('core.yandex.direct.AgencyClients.get')
+    def test_incremental_agency_clients(self, mock_get):
+        """Сохраненные клиенты используются до истечения интервала."""
+        mock_get.return_value = [{'Login': 'api-login', 'ClientId': 1}]
+        collector = YandexCollectData(self.user.pk, self.DATE_FROM,
+                                      self.DATE_TO)
+        collector.agency_clients()
+        self.assertEqual(list(collector.data), ['api-login'])
+        self.assertIsNotNone(
+            Token.objects.get(pk=self.token.pk).clients_synced_at)
+
+        AgencyClient.objects.create(user=self.user, source=self.source,
+                                    client_id=1, name='stored-login')
+        collector = YandexCollectData(self.user.pk, self.DATE_FROM,
+                                      self.DATE_TO)
+        collector.agency_clients()
+        self.assertEqual(list(collector.data), ['stored-login'])
+        self.assertEqual(mock_get.call_count, 1)
+
+        collector = YandexCollectData(self.user.pk, self.DATE_FROM,
+                                      self.DATE_TO, incremental_clients=False)
+        collector.agency_clients()
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('core.yandex.direct.AgencyClients.get')
+    def test_shared_roster(self, mock_get):
+        """Полный список клиентов загружается один раз на запуск сбора."""
+        mock_get.return_value = [{'Login': 'api-login', 'ClientId': 1}]
+        store = MemoryStore()
+        with patch('dashboard.ads.default_store', return_value=store):
+            collectors = [YandexCollectData(self.user.pk, self.DATE_FROM,
+                                            self.DATE_TO) for _ in range(2)]
+            for collector in collectors:
+                collector.share_roster(run_id=1)
+                collector.agency_clients()
+                self.assertEqual(list(collector.data), ['api-login'])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('core.yandex.direct.AccountManagement.get', autospec=True)
+    def test_account_management_chunk_retry(self, mock_get):
+        """Повторяется только упавшая пачка логинов."""
+        calls = []
+
+        def account_management(api):
+            logins = api.payload.payload['param']['SelectionCriteria'][
+                'Logins']
+            calls.append(logins[0])
+            if logins[0] == 'login-50' and calls.count('login-50') == 1:
+                raise YandexDirectApiRequestError()
+            return {'data': {'Accounts': [
+                {'Login': login, 'Amount': '1.5'} for login in logins
+            ]}}
+
+        mock_get.side_effect = account_management
+        collector = YandexCollectData(self.user.pk, self.DATE_FROM,
+                                      self.DATE_TO)
+        collector.ACCOUNT_MANAGEMENT_RETRY_DELAY = 0
+        collector.prepare_agency_clients(
+            [{'Login': f'login-{i}', 'ClientId': i} for i in range(120)]
+        )
+        collector.account_management()
+        self.assertEqual(sorted(calls),
+                         ['login-0', 'login-100', 'login-50', 'login-50'])
+        self.assertTrue(all(record.balance.amount == 150
+                            for record in collector.get_data()))
+
+
+class VKCollectDataTest(TestCase):
+    DATE_FROM = '2022-11-01'
+    DATE_TO = '2022-11-02'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user('user1')
+        source = Source.objects.create(name=VK_ADS)
+        Token.objects.create(user=cls.user, source=source,
+                             access_token='qwe', expires_in=666)
+
+    def fake_run(self, clients):
+        def run(api):
+            if isinstance(api, vk_ads.Account):
+                return {'response': [{'account_id': account_id}
+                                     for account_id in clients]}
+            if isinstance(api, vk_ads.Clients):
+                return {'response': [{'id': client_id, 'name': 'name'}
+                                     for client_id in clients[api.account_id]]}
+            return {'response': [
+                {'id': client_id, 'stats': [{'day': api.date_from,
+                                             'spent': client_id}]}
+                for client_id in api.id_clients
+            ]}
+        return run
+
+    @patch('core.vk.ads.BaseApi.run', autospec=True)
+    def test_parallel_accounts(self, mock_run):
+        """Кабинеты собираются параллельно, данные не теряются."""
+        clients = {account_id: [account_id * 10 + i for i in range(3)]
+                   for account_id in range(1, 9)}
+        mock_run.side_effect = self.fake_run(clients)
+        collector = VKCollectData(self.user.pk, self.DATE_FROM, self.DATE_TO,
+                                  accounts_concurrency=4)
+        data = collector.get()
+        self.assertEqual(len(data), 24)
+        for record in data:
+            with self.subTest(client_id=record.client_id):
+                self.assertEqual(record.stats, [
+                    DailyCost(date(2022, 11, 1), record.client_id * 100)
+                ])
+
+    @patch('core.vk.ads.BaseApi.run', autospec=True)
+    def test_emit_per_account(self, mock_run):
+        """Записи кабинета отдаются, не дожидаясь остальных кабинетов."""
+        emitted = []
+        emitted_before = []
+        fake_run = self.fake_run({account_id: [account_id]
+                                  for account_id in range(1, 5)})
+
+        def run(api):
+            if isinstance(api, vk_ads.Statistic):
+                emitted_before.append(len(emitted))
+            return fake_run(api)
+
+        mock_run.side_effect = run
+        collector = VKCollectData(self.user.pk, self.DATE_FROM, self.DATE_TO,
+                                  accounts_concurrency=2)
+        collector.sink = emitted.append
+        collector.get()
+        self.assertGreater(max(emitted_before), 0)
+        self.assertEqual(sorted(record.client_id for record in emitted),
+                         [1, 2, 3, 4])
+        self.assertEqual(collector.data, {})
+
+    @patch('core.vk.ads.BaseApi.run', autospec=True)
+    def test_parallel_duplicate_client(self, mock_run):
+        mock_run.side_effect = self.fake_run({1: [10, 11], 2: [11]})
+        collector = VKCollectData(self.user.pk, self.DATE_FROM, self.DATE_TO,
+                                  accounts_concurrency=2)
+        with self.assertRaises(ValueError):
+            collector.get()
+
+    @patch('core.vk.ads.BaseApi.run', autospec=True)
+    def test_shared_roster(self, mock_run):
+        """Кабинеты и клиенты загружаются один раз на запуск сбора."""
+        calls = []
+        fake_run = self.fake_run({1: [10, 11], 2: [20]})
+
+        def run(api):
+            calls.append(type(api))
+            return fake_run(api)
+
+        mock_run.side_effect = run
+        store = MemoryStore()
+        with patch('dashboard.ads.default_store', return_value=store):
+            for client_ids in ([10], [11, 20]):
+                collector = VKCollectData(self.user.pk, self.DATE_FROM,
+                                          self.DATE_TO,
+                                          accounts_concurrency=2)
+                collector.select_clients(client_ids)
+                collector.share_roster(run_id=1)
+                data = collector.get()
+                self.assertEqual(
+                    sorted(record.client_id for record in data), client_ids)
+        self.assertEqual(calls.count(vk_ads.Account), 1)
+        self.assertEqual(calls.count(vk_ads.Clients), 2)
+
+    @patch('core.vk.ads.BaseApi.run', autospec=True)
+    def test_time_limit(self, mock_run):
+        """
+        Мягкий лимит времени таски во время сбора останавливает запросы к
+        API, поток сбора завершается.
+        """
+        calls = []
+        fake_run = self.fake_run({account_id: [account_id]
+                                  for account_id in range(1, 21)})
+
+        def run(api):
+            if isinstance(api, vk_ads.Statistic):
+                calls.append(api.account_id)
+                sleep(0.05)
+            return fake_run(api)
+
+        def time_limit(signum, frame):
+            raise SoftTimeLimitExceeded()
+
+        mock_run.side_effect = run
+        collector = VKCollectData(self.user.pk, self.DATE_FROM, self.DATE_TO,
+                                  accounts_concurrency=2)
+        stream = stream_collector(collector)
+        handler = signal.signal(signal.SIGALRM, time_limit)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0.1)
+            with self.assertRaises(SoftTimeLimitExceeded):
+                list(stream)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+        stopped_at = len(calls)
+        self.assertLess(stopped_at, 20)
+        self.assertIsInstance(stream.error, StreamCancelledError)
+        sleep(0.1)
+        self.assertEqual(len(calls), stopped_at)
+
+
+class AsyncRunSourcesTest(SimpleTestCase):
+
+    def test_isolated_failures(self):
+        """Источник с истекшим таймаутом отменяется, остальные собраны."""
+        cancelled = []
+
+        async def ok():
+            return [{'client_id': 1}]
+
+        async def failed():
+            raise ValueError('outage')
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        result = asyncio.run(aio_ads.run_sources(
+            {'ok': ok, 'failed': failed, 'slow': slow},
+            timeouts={'slow': 0.05}
+        ))
+        self.assertEqual(result['data'], [{'client_id': 1}])
+        sources = result['sources']
+        self.assertEqual(sources['ok']['records'], 1)
+        self.assertIn('outage', sources['failed']['error'])
+        self.assertEqual(sources['slow']['status'], 'timeout')
+        self.assertEqual(cancelled, [True])
+
+
+class RecordStreamTest(SimpleTestCase):
+
+    def test_backpressure(self):
+        """Сбор ждет, пока потребитель не заберет записи из очереди."""
+        produced = []
+
+        def collect(sink):
+            for i in range(10):
+                sink({'client_id': i})
+                produced.append(i)
+            return {'data': [{'client_id': 10}], 'sources': {}}
+
+        stream = RecordStream(collect, maxsize=2)
+        consumed = []
+        for record in stream:
+            # В очереди не больше maxsize записей, еще одна ждет в put.
+            self.assertLessEqual(len(produced) - len(consumed), 3)
+            consumed.append(record['client_id'])
+        self.assertEqual(consumed, list(range(11)))
+        self.assertEqual(stream.result['sources'], {})
+
+    def test_consumer_stopped(self):
+        """Остановка потребителя прерывает сбор, поток не зависает."""
+        def collect(sink):
+            for i in range(100):
+                sink({'client_id': i})
+            return {'data': [], 'sources': {}}
+
+        stream = RecordStream(collect, maxsize=2)
+        with self.assertRaises(ValueError):
+            for record in stream:
+                raise ValueError('write failed')
+        self.assertIsInstance(stream.error, StreamCancelledError)
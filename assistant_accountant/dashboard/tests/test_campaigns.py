@@ -0,0 +1,133 @@
+from copy import deepcopy
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from core.store import MemoryStore
+from core.vk.exceptions import VkFloodControlError
+from dashboard import campaigns
+from dashboard.campaigns import (CampaignWriter, MyTargetCampaignSync,
+                                 VKCampaignSync, YandexCampaignSync)
+from dashboard.models import (User, Source, AgencyClient, Campaign, Token,
+                              VkAccount, YANDEX_DIRECT, VK_ADS, MY_TARGET)
+
+
+class CampaignWriterTest(TestCase):
+    USER1 = 'user1'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        user = User.objects.create_user(cls.USER1)
+        source = Source.objects.create(name=YANDEX_DIRECT)
+        cls.client_ = AgencyClient.objects.create(
+            user=user, source=source, client_id=1, name='login')
+
+    def write(self, campaigns):
+        writer = CampaignWriter(batch_size=2)
+        writer.write(self.client_, campaigns)
+        writer.flush()
+        return writer
+
+    def test_bulk_upsert(self):
+        """Новые кампании создаются, измененные обновляются."""
+        self.write([{'campaign_id': i, 'name': f'c{i}'} for i in range(5)])
+        self.assertEqual(Campaign.objects.count(), 5)
+        writer = self.write([{'campaign_id': 1, 'name': 'renamed'},
+                             {'campaign_id': 5, 'name': 'c5'}])
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(Campaign.objects.count(), 6)
+        self.assertEqual(Campaign.objects.get(campaign_id=1).name, 'renamed')
+
+    def test_skip_unchanged(self):
+        """Неизменившиеся кампании не пишутся повторно."""
+        campaigns = [{'campaign_id': i, 'name': f'c{i}'} for i in range(3)]
+        self.write(campaigns)
+        writer = self.write(campaigns)
+        self.assertEqual(writer.written, 0)
+        self.assertEqual(writer.skipped, 3)
+
+
+class CampaignSyncTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user('user1')
+        cls.sources = {}
+        for name in (YANDEX_DIRECT, VK_ADS, MY_TARGET):
+            cls.sources[name] = Source.objects.create(name=name)
+            Token.objects.create(user=cls.user, source=cls.sources[name],
+                                 access_token='qwe', expires_in=666)
+
+    def make_client(self, source, **kwargs):
+        return AgencyClient.objects.create(
+            user=self.user, source=self.sources[source], client_id=1,
+            name='login', **kwargs)
+
+    def campaign_names(self):
+        return list(Campaign.objects.order_by('campaign_id').values_list(
+            'name', flat=True))
+
+    @patch('core.yandex.direct.Campaigns.run_api_request', autospec=True)
+    def test_yandex(self, mock_request):
+        """Все страницы кампаний, SelectionCriteria передается пустым."""
+        payloads = []
+        pages = [
+            {'result': {'Campaigns': [{'Id': 1, 'Name': 'c1'}],
+                        'LimitedBy': 1}},
+            {'result': {'Campaigns': [{'Id': 2, 'Name': 'c2'}]}}
+        ]
+
+        def run_api_request(api):
+            payloads.append(deepcopy(api.payload.payload['params']))
+            self.assertEqual(api.get_headers()['Client-Login'], 'login')
+            return pages[len(payloads) - 1]
+
+        mock_request.side_effect = run_api_request
+        self.make_client(YANDEX_DIRECT)
+        writer = YandexCampaignSync(self.user.pk).sync()
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(self.campaign_names(), ['c1', 'c2'])
+        self.assertEqual([payload['SelectionCriteria']
+                          for payload in payloads], [{}, {}])
+        self.assertEqual([payload['Page']['Offset'] for payload in payloads],
+                         [0, 1])
+
+    @patch('core.concurrency.sleep')
+    @patch('core.vk.ads.Campaigns.get', autospec=True)
+    def test_vk(self, mock_get, mock_sleep):
+        """Кампании клиента кабинета, запрос повторяется после лимита."""
+        mock_get.side_effect = [VkFloodControlError(),
+                                {'response': [{'id': 1, 'name': 'c1'}]}]
+        account = VkAccount.objects.create(user=self.user, name='user1',
+                                           account_id=10)
+        self.make_client(VK_ADS, account=account)
+        writer = VKCampaignSync(self.user.pk).sync()
+        self.assertEqual(writer.written, 1)
+        self.assertEqual(mock_get.call_count, 2)
+        api = mock_get.call_args[0][0]
+        self.assertEqual((api.account_id, api.client_id), (10, 1))
+
+    @patch('core.my_target.ads.Campaigns.api_request', autospec=True)
+    @patch('dashboard.campaigns.MyTargetCampaignSync.create_client_token')
+    def test_my_target(self, mock_token, mock_request):
+        """Токен клиента создается один раз и берется из хранилища."""
+        mock_token.return_value = {'access_token': 'client-token',
+                                   'expires_in': 3600}
+        mock_request.side_effect = lambda api: {
+            'count': 1, 'items': [{'id': 1, 'name': api.access_token}]}
+        self.make_client(MY_TARGET)
+        with patch('dashboard.campaigns.default_store',
+                   return_value=MemoryStore()):
+            for _ in range(2):
+                MyTargetCampaignSync(self.user.pk).sync()
+        mock_token.assert_called_once()
+        self.assertEqual(self.campaign_names(), ['client-token'])
+
+    def test_sources_without_token(self):
+        """Источники без токена пользователя не синхронизируются."""
+        Token.objects.filter(user=self.user).exclude(
+            source__name=VK_ADS).delete()
+        self.assertEqual(campaigns.sync(self.user.pk),
+                         {VK_ADS: {'written': 0, 'skipped': 0}})
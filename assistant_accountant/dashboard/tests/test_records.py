@@ -0,0 +1,31 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from dashboard.records import (BalanceSnapshot, ClientRecord, DailyCost,
+                               from_minor, to_minor)
+
+
+class RecordsTest(SimpleTestCase):
+
+    def test_to_minor(self):
+        """Суммы всех источников приводятся к целым копейкам."""
+        self.assertEqual(to_minor('123.45'), 12345)
+        self.assertEqual(to_minor(0.1 + 0.2), 30)
+        self.assertEqual(to_minor(Decimal('1.005')), 101)
+        self.assertEqual(to_minor(7), 700)
+        self.assertEqual(to_minor(None), 0)
+        self.assertEqual(from_minor(12345), 123.45)
+
+    def test_daily_cost(self):
+        self.assertEqual(DailyCost.parse('2022-11-01', '1.5'),
+                         DailyCost(date(2022, 11, 1), 150))
+
+    def test_slots(self):
+        """У записей нет __dict__: память не растет на словарь полей."""
+        record = ClientRecord('vk_ads', 1, 2, 'name',
+                              BalanceSnapshot(0, date(2022, 11, 1)))
+        self.assertEqual(record.stats, [])
+        with self.assertRaises(AttributeError):
+            record.extra = 1
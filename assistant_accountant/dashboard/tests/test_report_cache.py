@@ -0,0 +1,133 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from dashboard.ads import MyTargetCollectData
+from dashboard.models import (User, Source, AgencyClient, StatisticCoverage,
+                              Token, MY_TARGET)
+from dashboard.records import BalanceSnapshot, ClientRecord
+from dashboard.report_cache import ReportCache
+from dashboard.write_ads_data import WriteDB
+
+
+@override_settings(STATISTIC_CORRECTION_WINDOW={MY_TARGET: 3})
+class ReportCacheTest(TestCase):
+    USER1 = 'user1'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(cls.USER1)
+        cls.source = Source.objects.create(name=MY_TARGET)
+        cls.client_ = AgencyClient.objects.create(
+            user=cls.user, source=cls.source, client_id=1, name='client')
+        cls.today = date.today()
+        cls.date_from = cls.today - timedelta(days=10)
+        cls.closed_to = cls.today - timedelta(days=3)
+
+    def make_cache(self, force=False, incremental=False):
+        return ReportCache(self.user.pk, MY_TARGET,
+                           self.date_from.isoformat(),
+                           self.today.isoformat(), force=force,
+                           incremental=incremental)
+
+    def cover(self):
+        StatisticCoverage.objects.create(client=self.client_,
+                                         date_from=self.date_from,
+                                         date_to=self.closed_to)
+
+    def test_fetch_from(self):
+        """Закрытые дни запрашиваются, только если их нет в кэше."""
+        self.assertEqual(self.make_cache().fetch_from(1),
+                         self.date_from.isoformat())
+        self.cover()
+        open_from = (self.closed_to + timedelta(days=1)).isoformat()
+        self.assertEqual(self.make_cache().fetch_from(1), open_from)
+        self.assertEqual(self.make_cache().fetch_from(2),
+                         self.date_from.isoformat())
+        self.assertEqual(self.make_cache(force=True).fetch_from(1),
+                         self.date_from.isoformat())
+        self.assertEqual(self.make_cache().group_by_fetch_from([1, 2]), {
+            open_from: [1], self.date_from.isoformat(): [2]
+        })
+
+    def test_incremental_fetch_from(self):
+        """Инкрементальный сбор идет от отметки клиента, новые клиенты -
+        с начала периода."""
+        StatisticCoverage.objects.create(
+            client=self.client_, date_from=self.today - timedelta(days=5),
+            date_to=self.closed_to)
+        cache = self.make_cache(incremental=True)
+        self.assertEqual(
+            cache.fetch_from(1),
+            (self.closed_to + timedelta(days=1)).isoformat())
+        self.assertEqual(cache.fetch_from(2), self.date_from.isoformat())
+
+    @patch('dashboard.ads.MyTargetCollectData.api_request')
+    def test_cached_days_not_collected(self, mock_request):
+        """В записях коллектора только дни из API, закрытые дни из кэша
+        повторно не пишутся."""
+        Token.objects.create(user=self.user, source=self.source,
+                             access_token='qwe', expires_in=666)
+        self.cover()
+        open_from = self.closed_to + timedelta(days=1)
+        mock_request.side_effect = [
+            [{'user': {'id': 1, 'client_username': 'client',
+                       'account': {'balance': '0'}}}],
+            {'items': [{'id': 1, 'rows': [
+                {'date': open_from.isoformat(), 'base': {'spent': '1'}}
+            ]}]}
+        ]
+        collector = MyTargetCollectData(self.user.pk,
+                                        self.date_from.isoformat(),
+                                        self.today.isoformat())
+        records = collector.get()
+        self.assertEqual([stat.date for stat in records[0].stats],
+                         [open_from])
+        self.assertEqual(mock_request.call_args_list[1][0][0].date_from,
+                         open_from.isoformat())
+
+    def test_write_marks_coverage(self):
+        """После записи статистики закрытые дни периода попадают в кэш."""
+        WriteDB([ClientRecord(
+            source=MY_TARGET,
+            user_id=self.user.pk,
+            client_id=1,
+            name='client',
+            balance=BalanceSnapshot(0, self.today),
+            stats_period=(self.date_from.isoformat(),
+                          self.today.isoformat())
+        )]).save()
+        coverage = StatisticCoverage.objects.get(client=self.client_)
+        self.assertEqual((coverage.date_from, coverage.date_to),
+                         (self.date_from, self.closed_to))
+
+    def test_mark_covered_merges_ranges(self):
+        self.cover()
+        earlier = self.date_from - timedelta(days=20)
+        ReportCache.mark_covered(self.client_, earlier.isoformat(),
+                                 self.date_from.isoformat())
+        coverage = StatisticCoverage.objects.get(client=self.client_)
+        self.assertEqual((coverage.date_from, coverage.date_to),
+                         (earlier, self.closed_to))
+
+    @override_settings(SPENDING_BACKFILL_DAYS=30)
+    def test_mark_covered_gap(self):
+        """Отметка не перескакивает пропуск внутри окна инкрементального
+        сбора, устаревшая отметка до окна заменяется."""
+        StatisticCoverage.objects.create(
+            client=self.client_, date_from=self.today - timedelta(days=60),
+            date_to=self.today - timedelta(days=20))
+        ReportCache.mark_covered(self.client_, self.date_from.isoformat(),
+                                 self.today.isoformat())
+        coverage = StatisticCoverage.objects.get(client=self.client_)
+        self.assertEqual(coverage.date_to, self.today - timedelta(days=20))
+        coverage.date_to = self.today - timedelta(days=50)
+        coverage.save()
+        restart_from = self.today - timedelta(days=40)
+        ReportCache.mark_covered(self.client_, restart_from.isoformat(),
+                                 self.today.isoformat())
+        coverage.refresh_from_db()
+        self.assertEqual((coverage.date_from, coverage.date_to),
+                         (restart_from, self.closed_to))
@@ -0,0 +1,188 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core.store import MemoryStore
+
+from dashboard import runs, tasks
+from dashboard.models import (User, Source, AgencyClient, CollectionRun,
+                              RunCheckpoint, Token, MY_TARGET, VK_ADS,
+                              YANDEX_DIRECT)
+
+
+class CollectionPartsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user1')
+        sources = {name: Source.objects.create(name=name)
+                   for name in (YANDEX_DIRECT, MY_TARGET, VK_ADS)}
+        for client_id in range(5):
+            AgencyClient.objects.create(user=cls.user, client_id=client_id,
+                                        name=str(client_id),
+                                        source=sources[YANDEX_DIRECT])
+        for name in (YANDEX_DIRECT, VK_ADS):
+            Token.objects.create(user=cls.user, source=sources[name],
+                                 access_token='qwe', expires_in=666)
+
+    @override_settings(COLLECT_CLIENTS_PER_TASK=2)
+    def test_parts(self):
+        """Сохраненные клиенты делятся на пачки, новые - отдельная часть."""
+        parts = [part for part in runs.collection_parts(self.user.pk)
+                 if part['source'] == YANDEX_DIRECT]
+        self.assertEqual(
+            [part.get('client_ids') for part in parts[:-1]],
+            [[0, 1], [2, 3], [4]]
+        )
+        self.assertEqual(parts[-1]['exclude_client_ids'], [0, 1, 2, 3, 4])
+        self.assertIn({'source': VK_ADS, 'exclude_client_ids': []},
+                      runs.collection_parts(self.user.pk))
+
+    def test_parts_without_token(self):
+        """Источники без токена пользователя не собираются."""
+        sources = {part['source']
+                   for part in runs.collection_parts(self.user.pk)}
+        self.assertEqual(sources, {YANDEX_DIRECT, VK_ADS})
+
+    def yandex_part(self, **kwargs):
+        run = runs.create_run(self.user.pk, '2022-11-01', '2022-11-02')
+        return run.parts.filter(source__name=YANDEX_DIRECT, **kwargs)[0]
+
+    @patch('dashboard.tasks.collect_source_spending.retry')
+    @patch('dashboard.ads.YandexCollectData.__init__')
+    def test_failed_part(self, mock_init, mock_retry):
+        """Часть после всех повторов возвращает статус error."""
+        mock_init.side_effect = ValueError('outage')
+        part = self.yandex_part()
+        result = tasks.collect_source_spending.apply(
+            args=(part.pk,),
+            retries=tasks.collect_source_spending.max_retries
+        ).get()
+        self.assertEqual(result['status'], 'error')
+        self.assertIn('outage', result['error'])
+        mock_retry.assert_not_called()
+        part.refresh_from_db()
+        self.assertFalse(part.done)
+
+    @patch('dashboard.ads.YandexCollectData.postponed', False)
+    @patch('dashboard.ads.stream_collector')
+    @patch('dashboard.ads.YandexCollectData.__init__', return_value=None)
+    def test_resume_skips_saved_clients(self, mock_init, mock_stream):
+        """Клиенты с отметками в запуске повторно не собираются."""
+        mock_stream.return_value = []
+        part = self.yandex_part(exclude_client_ids__isnull=False)
+        for client_id in (7, 8):
+            RunCheckpoint.objects.create(run=part.run, source=part.source,
+                                         client_id=client_id)
+        result = tasks.collect_source_spending.apply(args=(part.pk,)).get()
+        self.assertEqual(result['skipped'], 2)
+        collector = mock_stream.call_args.args[0]
+        self.assertEqual(collector.exclude_client_ids,
+                         {0, 1, 2, 3, 4, 7, 8})
+        part.refresh_from_db()
+        self.assertTrue(part.done)
+
+    @patch('dashboard.tasks.resume_collection.apply_async')
+    @patch('dashboard.ads.YandexCollectData.postponed', True)
+    @patch('dashboard.ads.stream_collector', return_value=[])
+    @patch('dashboard.ads.YandexCollectData.__init__', return_value=None)
+    def test_postponed_part(self, mock_init, mock_stream, mock_resume):
+        """Часть с отложенными клиентами не завершается, запуск
+        продолжается позже."""
+        part = self.yandex_part()
+        result = tasks.collect_source_spending.apply(args=(part.pk,)).get()
+        self.assertEqual(result['status'], 'postponed')
+        part.refresh_from_db()
+        self.assertFalse(part.done)
+        tasks.summarise_spending([result], part.run.pk)
+        part.run.refresh_from_db()
+        self.assertEqual(part.run.status, CollectionRun.RUNNING)
+        mock_resume.assert_called_once()
+
+
+class UncoveredRangesTest(SimpleTestCase):
+
+    def test_ranges(self):
+        """Из периода вычитаются диапазоны выполняющихся запусков."""
+        ranges = runs.uncovered_ranges(
+            date(2022, 11, 1), date(2022, 11, 30),
+            [(date(2022, 11, 10), date(2022, 11, 12)),
+             (date(2022, 10, 1), date(2022, 11, 3)),
+             (date(2022, 11, 25), date(2022, 12, 31))]
+        )
+        self.assertEqual(ranges, [
+            (date(2022, 11, 4), date(2022, 11, 9)),
+            (date(2022, 11, 13), date(2022, 11, 24)),
+        ])
+        self.assertEqual(
+            runs.uncovered_ranges(date(2022, 11, 1), date(2022, 11, 2),
+                                  [(date(2022, 10, 1), date(2022, 12, 1))]),
+            []
+        )
+
+
+@patch('dashboard.runs.default_store', MemoryStore)
+class StartRunsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user1')
+        Source.objects.create(name=YANDEX_DIRECT)
+
+    def test_attach(self):
+        """Повторный запрос присоединяется к выполняющемуся запуску."""
+        created, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                            '2022-11-10')
+        self.assertEqual((len(created), attached), (1, []))
+        again, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                          '2022-11-10')
+        self.assertEqual((again, attached), ([], created))
+        self.assertEqual(CollectionRun.objects.count(), 1)
+
+    def test_overlap(self):
+        """Запрос на пересекающийся период собирает только новые дни."""
+        runs.start_runs(self.user.pk, '2022-11-01', '2022-11-10')
+        created, attached = runs.start_runs(self.user.pk, '2022-11-05',
+                                            '2022-11-15')
+        self.assertEqual(len(attached), 1)
+        self.assertEqual(
+            [(str(run.date_from), str(run.date_to)) for run in created],
+            [('2022-11-11', '2022-11-15')]
+        )
+
+    def test_finished_and_stale(self):
+        """Запуски с другими флагами пишут те же дни, завершенные и
+        зависшие запуски не мешают."""
+        created, _ = runs.start_runs(self.user.pk, '2022-11-01',
+                                     '2022-11-10')
+        _, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                      '2022-11-10', force_refresh=True)
+        self.assertEqual(attached, created)
+        CollectionRun.objects.update(
+            created=timezone.now() - timedelta(days=1))
+        _, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                      '2022-11-10')
+        self.assertEqual(attached, created)
+        CollectionRun.objects.update(
+            updated=timezone.now() - timedelta(days=1))
+        stale, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                          '2022-11-10')
+        self.assertEqual((len(stale), attached), (1, []))
+        CollectionRun.objects.update(status=CollectionRun.DONE)
+        again, attached = runs.start_runs(self.user.pk, '2022-11-01',
+                                          '2022-11-10')
+        self.assertEqual((len(again), attached), (1, []))
+
+    @patch('dashboard.runs.monotonic', side_effect=[0, 0, 100])
+    def test_lock_owner(self, mock_monotonic):
+        """Блокировку снимает только тот, кто ее поставил."""
+        store = MemoryStore()
+        key = runs.RUN_LOCK_KEY.format(self.user.pk)
+        with patch('dashboard.runs.default_store', return_value=store):
+            with runs.run_lock(self.user.pk):
+                with runs.run_lock(self.user.pk):
+                    pass
+                self.assertIsNotNone(store.get(key))
+            self.assertIsNone(store.get(key))
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from unittest.mock import Mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core.store import MemoryStore
+from dashboard.models import (User, Source, Token, MY_TARGET, VK_ADS,
+                              YANDEX_DIRECT)
+from dashboard.tokens import TokenService
+
+
+class TokenServiceTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user1')
+        cls.sources = {name: Source.objects.create(name=name)
+                       for name in (YANDEX_DIRECT, MY_TARGET, VK_ADS)}
+
+    def make_token(self, source, expires_in, refresh_token='refresh'):
+        return Token.objects.create(
+            user=self.user, source=self.sources[source],
+            access_token='old', refresh_token=refresh_token,
+            expires_in=expires_in, expires_at=Token.expiry(expires_in)
+        )
+
+    def make_service(self):
+        service = TokenService(store=MemoryStore(), wait=Mock())
+        refresher = Mock(return_value={'access_token': 'new',
+                                       'refresh_token': 'new-refresh',
+                                       'expires_in': 86400})
+        service.REFRESHERS = {YANDEX_DIRECT: refresher,
+                              MY_TARGET: refresher}
+        return service, refresher
+
+    def test_refresh_expiring(self):
+        """Обновляются только истекающие токены с refresh_token."""
+        expiring = self.make_token(MY_TARGET, expires_in=60)
+        fresh = self.make_token(YANDEX_DIRECT, expires_in=86400)
+        vk = self.make_token(VK_ADS, expires_in=60, refresh_token=None)
+        service, refresher = self.make_service()
+        self.assertEqual(service.refresh_expiring(),
+                         {'refreshed': 1, 'failed': 0})
+        refresher.assert_called_once()
+        expiring.refresh_from_db()
+        self.assertEqual(expiring.access_token, 'new')
+        self.assertEqual(expiring.refresh_token, 'new-refresh')
+        self.assertGreater(expiring.expires_at,
+                           timezone.now() + timedelta(hours=23))
+        for token in (fresh, vk):
+            token.refresh_from_db()
+            self.assertEqual(token.access_token, 'old')
+
+    def test_single_flight(self):
+        """Пока блокировка занята, токен не обновляется повторно."""
+        token = self.make_token(MY_TARGET, expires_in=60)
+        service, refresher = self.make_service()
+        key = service.LOCK_KEY.format(token.pk)
+        service.get_store().add(key, 1, service.lock_timeout())
+        service.wait.side_effect = (
+            lambda seconds: service.get_store().delete(key))
+        self.assertEqual(service.refresh(token).access_token, 'old')
+        refresher.assert_not_called()
+        service.wait.assert_called_once()
+
+    def test_lock_outlives_request(self):
+        """Блокировка не истекает раньше таймаута запроса обновления."""
+        service, _ = self.make_service()
+        with self.settings(HTTP_TRANSPORT={'connect_timeout': 10,
+                                           'read_timeout': 300}):
+            self.assertGreater(service.lock_timeout(), 310)
+
+    def test_keeps_foreign_lock(self):
+        """Истекшая блокировка, взятая другим воркером, не удаляется."""
+        token = self.make_token(MY_TARGET, expires_in=60)
+        service, refresher = self.make_service()
+        key = service.LOCK_KEY.format(token.pk)
+        store = service.get_store()
+
+        def refresh(token):
+            # Пока шел запрос, блокировка истекла и ее взял другой воркер.
+            store.delete(key)
+            store.add(key, 'other', service.lock_timeout())
+            return {'access_token': 'new', 'expires_in': 86400}
+
+        refresher.side_effect = refresh
+        self.assertEqual(service.refresh(token).access_token, 'new')
+        self.assertEqual(store.get(key), 'other')
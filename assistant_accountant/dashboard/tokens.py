@@ -0,0 +1,151 @@
+from datetime import timedelta
+from time import monotonic, sleep
+from typing import Callable, Dict
+from uuid import uuid4
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import YANDEX_DIRECT, MY_TARGET, Token
+from core.store import default_store
+from core.transport import Transport
+from core.yandex import direct as yandex_direct
+from core.my_target import auth as my_target_auth
+
+
+def refresh_yandex_direct(token: Token) -> Dict:
+    return yandex_direct.refresh_token(
+        client_id=settings.YANDEX_DIRECT_CLIENT_ID,
+        client_secret=settings.YANDEX_DIRECT_CLIENT_SECRET,
+        refresh_token=token.refresh_token
+    )
+
+
+def refresh_my_target(token: Token) -> Dict:
+    return my_target_auth.RefreshToken(
+        client_id=settings.MY_TARGET_CLIENT_ID,
+        client_secret=settings.MY_TARGET_CLIENT_SECRET,
+        refresh_token=token.refresh_token
+    ).run()
+
+
+class TokenService:
+    """
+    Жизненный цикл токенов рекламных кабинетов.\n
+    Токен обновляется заранее, если до истечения (expires_at) осталось
+    меньше settings.TOKEN_REFRESH_MARGIN секунд. Обновление идет под
+    блокировкой в общем хранилище: токен обновляет один воркер, остальные
+    ждут снятия блокировки и перечитывают токен из БД. Блокировка живет
+    дольше таймаута HTTP-запроса обновления (settings.HTTP_TRANSPORT) и
+    снимается только тем воркером, который ее взял. Токены VK не
+    обновляются: у них нет refresh_token.
+    """
+    REFRESHERS: Dict[str, Callable[[Token], Dict]] = {
+        YANDEX_DIRECT: refresh_yandex_direct,
+        MY_TARGET: refresh_my_target,
+    }
+    LOCK_KEY = 'token_refresh_lock:{}'
+    # Запас к таймаутам HTTP-запроса обновления токена.
+    LOCK_TIMEOUT_MARGIN = 60
+    LOCK_POLL_INTERVAL = 0.5
+
+    def __init__(self, store=None, wait: Callable[[float], None] = sleep):
+        self.store = store
+        self.wait = wait
+
+    def get_store(self):
+        return self.store or default_store()
+
+    @staticmethod
+    def refresh_margin() -> timedelta:
+        return timedelta(seconds=settings.TOKEN_REFRESH_MARGIN)
+
+    def can_refresh(self, token: Token) -> bool:
+        return (token.source.name in self.REFRESHERS
+                and bool(token.refresh_token))
+
+    def expires_soon(self, token: Token) -> bool:
+        if token.expires_at is None:
+            return True
+        return token.expires_at <= timezone.now() + self.refresh_margin()
+
+    def needs_refresh(self, token: Token) -> bool:
+        return self.can_refresh(token) and self.expires_soon(token)
+
+    def lock_timeout(self) -> float:
+        """Время жизни блокировки: таймауты запроса обновления и запас."""
+        transport = settings.HTTP_TRANSPORT
+        return (transport.get('connect_timeout', Transport.CONNECT_TIMEOUT)
+                + transport.get('read_timeout', Transport.READ_TIMEOUT)
+                + self.LOCK_TIMEOUT_MARGIN)
+
+    def wait_for_lock(self, key: str) -> None:
+        """Ждет, пока другой воркер не снимет блокировку."""
+        deadline = monotonic() + self.lock_timeout()
+        while self.get_store().get(key) is not None:
+            if monotonic() >= deadline:
+                return
+            self.wait(self.LOCK_POLL_INTERVAL)
+
+    def refresh(self, token: Token, force: bool = False) -> Token:
+        """
+        Обновляет токен, если он скоро истекает, или всегда при force=True
+        (например, API уже ответило, что токен истек). Возвращает токен с
+        актуальными значениями из БД.
+        """
+        key = self.LOCK_KEY.format(token.pk)
+        owner = uuid4().hex
+        if not self.get_store().add(key, owner, self.lock_timeout()):
+            self.wait_for_lock(key)
+            token.refresh_from_db()
+            return token
+        try:
+            access_token = token.access_token
+            token.refresh_from_db()
+            # Пока ждали блокировку, токен мог обновить другой воркер.
+            updated = token.access_token != access_token
+            if updated or not (force or self.needs_refresh(token)):
+                return token
+            data = self.REFRESHERS[token.source.name](token)
+            token.access_token = data['access_token']
+            token.refresh_token = data.get('refresh_token',
+                                           token.refresh_token)
+            token.expires_in = data['expires_in']
+            token.expires_at = Token.expiry(data['expires_in'])
+            token.save(update_fields=['access_token', 'refresh_token',
+                                      'expires_in', 'expires_at'])
+            return token
+        finally:
+            # Блокировка могла истечь и достаться другому воркеру.
+            if self.get_store().get(key) == owner:
+                self.get_store().delete(key)
+
+    def ensure_fresh(self, token: Token) -> Token:
+        """Токен, обновленный заранее, если он скоро истекает."""
+        if self.needs_refresh(token):
+            return self.refresh(token)
+        return token
+
+    def refresh_expiring(self) -> Dict[str, int]:
+        """
+        Обновляет все токены, истекающие в пределах TOKEN_REFRESH_MARGIN.
+        Ошибка одного токена не мешает остальным.
+        """
+        tokens = Token.objects.filter(
+            source__name__in=list(self.REFRESHERS),
+            refresh_token__isnull=False
+        ).exclude(
+            expires_at__gt=timezone.now() + self.refresh_margin()
+        ).select_related('source')
+        result = {'refreshed': 0, 'failed': 0}
+        for token in tokens:
+            if not token.refresh_token:
+                continue
+            try:
+                self.refresh(token)
+            except Exception as error:
+                print(f'token {token.pk} refresh error: {error}')
+                result['failed'] += 1
+            else:
+                result['refreshed'] += 1
+        return result
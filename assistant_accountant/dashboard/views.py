@@ -54,6 +54,7 @@ def yandex_direct_callback(request):
             'access_token': data.get('access_token'),
             'refresh_token': data.get('refresh_token'),
             'expires_in': expires_in,
+            'expires_at': models.Token.expiry(expires_in),
             'source': source
         }
     )
@@ -77,6 +78,7 @@ def vk_callback(request):
             'user': request.user,
             'access_token': access_token,
             'expires_in': expires_in,
+            'expires_at': models.Token.expiry(expires_in),
             'source': source
 
         }
@@ -229,6 +231,7 @@ def my_target_auth(request):
             'access_token': access_token,
             'refresh_token': refresh_token,
             'expires_in': expires_in,
+            'expires_at': models.Token.expiry(expires_in),
             'source': source
         }
     )
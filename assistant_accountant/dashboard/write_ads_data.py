@@ -1,15 +1,35 @@
-from typing import Dict, List
+from datetime import date
+from typing import Dict, Iterable, List
 
 from django.db import transaction
 
 from .models import (AgencyClient, StatisticByAgencyClient, BalanceHistory,
-                     User, Source, VkAccount, VK_ADS)
+                     CollectionRun, RunCheckpoint, User, Source, VkAccount,
+                     VK_ADS)
+from .records import ClientRecord, DailyCost, from_minor
+from .report_cache import ReportCache
 
 
 class WriteDB:
+    """
+    Запись данных клиентов в БД. data - любой итерируемый источник записей,
+    в том числе поток ads.RecordStream. Записи - records.ClientRecord, суммы
+    в минимальных единицах переводятся в единицы валюты при записи. Записи
+    читаются по одной, каждая
+    пишется в своей транзакции и сразу видна в БД. Если передан run, в той
+    же транзакции пишется отметка RunCheckpoint клиента.
+    """
 
-    def __init__(self, data: List[Dict]):
+    def __init__(
+            self,
+            data: Iterable[ClientRecord],
+            run: CollectionRun = None
+    ):
         self.data = data
+        self.run = run
+        self.users: Dict[int, User] = {}
+        self.sources: Dict[str, Source] = {}
+        self.saved = 0
 
     def agency_clients(
             self,
@@ -37,18 +57,18 @@ class WriteDB:
             self,
             source: Source,
             agency_client: AgencyClient,
-            stats: List[Dict]
+            stats: List[DailyCost]
     ) -> None:
         for stat in stats:
             StatisticByAgencyClient.objects.update_or_create(
                 client=agency_client,
                 source=source,
-                date=stat['date'],
+                date=stat.date,
                 defaults={
                     'client': agency_client,
                     'source': source,
-                    'cost': stat['cost'],
-                    'date': stat['date']
+                    'cost': from_minor(stat.cost),
+                    'date': stat.date
                 }
             )
 
@@ -57,7 +77,7 @@ class WriteDB:
             agency_client: AgencyClient,
             source: Source,
             amount: float,
-            date: str
+            date: date
     ) -> None:
         BalanceHistory.objects.update_or_create(
             client=agency_client,
@@ -83,22 +103,40 @@ class WriteDB:
         )
         return account
 
+    def get_user(self, user_id: int) -> User:
+        if user_id not in self.users:
+            self.users[user_id] = User.objects.get(pk=user_id)
+        return self.users[user_id]
+
+    def get_source(self, name: str) -> Source:
+        if name not in self.sources:
+            self.sources[name] = Source.objects.get(name=name)
+        return self.sources[name]
+
     def save(self) -> None:
+        for record in self.data:
+            self.save_record(record)
+            self.saved += 1
+
+    def save_record(self, record: ClientRecord) -> None:
         with transaction.atomic():
-            for raw in self.data:
-                user = User.objects.get(pk=raw['user_id'])
-                source = Source.objects.get(name=raw['source'])
-                vk_account = None
-                if source.name == VK_ADS:
-                    account_id = raw['account_id']
-                    vk_account = self.vk_account(user, account_id)
-                client_id = raw['client_id']
-                name = raw['name']
-                stats = raw['stats']
-                amount = raw['balance']['amount']
-                date = raw['balance']['date']
-                agency_client = self.agency_clients(
-                    user, source, client_id, name, vk_account
-                )
-                self.statistic_by_agency_client(source, agency_client, stats)
-                self.balance_history(agency_client, source, amount, date)
+            user = self.get_user(record.user_id)
+            source = self.get_source(record.source)
+            vk_account = None
+            if source.name == VK_ADS:
+                vk_account = self.vk_account(user, record.account_id)
+            agency_client = self.agency_clients(
+                user, source, record.client_id, record.name, vk_account
+            )
+            self.statistic_by_agency_client(source, agency_client,
+                                            record.stats)
+            self.balance_history(agency_client, source,
+                                 from_minor(record.balance.amount),
+                                 record.balance.date)
+            if record.stats_period:
+                ReportCache.mark_covered(agency_client,
+                                         *record.stats_period)
+            if self.run is not None:
+                RunCheckpoint.objects.get_or_create(
+                    run=self.run, source=source,
+                    client_id=record.client_id)